@@ -1,25 +1,107 @@
 # ---------- 1.  IMPORTS  ----------
-from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, send_from_directory
+from flask import Flask, render_template, request, redirect, url_for, flash, session, jsonify, send_from_directory, send_file, g, Response, abort, has_request_context, has_app_context
+from flask.sessions import SessionInterface, SessionMixin
+from flask.json.tag import TaggedJSONSerializer
+from jinja2 import FileSystemBytecodeCache
+from werkzeug.datastructures import CallbackDict
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session as FlaskSession
 from werkzeug.security import generate_password_hash, check_password_hash
 from werkzeug.utils import secure_filename
-from datetime import datetime, timedelta
-from sqlalchemy import inspect, func, text
-from functools import wraps
-import re, os, urllib.parse
+from datetime import datetime, timedelta, date as date_type
+from array import array
+from sqlalchemy import inspect, func, text, event, create_engine, case, bindparam
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session as OrmSession
+from functools import wraps, lru_cache
+import re, os, io, urllib.parse, json, time, threading, pathlib, click, gzip, base64, secrets, sqlite3, shutil, zipfile, hashlib
+from concurrent.futures import ProcessPoolExecutor
+from bisect import bisect_left
+from collections import Counter, OrderedDict
+from pdf_writer import PdfDocument, TrueTypeFont
+try:
+    import brotli
+except ImportError:  # brotli اختياري، ويُستخدم gzip عند غيابه
+    brotli = None
 
 # ---------- 2.  FLASK INIT  ----------
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'your-secret-key-here'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///quran_center.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///quran_center.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'connect_args': {'uri': True}}  # لإرفاق ملفات الأرشيف للقراءة فقط
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['MAX_CONTENT_LENGTH'] = 2 * 1024 * 1024  # 2MB
+app.config['METRICS_DIR'] = os.environ.get('METRICS_DIR', os.path.join(app.instance_path, 'metrics'))
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')
+app.config['SESSION_BACKEND'] = os.environ.get('SESSION_BACKEND', 'sqlite')  # sqlite | memory | cookie
+app.config['SESSION_DB'] = os.environ.get('SESSION_DB', os.path.join(app.instance_path, 'sessions.db'))
+app.config['TENANTS_DIR'] = os.environ.get('TENANTS_DIR', os.path.join(app.instance_path, 'tenants'))
+app.config['TENANT_DOMAIN'] = os.environ.get('TENANT_DOMAIN')  # مثال: centers.example.com فيصبح hafs.centers.example.com مركزاً
+app.config['TENANT_ENGINE_LIMIT'] = int(os.environ.get('TENANT_ENGINE_LIMIT', 16))
+app.config['TEMPLATE_CACHE_DIR'] = os.environ.get('TEMPLATE_CACHE_DIR', os.path.join(app.instance_path, 'jinja_cache'))
+app.config['REPORT_CARD_FONT'] = os.environ.get('REPORT_CARD_FONT')  # خط TrueType يدعم العربية لبطاقات PDF
+app.config['MAINTENANCE_INTERVAL_HOURS'] = float(os.environ.get('MAINTENANCE_INTERVAL_HOURS', 0))  # 0 = من سطر الأوامر فقط
 if not os.path.exists(app.config['UPLOAD_FOLDER']):
     os.makedirs(app.config['UPLOAD_FOLDER'])
-db = SQLAlchemy(app)
+# حفظ القوالب المترجمة على القرص لتشاركها العمليات ولا تُعاد ترجمتها بعد كل تشغيل
+os.makedirs(app.config['TEMPLATE_CACHE_DIR'], exist_ok=True)
+app.jinja_options = {**app.jinja_options, 'bytecode_cache': FileSystemBytecodeCache(app.config['TEMPLATE_CACHE_DIR'])}
+# ---- تعدد المراكز: لكل مركز ملف SQLite مستقل، ومحركات الاتصال محدودة العدد (الأقل استخداماً يُغلق) ----
+TENANT_SLUG_PATTERN = re.compile(r'^[a-z0-9][a-z0-9-]{1,31}$')
+
+def current_tenant():
+    if has_app_context():
+        if 'tenant' in g:
+            return g.tenant
+        if has_request_context():
+            return None
+    return os.environ.get('QURAN_TENANT') or None
+
+def tenant_database_path(slug):
+    return os.path.join(app.config['TENANTS_DIR'], slug, 'quran_center.db')
+
+class TenantEngines:
+    def __init__(self, limit):
+        self.limit = limit
+        self.lock = threading.Lock()
+        self.engines = OrderedDict()
+
+    def get(self, slug):
+        with self.lock:
+            engine = self.engines.get(slug)
+            if engine is not None:
+                self.engines.move_to_end(slug)
+                return engine
+            engine = create_engine('sqlite:///' + tenant_database_path(slug), **app.config['SQLALCHEMY_ENGINE_OPTIONS'])
+            self.engines[slug] = engine
+            while len(self.engines) > self.limit:
+                self.engines.popitem(last=False)[1].dispose()
+            return engine
+
+tenant_engines = TenantEngines(app.config['TENANT_ENGINE_LIMIT'])
+
+class TenantSession(FlaskSession):
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        tenant = current_tenant() if bind is None else None
+        if tenant:
+            return tenant_engines.get(tenant)
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+db = SQLAlchemy(app, session_options={'class_': TenantSession})
 
 # ---------- 3.  MODELS  ----------
+ACADEMIC_YEAR_START_MONTH = 9  # تبدأ السنة الدراسية في سبتمبر
+
+def academic_year_for(day):
+    return str(day.year if day.month >= ACADEMIC_YEAR_START_MONTH else day.year - 1)
+
+def row_academic_year(context):
+    # السنة الدراسية للسجل تُشتق من تاريخه إن وُجد، وإلا فمن تاريخ اليوم
+    day = context.get_current_parameters().get('date') if context is not None else None
+    return academic_year_for(day or datetime.now().date())
+
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
@@ -41,7 +123,7 @@ class Circle(db.Model):
     teacher_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     teacher_name = db.Column(db.String(100))
     is_active = db.Column(db.Boolean, default=True)
-    academic_year = db.Column(db.String(10), default='2025')
+    academic_year = db.Column(db.String(10), default=row_academic_year)
     requires_approval = db.Column(db.Boolean, default=True)
     teacher = db.relationship('User', backref='circles')
 
@@ -55,7 +137,7 @@ class Student(db.Model):
     circle_id = db.Column(db.Integer, db.ForeignKey('circle.id'))
     is_active = db.Column(db.Boolean, default=True)
     photo = db.Column(db.String(200))
-    academic_year = db.Column(db.String(10), default='2025')
+    academic_year = db.Column(db.String(10), default=row_academic_year)
     pending_approval = db.Column(db.Boolean, default=True)
     circle = db.relationship('Circle', backref='students')
     parent = db.relationship('Parent', backref='students')
@@ -72,10 +154,14 @@ class Report(db.Model):
     grade = db.Column(db.String(10), nullable=False)
     type = db.Column(db.String(10), default='حفظ')
     notes = db.Column(db.Text)
-    academic_year = db.Column(db.String(10), default='2025')
+    academic_year = db.Column(db.String(10), default=row_academic_year)
     student = db.relationship('Student', backref='reports')
     teacher = db.relationship('User', backref='reports')
     circle = db.relationship('Circle', backref='reports')
+    __table_args__ = (
+        db.Index('idx_report_year_date', 'academic_year', 'date'),
+        db.Index('idx_report_year_student_date', 'academic_year', 'student_id', 'date'),
+    )
 
 class Attendance(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -83,8 +169,12 @@ class Attendance(db.Model):
     date = db.Column(db.Date, nullable=False)
     status = db.Column(db.String(20), default='حاضر')
     notes = db.Column(db.Text)
-    academic_year = db.Column(db.String(10), default='2025')
+    academic_year = db.Column(db.String(10), default=row_academic_year)
     student = db.relationship('Student', backref='attendances')
+    __table_args__ = (
+        db.Index('idx_attendance_year_date', 'academic_year', 'date'),
+        db.Index('idx_attendance_year_student_date', 'academic_year', 'student_id', 'date'),
+    )
 
 class Holiday(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -93,8 +183,9 @@ class Holiday(db.Model):
     has_attendance = db.Column(db.Boolean, default=False)
     is_recurring = db.Column(db.Boolean, default=False)
     teacher_id = db.Column(db.Integer, db.ForeignKey('user.id'))
-    academic_year = db.Column(db.String(10), default='2025')
+    academic_year = db.Column(db.String(10), default=row_academic_year)
     teacher = db.relationship('User', backref='holidays')
+    __table_args__ = (db.Index('idx_holiday_year', 'academic_year'),)
 
 class Settings(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -109,9 +200,11 @@ class Settings(db.Model):
     secondary_color = db.Column(db.String(7), default='#28a745')
     background_color = db.Column(db.String(7), default='#f8f9fa')
     text_color = db.Column(db.String(7), default='#2c3e50')
-    whatsapp_message_template = db.Column(db.Text, default='تقرير {report_type} للتسميع\n\nالطالب: {student_name}\nالحلقة: {circle_name}\nالمعلم: {teacher_name}\nالفترة: من {start_date} إلى {end_date}\n\nالتسميع:\n{reports_details}\n\nإحصائيات الحضور:\n{attendance_stats}\n\n{site_name}')
-    support_bank_accounts = db.Column(db.Text, default='بنك الكريمي: 123456789\nبنك الشرق: 987654321\nبنك التضامن: 456789123')
-    support_message = db.Column(db.Text, default='نورٌ نُهديه وجيل نربيه')
+    # النصوص الطويلة لا تحتاجها إلا صفحات الإعدادات والدعم والواتساب، فتُحمَّل معاً عند أول وصول؛
+    # active_history تحمّل القيمة القديمة قبل الإسناد حتى يسجّل سجل التغييرات الفرق الحقيقي
+    whatsapp_message_template = db.deferred(db.Column(db.Text, default='تقرير {report_type} للتسميع\n\nالطالب: {student_name}\nالحلقة: {circle_name}\nالمعلم: {teacher_name}\nالفترة: من {start_date} إلى {end_date}\n\nالتسميع:\n{reports_details}\n\nإحصائيات الحضور:\n{attendance_stats}\n\n{site_name}'), group='settings_text', active_history=True)
+    support_bank_accounts = db.deferred(db.Column(db.Text, default='بنك الكريمي: 123456789\nبنك الشرق: 987654321\nبنك التضامن: 456789123'), group='settings_text', active_history=True)
+    support_message = db.deferred(db.Column(db.Text, default='نورٌ نُهديه وجيل نربيه'), group='settings_text', active_history=True)
     dark_mode_enabled = db.Column(db.Boolean, default=False)
     teacher_requires_approval = db.Column(db.Boolean, default=True)
     allow_custom_teacher_name = db.Column(db.Boolean, default=True)
@@ -123,7 +216,118 @@ class Notification(db.Model):
     message = db.Column(db.Text, nullable=False)
     is_read = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.now)
+    digest_key = db.Column(db.String(100))
+    digest_count = db.Column(db.Integer, default=1)
     user = db.relationship('User', backref='notifications')
+    __table_args__ = (
+        db.Index('idx_notification_user_read', 'user_id', 'is_read'),
+        db.Index('idx_notification_digest', 'digest_key'),
+    )
+
+class MemorizationProgress(db.Model):
+    # تغطية الحفظ لكل طالب: خريطة بتات لآيات المصحف (6236 آية) مع أعداد محسوبة مسبقاً
+    id = db.Column(db.Integer, primary_key=True)
+    student_id = db.Column(db.Integer, db.ForeignKey('student.id'), nullable=False, unique=True)
+    verses_bitmap = db.Column(db.LargeBinary)
+    memorized_verses = db.Column(db.Integer, default=0)
+    completed_juz_mask = db.Column(db.Integer, default=0)
+    completed_juz = db.Column(db.Integer, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+    student = db.relationship('Student', backref=db.backref('memorization', uselist=False))
+
+    @property
+    def memorized_percent(self):
+        return round((self.memorized_verses or 0) * 100 / TOTAL_VERSES, 2)
+
+class StudentScore(db.Model):
+    # ملخص ترتيب الطالب لكل سنة دراسية بأعمدة مفهرسة للفرز
+    id = db.Column(db.Integer, primary_key=True)
+    student_id = db.Column(db.Integer, db.ForeignKey('student.id'), nullable=False)
+    circle_id = db.Column(db.Integer, db.ForeignKey('circle.id'))
+    academic_year = db.Column(db.String(10), nullable=False)
+    memorized_verses = db.Column(db.Integer, default=0)
+    grade_points = db.Column(db.Integer, default=0)
+    graded_reports = db.Column(db.Integer, default=0)
+    grade_average = db.Column(db.Float, default=0)
+    present_days = db.Column(db.Integer, default=0)
+    attendance_days = db.Column(db.Integer, default=0)
+    attendance_rate = db.Column(db.Float, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+    student = db.relationship('Student')
+    __table_args__ = (
+        db.UniqueConstraint('student_id', 'academic_year', name='uq_student_score_year'),
+        db.Index('idx_score_circle_verses', 'academic_year', 'circle_id', 'memorized_verses'),
+        db.Index('idx_score_circle_attendance', 'academic_year', 'circle_id', 'attendance_rate'),
+        db.Index('idx_score_circle_grade', 'academic_year', 'circle_id', 'grade_average'),
+        db.Index('idx_score_verses', 'academic_year', 'memorized_verses'),
+        db.Index('idx_score_attendance', 'academic_year', 'attendance_rate'),
+        db.Index('idx_score_grade', 'academic_year', 'grade_average'),
+    )
+
+class SyncChange(db.Model):
+    # سجل تغييرات التقارير والحضور بتسلسل متزايد يُستخدم مؤشراً للمزامنة
+    id = db.Column(db.Integer, primary_key=True)
+    entity = db.Column(db.String(20), nullable=False)
+    entity_id = db.Column(db.Integer, nullable=False)
+    student_id = db.Column(db.Integer, nullable=False)
+    action = db.Column(db.String(10), nullable=False)
+    changed_at = db.Column(db.DateTime, default=datetime.now)
+    __table_args__ = (db.Index('idx_sync_change_entity', 'entity', 'entity_id'),)
+
+class SyncOperation(db.Model):
+    # العمليات المستلمة من الأجهزة بمعرّفها الذي ولّده العميل لضمان عدم تكرار التطبيق
+    id = db.Column(db.Integer, primary_key=True)
+    op_id = db.Column(db.String(64), nullable=False, unique=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    entity = db.Column(db.String(20), nullable=False)
+    entity_id = db.Column(db.Integer)
+    status = db.Column(db.String(10), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.now)
+
+class AuditLog(db.Model):
+    # سجل تغييرات للإضافة فقط؛ المعرّف المتزايد هو مؤشر التصفح
+    id = db.Column(db.Integer, primary_key=True)
+    changed_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    user_id = db.Column(db.Integer)
+    entity = db.Column(db.String(20), nullable=False)
+    entity_id = db.Column(db.Integer, nullable=False)
+    action = db.Column(db.String(10), nullable=False)
+    changes = db.Column(db.Text)
+    __table_args__ = (db.Index('idx_audit_log_entity', 'entity', 'entity_id'), {'sqlite_autoincrement': True})
+
+class StudentRisk(db.Model):
+    # آخر درجة خطر للطالب وأسبابها؛ flagged_at وقت أول تصنيف في الفترة الحالية
+    id = db.Column(db.Integer, primary_key=True)
+    student_id = db.Column(db.Integer, db.ForeignKey('student.id'), nullable=False, unique=True)
+    circle_id = db.Column(db.Integer, db.ForeignKey('circle.id'))
+    score = db.Column(db.Integer, default=0)
+    recent_absences = db.Column(db.Integer, default=0)
+    last_report_date = db.Column(db.Date)
+    reasons = db.Column(db.String(300))
+    flagged = db.Column(db.Boolean, default=False)
+    flagged_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime, default=datetime.now)
+    __table_args__ = (db.Index('idx_student_risk_circle', 'circle_id', 'flagged'),)
+
+class JobState(db.Model):
+    # مؤشر آخر تشغيل للمهام الخلفية (آخر تسلسل معالَج من sync_change وتاريخ آخر تشغيل كامل)
+    name = db.Column(db.String(50), primary_key=True)
+    cursor = db.Column(db.Integer, default=0)
+    run_date = db.Column(db.Date)
+    updated_at = db.Column(db.DateTime, default=datetime.now)
+
+class CircleDailyStats(db.Model):
+    # ملخص يومي لكل حلقة يُحدَّث عند الكتابة ليقرأ منه لوحة المعلم دون حساب
+    id = db.Column(db.Integer, primary_key=True)
+    circle_id = db.Column(db.Integer, db.ForeignKey('circle.id'), nullable=False)
+    date = db.Column(db.Date, nullable=False)
+    attendance_marked = db.Column(db.Integer, default=0)
+    present_count = db.Column(db.Integer, default=0)
+    reports_count = db.Column(db.Integer, default=0)
+    reported_students = db.Column(db.Integer, default=0)
+    verses_count = db.Column(db.Integer, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+    __table_args__ = (db.UniqueConstraint('circle_id', 'date', name='uq_circle_daily_stats'),)
 
 # ---------- 4.  CONTEXT PROCESSOR  ----------
 @app.context_processor
@@ -131,15 +335,17 @@ def inject_globals():
     settings = Settings.query.first() or Settings()
     current_year = datetime.now().year
     unread_notifications = 0
-    if 'user_id' in session and session.get('role') == 'parent':
-        parent = Parent.query.filter_by(name=session['name']).first()
-        if parent and parent.user_id:
-            unread_notifications = Notification.query.filter_by(user_id=parent.user_id, is_read=False).count()
+    user = current_user()
+    if user and user.is_parent and user.parent_id:
+        unread_notifications = Notification.query.filter_by(user_id=user.id, is_read=False).count()
+    academic_years = academic_year_options() if user and user.is_admin else []
     return dict(
         datetime=datetime, now=datetime.now, timedelta=timedelta,
         settings=settings, Report=Report, Attendance=Attendance,
         Holiday=Holiday, Parent=Parent, current_year=current_year,
-        unread_notifications=unread_notifications
+        unread_notifications=unread_notifications,
+        academic_year=selected_academic_year(), academic_years=academic_years,
+        current_user=user
     )
 
 # ---------- 5.  HELPERS  ----------
@@ -147,10 +353,96 @@ ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+class CurrentUser:
+    # هوية المستخدم الحالي وصلاحياته: الدور، وولي الأمر المرتبط، وحلقات المعلم
+    __slots__ = ('id', 'username', 'name', 'role', 'parent_id', 'circle_ids')
+
+    def __init__(self, id, username, name, role, parent_id=None, circle_ids=()):
+        self.id = id
+        self.username = username
+        self.name = name
+        self.role = role
+        self.parent_id = parent_id
+        self.circle_ids = circle_ids
+
+    @property
+    def is_admin(self):
+        return self.role == 'admin'
+
+    @property
+    def is_teacher(self):
+        return self.role == 'teacher'
+
+    @property
+    def is_parent(self):
+        return self.role == 'parent'
+
+class PrincipalCache:
+    """تحميل هوية المستخدم مرة واحدة لكل معرّف مع مدة صلاحية قصيرة، ورفض الحسابات الموقوفة"""
+    CACHE_SECONDS = 60  # أقصى مدة يبقى فيها الحساب الموقوف أو الصلاحية المسحوبة نافذاً في عملية أخرى
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.principals = {}
+
+    def get(self, user_id):
+        key = (current_tenant(), user_id)
+        cached = self.principals.get(key)
+        if cached and time.monotonic() - cached[1] < self.CACHE_SECONDS:
+            record_cache_lookup('principal', True)
+            return cached[0]
+        record_cache_lookup('principal', False)
+        principal = self.load(user_id)
+        with self.lock:
+            self.principals[key] = (principal, time.monotonic())
+        return principal
+
+    def load(self, user_id):
+        user = User.query.filter_by(id=user_id, is_active=True).first()
+        if not user:
+            return None
+        parent_id = None
+        if user.role == 'parent':
+            parent_id = db.session.query(Parent.id).filter(
+                (Parent.user_id == user.id) | ((Parent.user_id.is_(None)) & (Parent.name == user.name))
+            ).order_by(Parent.user_id.is_(None)).limit(1).scalar()
+        circle_ids = ()
+        if user.role == 'teacher':
+            circle_ids = tuple(circle_id for (circle_id,) in db.session.query(Circle.id).filter_by(teacher_id=user.id, is_active=True))
+        return CurrentUser(user.id, user.username, user.name, user.role, parent_id, circle_ids)
+
+    def invalidate(self, user_id=None):
+        with self.lock:
+            if user_id is None:
+                self.principals.clear()
+            else:
+                self.principals.pop((current_tenant(), user_id), None)
+
+principals = PrincipalCache()
+
+def current_user():
+    if 'current_user' not in g:
+        # الجلسة مرتبطة بالمركز الذي سُجّل الدخول فيه
+        logged_in = 'user_id' in session and session.get('tenant') == current_tenant()
+        g.current_user = principals.get(session['user_id']) if logged_in else None
+        if g.current_user is None and logged_in:
+            # حساب موقوف أو محذوف: إنهاء الجلسة فوراً
+            session.clear()
+    return g.current_user
+
+def login_user(user):
+    session['user_id'] = user.id
+    session['username'] = user.username
+    session['role'] = user.role
+    session['name'] = user.name
+    session['tenant'] = current_tenant()
+    principals.invalidate(user.id)
+    g.pop('current_user', None)
+
 def require_login(f):
     @wraps(f)
     def decorated(*args, **kwargs):
-        if 'user_id' not in session:
+        if current_user() is None:
             flash('يجب تسجيل الدخول أولاً', 'error')
             return redirect(url_for('login'))
         return f(*args, **kwargs)
@@ -160,13 +452,90 @@ def require_role(role):
     def decorator(f):
         @wraps(f)
         def decorated(*args, **kwargs):
-            if session.get('role') != role:
+            user = current_user()
+            if user is None or user.role != role:
                 flash('ليس لديك صلاحية للوصول إلى هذه الصفحة', 'error')
                 return redirect(url_for('dashboard'))
             return f(*args, **kwargs)
         return decorated
     return decorator
 
+# ---- طبقة الاستعلام حسب السنة الدراسية ----
+# التقارير والحضور تُقيَّد بالسنة المختارة، والسنوات المغلقة المؤرشفة تُقرأ من ملفها المستقل
+YEAR_ARCHIVED_MODELS = (Report, Attendance)
+
+def selected_academic_year():
+    if has_request_context() and session.get('academic_year'):
+        return session['academic_year']
+    return academic_year_for(datetime.now().date())
+
+def tenant_data_dir():
+    tenant = current_tenant()
+    return os.path.dirname(tenant_database_path(tenant)) if tenant else app.instance_path
+
+def upload_folder():
+    tenant = current_tenant()
+    folder = os.path.join(app.config['UPLOAD_FOLDER'], tenant) if tenant else app.config['UPLOAD_FOLDER']
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+def archive_path(year):
+    return os.path.join(tenant_data_dir(), f'archive_{year}.db')
+
+def archived_years():
+    directory = tenant_data_dir()
+    if not os.path.isdir(directory):
+        return []
+    return sorted(name[8:12] for name in os.listdir(directory) if re.fullmatch(r'archive_\d{4}\.db', name))
+
+def attach_archive(year):
+    # يُرفق ملف الأرشيف بالاتصال الحالي عند الحاجة فقط، فيبقى صحيحاً مع تعدد العمليات
+    if not re.fullmatch(r'\d{4}', str(year)):
+        # اسم القاعدة المرفقة يُبنى بتنسيق النص فلا يُقبل غير سنة
+        raise ValueError(f'invalid academic year: {year!r}')
+    connection = db.session.connection()
+    schema = f'archive_{year}'
+    attached = {row[1] for row in connection.exec_driver_sql('PRAGMA database_list')}
+    if schema not in attached:
+        uri = pathlib.Path(archive_path(year)).absolute().as_uri() + '?mode=ro'
+        connection.exec_driver_sql(f'ATTACH DATABASE ? AS {schema}', (uri,))
+    return schema
+
+def year_query(model, year=None):
+    """استعلام مقيد بالسنة الدراسية (المختارة افتراضياً).
+    استعلامات السنوات المؤرشفة تُوجَّه إلى الملف المرفق، لذا لا تُربط بجداول أخرى (join)."""
+    year = year or selected_academic_year()
+    query = model.query
+    if model in YEAR_ARCHIVED_MODELS and os.path.exists(archive_path(year)):
+        schema = attach_archive(year)
+        query = query.execution_options(schema_translate_map={None: schema})
+    return query.filter(model.academic_year == year)
+
+# ---- أعمدة صفحات القوائم ----
+# قائمة التقارير تجلب الأعمدة التي تعرضها فقط؛ الملاحظات تُحمَّل عند الحاجة.
+# صفوف الطلاب والحضور قصيرة فيكلّف load_only فيها أكثر مما يوفّر (benchmarks/bench_list_columns.py)
+REPORT_LIST_COLUMNS = (Report.id, Report.student_id, Report.teacher_id, Report.circle_id, Report.date,
+                       Report.surah, Report.from_verse, Report.to_verse, Report.grade, Report.type)
+
+def report_list_query(year=None):
+    query = year_query(Report, year).options(db.load_only(*REPORT_LIST_COLUMNS))
+    if query.get_execution_options().get('schema_translate_map'):
+        return query
+    # أسماء الطالب والمعلم والحلقة بدفعة واحدة لكل علاقة بدل استعلام لكل تقرير
+    return query.options(db.selectinload(Report.student).load_only(Student.name),
+                         db.selectinload(Report.teacher).load_only(User.name),
+                         db.selectinload(Report.circle).load_only(Circle.name))
+
+def academic_year_options():
+    # أقدم سنة تُعرف من الفهارس التي تبدأ بالسنة الدراسية (بحث لوغاريتمي لا مسح للجدول)
+    current = int(academic_year_for(datetime.now().date()))
+    years = [current] + [int(y) for y in archived_years()]
+    for model in YEAR_ARCHIVED_MODELS:
+        oldest = db.session.query(func.min(model.academic_year)).scalar()
+        if oldest and oldest.isdigit():
+            years.append(int(oldest))
+    return [str(y) for y in range(current, min(years) - 1, -1)]
+
 def create_parent_username(full_name):
     # استخدام مسافات بدلاً من الشرطة السفلية
     username = full_name.strip().replace(' ', ' ')
@@ -221,11 +590,9 @@ def get_or_create_parent(student_name, parent_phone):
         return None
 
 def find_student_by_name(name, circle_id):
-    name_clean = re.sub(r'[^\w\s]', '', name).strip().lower()
-    students = Student.query.filter_by(circle_id=circle_id, is_active=True).all()
-    for student in students:
-        student_name_clean = re.sub(r'[^\w\s]', '', student.name).strip().lower()
-        if student_name_clean == name_clean or name_clean in student_name_clean or student_name_clean in name_clean:
+    name_clean = roster_match_name(name)
+    for student in rosters.circle(circle_id):
+        if student.match_name == name_clean or name_clean in student.match_name or student.match_name in name_clean:
             return student
     return None
 
@@ -274,13 +641,87 @@ def improved_parse_collective_report(text, circle_id, date):
                         reports.append({'student_id': student.id, 'surah': surah, 'from_verse': from_verse, 'to_verse': to_verse, 'type': report_type, 'grade': grade})
     return reports, attendances
 
+# ---- تقويم أيام الدوام ----
+# لكل سنة دراسية خريطة بايتات (يوم لكل بايت) لأيام الدوام بعد استبعاد الجمع والعطل الفردية والمتكررة
+# التي لا حضور فيها، مع مجاميع تراكمية لعدّ أيام الدوام في أي فترة دون المرور على أيامها.
+class WorkingDaysIndex:
+    __slots__ = ('first_ordinal', 'bitmap', 'prefix')
+
+    def __init__(self, first_day, last_day, holiday_ordinals, recurring_days):
+        self.first_ordinal = first_day.toordinal()
+        size = last_day.toordinal() - self.first_ordinal + 1
+        self.bitmap = bytearray(size)
+        self.prefix = array('I', [0]) * (size + 1)
+        for offset in range(size):
+            day = date_type.fromordinal(self.first_ordinal + offset)
+            working = (day.weekday() != 4 and self.first_ordinal + offset not in holiday_ordinals
+                       and (day.month, day.day) not in recurring_days)
+            self.bitmap[offset] = working
+            self.prefix[offset + 1] = self.prefix[offset] + working
+
+    def contains(self, day):
+        offset = day.toordinal() - self.first_ordinal
+        return 0 <= offset < len(self.bitmap)
+
+class AttendanceCalendar:
+    CACHE_SECONDS = 300  # لتحديث العمليات الأخرى بعد إضافة أو حذف عطلة
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.indexes = {}
+
+    def index_for(self, year):
+        key = (current_tenant(), year)
+        cached = self.indexes.get(key)
+        if cached and time.monotonic() - cached[1] < self.CACHE_SECONDS:
+            record_cache_lookup('attendance_calendar', True)
+            return cached[0]
+        record_cache_lookup('attendance_calendar', False)
+        first_day = date_type(int(year), ACADEMIC_YEAR_START_MONTH, 1)
+        last_day = date_type(int(year) + 1, ACADEMIC_YEAR_START_MONTH, 1) - timedelta(days=1)
+        holidays = Holiday.query.filter(Holiday.has_attendance.isnot(True),
+                                        (Holiday.is_recurring.is_(True)) | ((Holiday.date >= first_day) & (Holiday.date <= last_day))).all()
+        holiday_ordinals = {h.date.toordinal() for h in holidays if not h.is_recurring}
+        recurring_days = {(h.date.month, h.date.day) for h in holidays if h.is_recurring}
+        index = WorkingDaysIndex(first_day, last_day, holiday_ordinals, recurring_days)
+        with self.lock:
+            self.indexes[key] = (index, time.monotonic())
+        return index
+
+    def is_working_day(self, day):
+        index = self.index_for(academic_year_for(day))
+        return bool(index.bitmap[day.toordinal() - index.first_ordinal])
+
+    def count_working_days(self, start_date, end_date):
+        total = 0
+        day = start_date
+        while day <= end_date:
+            index = self.index_for(academic_year_for(day))
+            first = day.toordinal() - index.first_ordinal
+            last = min(end_date.toordinal() - index.first_ordinal, len(index.bitmap) - 1)
+            total += index.prefix[last + 1] - index.prefix[first]
+            day = date_type.fromordinal(index.first_ordinal + last + 1)
+        return total
+
+    def invalidate(self):
+        with self.lock:
+            self.indexes.clear()
+
+attendance_calendar = AttendanceCalendar()
+
 def get_attendance_stats(student_id, start_date, end_date):
     attendances = Attendance.query.filter(Attendance.student_id == student_id, Attendance.date >= start_date, Attendance.date <= end_date).all()
-    valid_attendances = [att for att in attendances if att.date.weekday() != 4]
+    valid_attendances = [att for att in attendances if attendance_calendar.is_working_day(att.date)]
     stats = {'حاضر': 0, 'غائب بعذر': 0, 'غائب بلا عذر': 0, 'هروب': 0, 'لم يسمع': 0, 'إجمالي الأيام': len(valid_attendances), 'نسبة الحضور': 0}
     for attendance in valid_attendances:
         if attendance.status in stats:
             stats[attendance.status] += 1
+    if valid_attendances:
+        # المقام أيام الدوام من فهرس التقويم، فيوم الدوام غير المسجل يُحسب غياباً. تبدأ الأيام من أول
+        # تسجيل للطالب في الفترة حتى لا يُحسب ما قبل التحاقه، ولا تتجاوز اليوم
+        first_day = min(att.date for att in valid_attendances)
+        last_day = min(end_date, datetime.now().date())
+        stats['إجمالي الأيام'] = max(attendance_calendar.count_working_days(first_day, last_day), len(valid_attendances))
     if stats['إجمالي الأيام'] > 0:
         stats['نسبة الحضور'] = round((stats['حاضر'] / stats['إجمالي الأيام']) * 100, 2)
     return stats
@@ -306,15 +747,19 @@ def get_student_stats(student_id):
     start_date_monthly = end_date - timedelta(days=30)
     monthly_reports = Report.query.filter(Report.student_id == student_id, Report.date >= start_date_monthly, Report.date <= end_date).all()
     monthly_attendance = get_attendance_stats(student_id, start_date_monthly, end_date)
-    total_reports = Report.query.filter_by(student_id=student_id).count()
+    total_reports = year_query(Report).filter_by(student_id=student_id).count()
     total_verses = sum(report.to_verse - report.from_verse + 1 for report in monthly_reports)
+    progress = MemorizationProgress.query.filter_by(student_id=student_id).first()
     return {
         'student': student,
         'monthly_reports': len(monthly_reports),
         'monthly_attendance': monthly_attendance,
         'total_reports': total_reports,
         'total_verses': total_verses,
-        'attendance_rate': monthly_attendance['نسبة الحضور']
+        'attendance_rate': monthly_attendance['نسبة الحضور'],
+        'memorized_verses': progress.memorized_verses if progress else 0,
+        'memorized_percent': progress.memorized_percent if progress else 0,
+        'completed_juz': progress.completed_juz if progress else 0
     }
 
 def create_whatsapp_message(student, reports, report_type, start_date, end_date, teacher_name):
@@ -363,15 +808,24 @@ def send_bulk_reports(circle_id, report_type):
     else:
         end_date = datetime.now().date()
         start_date = end_date - timedelta(days=30)
-    for student in students:
-        if student.parent_phone:
-            reports = Report.query.filter(Report.student_id == student.id, Report.date >= start_date, Report.date <= end_date).all()
-            teacher_name = circle.teacher.name if circle.teacher else circle.teacher_name
-            whatsapp_url = create_whatsapp_message(student, reports, report_type, start_date, end_date, teacher_name)
-            if whatsapp_url:
-                sent_count += 1
-            else:
-                error_count += 1
+    pending = len(students)
+    metrics.add_gauge('quran_whatsapp_bulk_queue_depth', pending)
+    try:
+        for student in students:
+            if student.parent_phone:
+                reports = Report.query.filter(Report.student_id == student.id, Report.date >= start_date, Report.date <= end_date).all()
+                teacher_name = circle.teacher.name if circle.teacher else circle.teacher_name
+                whatsapp_url = create_whatsapp_message(student, reports, report_type, start_date, end_date, teacher_name)
+                if whatsapp_url:
+                    sent_count += 1
+                    metrics.inc('quran_whatsapp_messages_total', (('result', 'sent'),))
+                else:
+                    error_count += 1
+                    metrics.inc('quran_whatsapp_messages_total', (('result', 'error'),))
+            pending -= 1
+            metrics.add_gauge('quran_whatsapp_bulk_queue_depth', -1)
+    finally:
+        metrics.add_gauge('quran_whatsapp_bulk_queue_depth', -pending)
     return sent_count, error_count
 
 def requires_approval():
@@ -400,9 +854,10 @@ def index():
     view_type = request.args.get('view', session.get('view_type', 'mobile' if is_mobile else 'desktop'))
     if view_type != 'auto':
         session['view_type'] = view_type
-    if 'user_id' not in session:
+    user = current_user()
+    if user is None:
         return render_template('guest_dashboard.html')
-    if session.get('role') == 'parent':
+    if user.is_parent:
         return redirect(url_for('parent_dashboard'))
     return redirect(url_for('dashboard'))
 
@@ -413,11 +868,11 @@ def guest_dashboard():
     total_students = Student.query.filter_by(is_active=True).count()
     total_teachers = User.query.filter_by(role='teacher', is_active=True).count()
     total_circles = Circle.query.filter_by(is_active=True).count()
-    total_reports = Report.query.count()
+    total_reports = year_query(Report).count()
     
     # إحصائيات الحضور لهذا الأسبوع
     week_start = datetime.now().date() - timedelta(days=datetime.now().weekday())
-    attendance_stats = db.session.query(Attendance.status, func.count(Attendance.id)).filter(Attendance.date >= week_start).group_by(Attendance.status).all()
+    attendance_stats = year_query(Attendance).with_entities(Attendance.status, func.count(Attendance.id)).filter(Attendance.date >= week_start).group_by(Attendance.status).all()
     
     center_attendance_rate = get_center_attendance_stats()
     
@@ -448,6 +903,9 @@ def toggle_dark_mode():
 @app.route('/set_academic_year/<year>')
 @require_role('admin')
 def set_academic_year(year):
+    if not re.fullmatch(r'\d{4}', year):
+        flash('السنة الدراسية غير صحيحة', 'error')
+        return redirect(request.referrer or url_for('dashboard'))
     session['academic_year'] = year
     flash(f'تم تغيير السنة الدراسية إلى {year}', 'success')
     return redirect(request.referrer or url_for('dashboard'))
@@ -459,10 +917,7 @@ def login():
         password = request.form['password']
         user = User.query.filter_by(username=username, is_active=True).first()
         if user and check_password_hash(user.password, password):
-            session['user_id'] = user.id
-            session['username'] = user.username
-            session['role'] = user.role
-            session['name'] = user.name
+            login_user(user)
             flash('تم تسجيل الدخول بنجاح', 'success')
             if user.role == 'parent':
                 return redirect(url_for('parent_dashboard'))
@@ -487,18 +942,21 @@ def parent_logout():
 @app.route('/dashboard')
 @require_login
 def dashboard():
-    if session.get('role') == 'parent':
+    user = current_user()
+    if user.is_parent:
         return redirect(url_for('parent_dashboard'))
+    if user.is_teacher and request.args.get('view') != 'center':
+        return render_template('teacher_dashboard.html', circle_stats=get_teacher_dashboard(user.circle_ids))
     
     total_students = Student.query.filter_by(is_active=True).count()
     total_teachers = User.query.filter_by(role='teacher', is_active=True).count()
     total_circles = Circle.query.filter_by(is_active=True).count()
-    total_reports = Report.query.count()
+    total_reports = year_query(Report).count()
     
     week_start = datetime.now().date() - timedelta(days=datetime.now().weekday())
-    attendance_stats = db.session.query(Attendance.status, func.count(Attendance.id)).filter(Attendance.date >= week_start).group_by(Attendance.status).all()
+    attendance_stats = year_query(Attendance).with_entities(Attendance.status, func.count(Attendance.id)).filter(Attendance.date >= week_start).group_by(Attendance.status).all()
     
-    recent_reports = Report.query.order_by(Report.date.desc()).limit(10).all()
+    recent_reports = year_query(Report).order_by(Report.date.desc()).limit(10).all()
     new_students = Student.query.filter_by(is_active=True).order_by(Student.id.desc()).limit(5).all()
     center_attendance_rate = get_center_attendance_stats()
     active_circles = Circle.query.filter_by(is_active=True).all()
@@ -528,11 +986,19 @@ def students():
     students = query.all()
     circles = Circle.query.filter_by(is_active=True).all()
     
+    # تاريخ آخر تقرير لكل طالب باستعلام مجمّع بدل تحميل كل تقاريره
+    last_report_dates = {}
+    if view_mode == 'table' and students:
+        rows = db.session.query(Report.student_id, func.max(Report.date)).filter(
+            Report.student_id.in_([student.id for student in students])).group_by(Report.student_id)
+        last_report_dates = dict(rows.all())
+    
     return render_template('students.html', 
                          students=students, 
                          circles=circles, 
                          selected_circle=selected_circle, 
-                         view_mode=view_mode)
+                         view_mode=view_mode,
+                         last_report_dates=last_report_dates)
 
 @app.route('/add_student', methods=['GET', 'POST'])
 @require_login
@@ -548,7 +1014,7 @@ def add_student():
         filename = None
         if photo and allowed_file(photo.filename):
             filename = secure_filename(photo.filename)
-            photo.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
+            photo.save(os.path.join(upload_folder(), filename))
         
         student = Student(
             name=name,
@@ -589,11 +1055,15 @@ def edit_student(student_id):
         student.student_phone = request.form.get('student_phone')
         student.parent_phone = request.form['parent_phone']
         student.circle_id = request.form['circle_id']
+        # سجلات السنوات السابقة تبقى في حلقتها القديمة حتى لا ينتقل تاريخ الترتيب مع الطالب
+        StudentScore.query.filter_by(student_id=student.id, academic_year=academic_year_for(datetime.now().date())).update(
+            {'circle_id': student.circle_id})
+        leaderboard.invalidate()
         
         photo = request.files.get('photo')
         if photo and allowed_file(photo.filename):
             filename = secure_filename(photo.filename)
-            photo.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
+            photo.save(os.path.join(upload_folder(), filename))
             student.photo = filename
         
         try:
@@ -630,17 +1100,10 @@ def approve_student(student_id):
 def reject_student(student_id):
     student = Student.query.get_or_404(student_id)
     student.is_active = False
-    db.session.commit()
     
     # إرسال إشعار لولي الأمر
-    if student.parent and student.parent.user_id:
-        notification = Notification(
-            user_id=student.parent.user_id,
-            title='رفض طالب',
-            message=f'تم رفض طالب "{student.name}" من قبل المسؤول.'
-        )
-        db.session.add(notification)
-        db.session.commit()
+    notify('رفض طالب', f'تم رفض طالب "{student.name}" من قبل المسؤول.', parent_id=student.parent_id)
+    db.session.commit()
     
     flash('تم رفض الطالب وإشعار ولي الأمر', 'warning')
     return redirect(url_for('students'))
@@ -670,6 +1133,7 @@ def add_circle():
         
         try:
             db.session.commit()
+            principals.invalidate(teacher_id)
             flash('تم إضافة الحلقة بنجاح', 'success')
             if requires_approval():
                 flash('سيتم إرسال الحلقة للمسؤول للموافقة عليها', 'info')
@@ -686,12 +1150,15 @@ def add_circle():
 def edit_circle(circle_id):
     circle = Circle.query.get_or_404(circle_id)
     if request.method == 'POST':
+        previous_teacher_id = circle.teacher_id
         circle.name = request.form['name']
         circle.teacher_id = request.form.get('teacher_id', type=int) or None
         circle.teacher_name = request.form.get('teacher_name') or None
         
         try:
             db.session.commit()
+            principals.invalidate(previous_teacher_id)
+            principals.invalidate(circle.teacher_id)
             flash('تم تعديل الحلقة بنجاح', 'success')
             return redirect(url_for('circles'))
         except Exception as e:
@@ -715,17 +1182,11 @@ def approve_circle(circle_id):
 def reject_circle(circle_id):
     circle = Circle.query.get_or_404(circle_id)
     circle.is_active = False
-    db.session.commit()
     
     # إرسال إشعار للمعلم
-    if circle.teacher_id:
-        notification = Notification(
-            user_id=circle.teacher_id,
-            title='رفض حلقة',
-            message=f'تم رفض الحلقة "{circle.name}" من قبل المسؤول.'
-        )
-        db.session.add(notification)
-        db.session.commit()
+    notify('رفض حلقة', f'تم رفض الحلقة "{circle.name}" من قبل المسؤول.', user_id=circle.teacher_id)
+    db.session.commit()
+    principals.invalidate(circle.teacher_id)
     
     flash('تم رفض الحلقة وإشعار المعلم', 'warning')
     return redirect(url_for('circles'))
@@ -734,7 +1195,7 @@ def reject_circle(circle_id):
 @app.route('/reports')
 @require_login
 def reports():
-    reports = Report.query.order_by(Report.date.desc()).all()
+    reports = report_list_query().order_by(Report.date.desc()).all()
     return render_template('reports.html', reports=reports)
 
 @app.route('/add_report', methods=['GET', 'POST'])
@@ -768,28 +1229,20 @@ def add_report():
             notes=notes
         )
         db.session.add(report)
+        add_memorized_range(student.id, surah, from_verse, to_verse)
+        record_report_score(student.id, student.circle_id, date, grade)
+        # إشعار لولي الأمر عند إضافة تقرير جديد (ملخص واحد لتقارير الطالب في اليوم)
+        notify_report(student, date)
         
         try:
             db.session.commit()
-            
-            # إشعار لولي الأمر عند إضافة تقرير جديد
-            if student.parent and student.parent.user_id:
-                notification = Notification(
-                    user_id=student.parent.user_id,
-                    title='تقرير جديد',
-                    message=f'تم إضافة تقرير جديد للطالب "{student.name}" بتاريخ {date}.'
-                )
-                db.session.add(notification)
-                db.session.commit()
-            
             flash('تم إضافة التقرير بنجاح', 'success')
             return redirect(url_for('reports'))
         except Exception as e:
             db.session.rollback()
             flash(f'حدث خطأ أثناء إضافة التقرير: {str(e)}', 'error')
     
-    students = Student.query.filter_by(is_active=True).all()
-    return render_template('add_report.html', students=students)
+    return render_template('add_report.html', students=rosters.students())
 
 @app.route('/collective_report', methods=['GET', 'POST'])
 @require_login
@@ -800,9 +1253,10 @@ def collective_report():
         report_text = request.form['report_text']
         
         reports, attendances = improved_parse_collective_report(report_text, circle_id, date)
+        roster = {student.id: student for student in rosters.circle(circle_id)}
         
         for rep in reports:
-            student = Student.query.get(rep['student_id'])
+            student = roster.get(rep['student_id'])
             if student:
                 report = Report(
                     student_id=rep['student_id'],
@@ -816,9 +1270,13 @@ def collective_report():
                     grade=rep['grade']
                 )
                 db.session.add(report)
+                add_memorized_range(student.id, rep['surah'], rep['from_verse'], rep['to_verse'])
+                record_report_score(student.id, student.circle_id, report.date, report.grade)
+                notify_report(student, report.date)
         
         for att in attendances:
             db.session.add(att)
+            record_attendance_score(att.student_id, att.date, att.status)
         
         try:
             db.session.commit()
@@ -836,6 +1294,7 @@ def collective_report():
 def edit_report(report_id):
     report = Report.query.get_or_404(report_id)
     if request.method == 'POST':
+        previous = (report.date, report.grade)
         report.date = datetime.strptime(request.form['date'], '%Y-%m-%d').date()
         report.surah = request.form['surah']
         report.from_verse = int(request.form['from_verse'])
@@ -843,6 +1302,10 @@ def edit_report(report_id):
         report.type = request.form['type']
         report.grade = request.form['grade']
         report.notes = request.form.get('notes')
+        report.academic_year = academic_year_for(report.date)
+        db.session.flush()
+        rebuild_memorization([report.student_id])
+        record_report_score(report.student_id, report.circle_id, report.date, report.grade, previous)
         
         try:
             db.session.commit()
@@ -864,10 +1327,16 @@ def attendance():
     circles = Circle.query.filter_by(is_active=True).all()
     students = []
     
+    attendance_data = {}
     if selected_circle:
-        students = Student.query.filter_by(circle_id=selected_circle, is_active=True).all()
+        students = rosters.circle(selected_circle)
     
-    attendance_data = {att.student_id: att for att in Attendance.query.filter_by(date=datetime.strptime(selected_date, '%Y-%m-%d').date()).all()}
+    if students:
+        day = datetime.strptime(selected_date, '%Y-%m-%d').date()
+        attendance_query = Attendance.query.filter(
+            Attendance.academic_year == academic_year_for(day), Attendance.date == day,
+            Attendance.student_id.in_([student.id for student in students]))
+        attendance_data = {att.student_id: att for att in attendance_query}
     
     return render_template('attendance.html', 
                          students=students, 
@@ -882,7 +1351,7 @@ def update_attendance():
     date = datetime.strptime(request.form['date'], '%Y-%m-%d').date()
     circle_id = request.form.get('circle_id', type=int)
     
-    students = Student.query.filter_by(circle_id=circle_id, is_active=True).all()
+    students = rosters.circle(circle_id)
     
     for student in students:
         status = request.form.get(f'status_{student.id}', 'حاضر')
@@ -890,11 +1359,13 @@ def update_attendance():
         
         attendance = Attendance.query.filter_by(student_id=student.id, date=date).first()
         if attendance:
+            record_attendance_score(student.id, date, status, attendance.status)
             attendance.status = status
             attendance.notes = notes
         else:
             attendance = Attendance(student_id=student.id, date=date, status=status, notes=notes)
             db.session.add(attendance)
+            record_attendance_score(student.id, date, status)
     
     try:
         db.session.commit()
@@ -909,7 +1380,9 @@ def update_attendance():
 @app.route('/holidays')
 @require_login
 def holidays():
-    holidays = Holiday.query.order_by(Holiday.date).all()
+    # العطل المتكررة تظهر في كل السنوات الدراسية
+    year = selected_academic_year()
+    holidays = Holiday.query.filter((Holiday.academic_year == year) | Holiday.is_recurring.is_(True)).order_by(Holiday.date).all()
     return render_template('holidays.html', holidays=holidays)
 
 @app.route('/add_holiday', methods=['GET', 'POST'])
@@ -932,6 +1405,7 @@ def add_holiday():
         
         try:
             db.session.commit()
+            attendance_calendar.invalidate()
             flash('تم إضافة العطلة بنجاح', 'success')
             return redirect(url_for('holidays'))
         except Exception as e:
@@ -946,6 +1420,7 @@ def delete_holiday(holiday_id):
     holiday = Holiday.query.get_or_404(holiday_id)
     db.session.delete(holiday)
     db.session.commit()
+    attendance_calendar.invalidate()
     flash('تم حذف العطلة بنجاح', 'success')
     return redirect(url_for('holidays'))
 
@@ -1001,6 +1476,7 @@ def add_parents():
                     parent.user_id = user.id
             
             db.session.commit()
+            principals.invalidate()
             flash(f'تم إضافة {created_count} من أولياء الأمور بنجاح', 'success')
             return redirect(url_for('parents'))
         except Exception as e:
@@ -1067,6 +1543,7 @@ def edit_user(user_id):
     if request.method == 'POST':
         user.name = request.form['name']
         user.role = request.form['role']
+        user.is_active = 'is_active' in request.form
         new_password = request.form.get('password')
         
         if new_password:
@@ -1074,6 +1551,7 @@ def edit_user(user_id):
         
         try:
             db.session.commit()
+            principals.invalidate(user.id)
             flash('تم تعديل المستخدم بنجاح', 'success')
             return redirect(url_for('users'))
         except Exception as e:
@@ -1086,7 +1564,7 @@ def edit_user(user_id):
 @app.route('/settings', methods=['GET', 'POST'])
 @require_role('admin')
 def settings():
-    settings_obj = Settings.query.first() or Settings()
+    settings_obj = Settings.query.options(db.undefer_group('settings_text')).first() or Settings()
     
     if request.method == 'POST':
         settings_obj.site_name = request.form['site_name']
@@ -1107,7 +1585,7 @@ def settings():
         logo = request.files.get('logo')
         if logo and allowed_file(logo.filename):
             filename = secure_filename(logo.filename)
-            logo.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
+            logo.save(os.path.join(upload_folder(), filename))
             settings_obj.logo = filename
         
         try:
@@ -1122,13 +1600,13 @@ def settings():
     user_count = User.query.count()
     circle_count = Circle.query.filter_by(is_active=True).count()
     student_count = Student.query.filter_by(is_active=True).count()
-    report_count = Report.query.count()
+    report_count = year_query(Report).count()
     teacher_count = User.query.filter_by(role='teacher').count()
     support_count = User.query.filter_by(role='support').count()
     parent_count = Parent.query.count()
-    weekly_reports_count = Report.query.filter(Report.date >= datetime.now().date() - timedelta(days=7)).count()
-    attendance_count = Attendance.query.count()
-    holiday_count = Holiday.query.count()
+    weekly_reports_count = year_query(Report).filter(Report.date >= datetime.now().date() - timedelta(days=7)).count()
+    attendance_count = year_query(Attendance).count()
+    holiday_count = year_query(Holiday).count()
     students_without_parents = Student.query.filter_by(parent_id=None).count()
     
     return render_template('settings.html',
@@ -1143,7 +1621,9 @@ def settings():
                          weekly_reports_count=weekly_reports_count,
                          attendance_count=attendance_count,
                          holiday_count=holiday_count,
-                         students_without_parents=students_without_parents)
+                         students_without_parents=students_without_parents,
+                         archived_years=archived_years(),
+                         current_academic_year=academic_year_for(datetime.now().date()))
 
 @app.route('/delete_logo')
 @require_role('admin')
@@ -1152,7 +1632,7 @@ def delete_logo():
     if settings_obj and settings_obj.logo:
         try:
             # حذف ملف الشعار
-            logo_path = os.path.join(app.config['UPLOAD_FOLDER'], settings_obj.logo)
+            logo_path = os.path.join(upload_folder(), settings_obj.logo)
             if os.path.exists(logo_path):
                 os.remove(logo_path)
             
@@ -1176,13 +1656,13 @@ def support():
 @app.route('/notifications')
 @require_login
 def notifications():
-    if session.get('role') != 'parent':
+    user = current_user()
+    if not user.is_parent:
         flash('ليس لديك صلاحية للوصول إلى هذه الصفحة', 'error')
         return redirect(url_for('dashboard'))
     
-    parent = Parent.query.filter_by(name=session['name']).first()
-    if parent and parent.user_id:
-        notifs = Notification.query.filter_by(user_id=parent.user_id).order_by(Notification.created_at.desc()).all()
+    if user.parent_id:
+        notifs = Notification.query.filter_by(user_id=user.id).order_by(Notification.created_at.desc()).all()
         return render_template('notifications.html', notifications=notifs)
     
     flash('لم يتم العثور على بيانات ولي الأمر', 'error')
@@ -1222,17 +1702,18 @@ def send_bulk_reports_route(circle_id, report_type):
 # ---------- 19.  UPLOADED FILES ----------
 @app.route('/uploads/<filename>')
 def uploaded_file(filename):
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    return send_from_directory(upload_folder(), filename)
 
 # ---------- 20.  PARENT DASHBOARD ----------
 @app.route('/parent_dashboard')
 @require_login
 def parent_dashboard():
-    if session.get('role') != 'parent':
+    user = current_user()
+    if not user.is_parent:
         flash('ليس لديك صلاحية للوصول إلى هذه الصفحة', 'error')
         return redirect(url_for('dashboard'))
     
-    parent = Parent.query.filter_by(name=session['name']).first()
+    parent = Parent.query.get(user.parent_id) if user.parent_id else None
     if not parent:
         flash('لم يتم العثور على بيانات ولي الأمر', 'error')
         return redirect(url_for('logout'))
@@ -1283,8 +1764,9 @@ def student_reports(student_id):
     end_date_monthly = datetime.now().date()
     start_date_monthly = end_date_monthly - timedelta(days=30)
     
-    weekly_reports = Report.query.filter(Report.student_id == student_id, Report.date >= start_date_weekly, Report.date <= end_date_weekly).all()
+    # تقارير الأسبوع جزء من تقارير الشهر فلا حاجة لاستعلام ثانٍ
     monthly_reports = Report.query.filter(Report.student_id == student_id, Report.date >= start_date_monthly, Report.date <= end_date_monthly).all()
+    weekly_reports = [report for report in monthly_reports if report.date >= start_date_weekly]
     
     return render_template('student_reports.html',
                          student=student,
@@ -1299,44 +1781,38 @@ def student_reports(student_id):
 @app.route('/parent_student_details/<int:student_id>')
 @require_login
 def parent_student_details(student_id):
-    if session.get('role') != 'parent':
+    user = current_user()
+    if not user.is_parent:
         flash('ليس لديك صلاحية للوصول إلى هذه الصفحة', 'error')
         return redirect(url_for('dashboard'))
     
     student = Student.query.get_or_404(student_id)
-    parent = Parent.query.filter_by(name=session['name']).first()
-    
-    if not parent or student.parent_id != parent.id:
+    if not user.parent_id or student.parent_id != user.parent_id:
         flash('ليس لديك صلاحية لعرض تفاصيل هذا الطالب', 'error')
         return redirect(url_for('parent_dashboard'))
     
     stats = get_student_stats(student_id)
-    recent_reports = Report.query.filter_by(student_id=student_id).order_by(Report.date.desc()).limit(10).all()
-    recent_attendance = Attendance.query.filter_by(student_id=student_id).order_by(Attendance.date.desc()).limit(10).all()
+    recent_reports = year_query(Report).filter_by(student_id=student_id).order_by(Report.date.desc()).limit(10).all()
+    recent_attendance = year_query(Attendance).filter_by(student_id=student_id).order_by(Attendance.date.desc()).limit(10).all()
     
-    # إحصائيات الحلقة
+    # إحصائيات الحلقة من جدول الترتيب بدلاً من حساب إحصائيات كل طالب في الحلقة
+    year = selected_academic_year()
+    student_score = StudentScore.query.filter_by(student_id=student_id, academic_year=year).first()
+    average_attendance, average_verses = db.session.query(
+        func.avg(StudentScore.attendance_rate), func.avg(StudentScore.memorized_verses)
+    ).join(Student, Student.id == StudentScore.student_id).filter(
+        StudentScore.academic_year == year, StudentScore.circle_id == student.circle_id, Student.is_active.is_(True)
+    ).one()
     circle_stats = {
         'total_students': Student.query.filter_by(circle_id=student.circle_id, is_active=True).count(),
-        'average_attendance': 0,
-        'average_verses': 0
+        'average_attendance': average_attendance or 0,
+        'average_verses': average_verses or 0,
+        'attendance_rate': student_score.attendance_rate if student_score else 0,
+        'memorized_verses': student_score.memorized_verses if student_score else 0,
+        'verses_rank': leaderboard.rank(student_id, 'memorized_verses', year, student.circle_id),
+        'attendance_rank': leaderboard.rank(student_id, 'attendance_rate', year, student.circle_id)
     }
     
-    circle_students = Student.query.filter_by(circle_id=student.circle_id, is_active=True).all()
-    total_attendance = 0
-    total_verses = 0
-    students_with_stats = 0
-    
-    for circle_student in circle_students:
-        student_stats = get_student_stats(circle_student.id)
-        if student_stats:
-            total_attendance += student_stats['attendance_rate']
-            total_verses += student_stats['total_verses']
-            students_with_stats += 1
-    
-    if students_with_stats > 0:
-        circle_stats['average_attendance'] = total_attendance / students_with_stats
-        circle_stats['average_verses'] = total_verses / students_with_stats
-    
     return render_template('parent_student_details.html',
                          student=student,
                          stats=stats,
@@ -1344,7 +1820,2701 @@ def parent_student_details(student_id):
                          recent_attendance=recent_attendance,
                          circle_stats=circle_stats)
 
-# ---------- 23.  RUN ----------
+# ---------- 23.  METRICS ----------
+# مقاييس تشغيلية بصيغة Prometheus النصية، تُجمع داخل العملية دون خدمة خارجية.
+# كل عملية (worker) تحتفظ بعداداتها في الذاكرة وتكتبها دورياً إلى ملف باسم رقمها داخل METRICS_DIR،
+# ونقطة /metrics تدمج ملفات جميع العمليات حتى تبقى الأرقام صحيحة مع تعدد العمليات.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+METRICS_FLUSH_INTERVAL = 1.0  # ثانية
+
+METRIC_DEFINITIONS = {
+    'quran_http_requests_total': ('counter', 'Total HTTP requests by endpoint, method and status.'),
+    'quran_http_request_duration_seconds': ('histogram', 'HTTP request latency by endpoint.'),
+    'quran_http_requests_in_flight': ('gauge', 'HTTP requests currently being served.'),
+    'quran_sqlite_commit_seconds': ('histogram', 'Time spent committing (flush plus SQLite write-lock wait).'),
+    'quran_sqlite_busy_total': ('counter', 'SQLite "database is locked" errors after the busy timeout expired.'),
+    'quran_cache_requests_total': ('counter', 'Cache lookups by cache name and result.'),
+    'quran_cache_hit_ratio': ('gauge', 'Cache hit ratio since process start, by cache name.'),
+    'quran_whatsapp_bulk_queue_depth': ('gauge', 'Students still waiting in running bulk WhatsApp generations.'),
+    'quran_whatsapp_messages_total': ('counter', 'WhatsApp messages generated by bulk runs, by result.'),
+}
+
+class MetricsRegistry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.last_flush = 0.0
+
+    def inc(self, name, labels=(), value=1):
+        key = (name, tuple(labels))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def add_gauge(self, name, value, labels=()):
+        key = (name, tuple(labels))
+        with self.lock:
+            self.gauges[key] = self.gauges.get(key, 0) + value
+
+    def observe(self, name, value, labels=()):
+        key = (name, tuple(labels))
+        with self.lock:
+            buckets = self.histograms.get(key)
+            if buckets is None:
+                # عدادات الفئات التراكمية ثم المجموع ثم العدد
+                buckets = self.histograms[key] = [0] * (len(LATENCY_BUCKETS) + 2)
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if value <= bound:
+                    buckets[i] += 1
+            buckets[-2] += value
+            buckets[-1] += 1
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'pid': os.getpid(),
+                'counters': [[name, [list(l) for l in labels], value] for (name, labels), value in self.counters.items()],
+                'gauges': [[name, [list(l) for l in labels], value] for (name, labels), value in self.gauges.items()],
+                'histograms': [[name, [list(l) for l in labels], list(value)] for (name, labels), value in self.histograms.items()],
+            }
+
+    def flush(self, force=False):
+        now = time.time()
+        if not force and now - self.last_flush < METRICS_FLUSH_INTERVAL:
+            return
+        self.last_flush = now
+        directory = app.config['METRICS_DIR']
+        try:
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, f'{os.getpid()}.json')
+            tmp_path = path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(self.snapshot(), f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Error writing metrics: {e}")
+
+metrics = MetricsRegistry()
+
+def record_cache_lookup(cache_name, hit):
+    metrics.inc('quran_cache_requests_total', (('cache', cache_name), ('result', 'hit' if hit else 'miss')))
+
+def process_alive(pid):
+    if pid == os.getpid():
+        return True
+    if os.name == 'nt':
+        # os.kill على ويندوز ينهي العملية بدلاً من فحصها
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+METRICS_AGGREGATE = 'dead-processes.json'
+METRICS_LOCK_STALE = 60  # ثانية؛ قفل الدمج المتروك من عملية انتهت أثناءه
+
+def read_metrics_file(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def merge_metrics(totals, data, with_gauges):
+    counters, gauges, histograms = totals
+    for name, labels, value in data['counters']:
+        key = (name, tuple(tuple(l) for l in labels))
+        counters[key] = counters.get(key, 0) + value
+    if with_gauges:
+        for name, labels, value in data['gauges']:
+            key = (name, tuple(tuple(l) for l in labels))
+            gauges[key] = gauges.get(key, 0) + value
+    for name, labels, value in data['histograms']:
+        key = (name, tuple(tuple(l) for l in labels))
+        merged = histograms.setdefault(key, [0] * len(value))
+        for i, v in enumerate(value):
+            merged[i] += v
+
+def fold_dead_metrics(directory):
+    """طي ملفات العمليات المنتهية في ملف تجميعي ثم حذفها (مثل mark_process_dead في prometheus_client):
+    عداداتها ومدرجاتها تبقى في المجموع، ومؤشراتها اللحظية تُهمل، فلا يكبر المجلد مع إعادة تشغيل العمليات"""
+    dead = []
+    for filename in os.listdir(directory):
+        if re.fullmatch(r'\d+\.json', filename) and not process_alive(int(filename[:-5])):
+            dead.append(filename)
+    if not dead:
+        return
+    path = os.path.join(directory, METRICS_AGGREGATE)
+    totals = ({}, {}, {})
+    for filename in [METRICS_AGGREGATE] + dead:
+        data = read_metrics_file(os.path.join(directory, filename))
+        if data:
+            merge_metrics(totals, data, with_gauges=False)
+    counters, _gauges, histograms = totals
+    with open(path + '.tmp', 'w') as f:
+        json.dump({'pid': None, 'gauges': [],
+                   'counters': [[name, [list(l) for l in labels], value] for (name, labels), value in counters.items()],
+                   'histograms': [[name, [list(l) for l in labels], value] for (name, labels), value in histograms.items()]}, f)
+    os.replace(path + '.tmp', path)
+    for filename in dead:
+        os.remove(os.path.join(directory, filename))
+
+def collect_metrics():
+    """دمج مقاييس جميع العمليات: العدادات تُجمع دائماً، والمؤشرات اللحظية من العمليات الحية فقط"""
+    metrics.flush(force=True)
+    directory = app.config['METRICS_DIR']
+    # الطي والقراءة تحت قفل واحد حتى لا تُعدّ عملية منتهية مرتين أو تسقط أثناء نقلها إلى الملف التجميعي
+    lock = None
+    for _ in range(40):
+        lock = acquire_file_lock(os.path.join(directory, 'collect.lock'), METRICS_LOCK_STALE)
+        if lock:
+            break
+        time.sleep(0.05)
+    totals = ({}, {}, {})
+    try:
+        if lock:
+            fold_dead_metrics(directory)
+        for filename in os.listdir(directory):
+            if not filename.endswith('.json'):
+                continue
+            data = read_metrics_file(os.path.join(directory, filename))
+            if data:
+                merge_metrics(totals, data, with_gauges=data['pid'] is not None and process_alive(data['pid']))
+    finally:
+        if lock:
+            os.remove(lock)
+    counters, gauges, histograms = totals
+    # نسبة الإصابة لكل ذاكرة مؤقتة مشتقة من عدادات البحث
+    cache_totals = {}
+    for (name, labels), value in counters.items():
+        if name == 'quran_cache_requests_total':
+            label_map = dict(labels)
+            hits, total = cache_totals.get(label_map['cache'], (0, 0))
+            cache_totals[label_map['cache']] = (hits + (value if label_map['result'] == 'hit' else 0), total + value)
+    for cache_name, (hits, total) in cache_totals.items():
+        gauges[('quran_cache_hit_ratio', (('cache', cache_name),))] = round(hits / total, 4) if total else 0
+    return counters, gauges, histograms
+
+def format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = ','.join(f'{k}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"' for k, v in pairs)
+    return '{' + escaped + '}'
+
+def render_metrics():
+    counters, gauges, histograms = collect_metrics()
+    lines = []
+    for name, (metric_type, help_text) in METRIC_DEFINITIONS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {metric_type}')
+        if metric_type == 'histogram':
+            for (metric_name, labels), value in sorted(histograms.items()):
+                if metric_name != name:
+                    continue
+                for bound, count in zip(LATENCY_BUCKETS, value):
+                    lines.append(f'{name}_bucket{format_labels(labels, [("le", bound)])} {count}')
+                lines.append(f'{name}_bucket{format_labels(labels, [("le", "+Inf")])} {value[-1]}')
+                lines.append(f'{name}_sum{format_labels(labels)} {value[-2]}')
+                lines.append(f'{name}_count{format_labels(labels)} {value[-1]}')
+        else:
+            source = counters if metric_type == 'counter' else gauges
+            for (metric_name, labels), value in sorted(source.items()):
+                if metric_name == name:
+                    lines.append(f'{name}{format_labels(labels)} {value}')
+    return '\n'.join(lines) + '\n'
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    metrics.add_gauge('quran_http_requests_in_flight', 1)
+
+@app.after_request
+def record_response_status(response):
+    g.response_status = response.status_code
+    return response
+
+@app.teardown_request
+def record_request_metrics(exc):
+    started = g.pop('request_started', None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    endpoint = request.endpoint or 'unmatched'
+    status = g.get('response_status', 500)
+    metrics.add_gauge('quran_http_requests_in_flight', -1)
+    metrics.observe('quran_http_request_duration_seconds', elapsed, (('endpoint', endpoint),))
+    metrics.inc('quran_http_requests_total', (('endpoint', endpoint), ('method', request.method), ('status', status)))
+    metrics.flush()
+
+@event.listens_for(OrmSession, 'before_commit')
+def start_commit_timer(db_session):
+    db_session.info['commit_started'] = time.perf_counter()
+
+@event.listens_for(OrmSession, 'after_commit')
+def record_commit_time(db_session):
+    started = db_session.info.pop('commit_started', None)
+    if started is not None:
+        metrics.observe('quran_sqlite_commit_seconds', time.perf_counter() - started)
+
+@event.listens_for(OrmSession, 'after_rollback')
+def clear_commit_timer(db_session):
+    db_session.info.pop('commit_started', None)
+
+@event.listens_for(Engine, 'handle_error')
+def count_sqlite_busy(context):
+    message = str(context.original_exception).lower()
+    if 'database is locked' in message or 'database is busy' in message:
+        metrics.inc('quran_sqlite_busy_total')
+
+@app.route('/metrics')
+def metrics_endpoint():
+    token = app.config.get('METRICS_TOKEN')
+    if token and request.args.get('token') != token and request.headers.get('Authorization') != f'Bearer {token}':
+        abort(403)
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+# ---------- 24.  ACADEMIC YEAR ARCHIVE ----------
+def archive_academic_year(year):
+    """نقل تقارير وحضور سنة دراسية مغلقة إلى ملف SQLite مستقل (instance/archive_<year>.db)
+    يُرفق لاحقاً للقراءة فقط، فتبقى جداول السنة الحالية صغيرة مهما تراكم التاريخ."""
+    if not re.fullmatch(r'\d{4}', year):
+        raise ValueError('السنة الدراسية غير صحيحة')
+    if int(year) >= int(academic_year_for(datetime.now().date())):
+        raise ValueError('لا يمكن أرشفة السنة الدراسية الحالية')
+    path = archive_path(year)
+    if os.path.exists(path):
+        raise ValueError(f'السنة الدراسية {year} مؤرشفة مسبقاً')
+
+    # 1) نسخ السجلات إلى ملف مؤقت بنفس البنية والفهارس
+    tmp_path = path + '.tmp'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    archive_engine = create_engine('sqlite:///' + tmp_path)
+    for model in YEAR_ARCHIVED_MODELS:
+        model.__table__.create(archive_engine)
+    archive_engine.dispose()
+
+    counts = {}
+    with db.session.get_bind().connect() as connection:
+        connection.exec_driver_sql('ATTACH DATABASE ? AS archive_new', (tmp_path,))
+        try:
+            for model in YEAR_ARCHIVED_MODELS:
+                table = model.__table__.name
+                columns = ', '.join(column.name for column in model.__table__.columns)
+                result = connection.exec_driver_sql(
+                    f'INSERT INTO archive_new.{table} ({columns}) SELECT {columns} FROM main.{table} WHERE academic_year = ?', (year,))
+                counts[table] = result.rowcount
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            connection.exec_driver_sql('DETACH DATABASE archive_new')
+
+    # 2) تفعيل الأرشيف ثم 3) حذف السجلات من القاعدة الرئيسية
+    os.replace(tmp_path, path)
+    with db.session.get_bind().begin() as connection:
+        for model in YEAR_ARCHIVED_MODELS:
+            connection.execute(model.__table__.delete().where(model.__table__.c.academic_year == year))
+    db.session.expire_all()
+    return counts
+
+@app.route('/archive_academic_year/<year>')
+@require_role('admin')
+def archive_academic_year_route(year):
+    try:
+        counts = archive_academic_year(year)
+        flash(f'تمت أرشفة السنة الدراسية {year}: {counts["report"]} تقرير و{counts["attendance"]} سجل حضور', 'success')
+    except ValueError as e:
+        flash(str(e), 'error')
+    except Exception as e:
+        flash(f'حدث خطأ أثناء أرشفة السنة الدراسية: {str(e)}', 'error')
+    return redirect(url_for('settings'))
+
+@app.cli.command('archive-year')
+@click.argument('year')
+def archive_year_command(year):
+    """أرشفة سنة دراسية مغلقة في ملف مستقل"""
+    counts = archive_academic_year(year)
+    click.echo(f'archived {year}: {counts}')
+
+# ---------- 25.  MEMORIZATION COVERAGE ----------
+# جدول السور (الاسم، عدد الآيات) برواية حفص، مجموعها 6236 آية
+SURAHS = (
+    ('الفاتحة', 7), ('البقرة', 286), ('آل عمران', 200), ('النساء', 176), ('المائدة', 120), ('الأنعام', 165),
+    ('الأعراف', 206), ('الأنفال', 75), ('التوبة', 129), ('يونس', 109), ('هود', 123), ('يوسف', 111),
+    ('الرعد', 43), ('إبراهيم', 52), ('الحجر', 99), ('النحل', 128), ('الإسراء', 111), ('الكهف', 110),
+    ('مريم', 98), ('طه', 135), ('الأنبياء', 112), ('الحج', 78), ('المؤمنون', 118), ('النور', 64),
+    ('الفرقان', 77), ('الشعراء', 227), ('النمل', 93), ('القصص', 88), ('العنكبوت', 69), ('الروم', 60),
+    ('لقمان', 34), ('السجدة', 30), ('الأحزاب', 73), ('سبأ', 54), ('فاطر', 45), ('يس', 83),
+    ('الصافات', 182), ('ص', 88), ('الزمر', 75), ('غافر', 85), ('فصلت', 54), ('الشورى', 53),
+    ('الزخرف', 89), ('الدخان', 59), ('الجاثية', 37), ('الأحقاف', 35), ('محمد', 38), ('الفتح', 29),
+    ('الحجرات', 18), ('ق', 45), ('الذاريات', 60), ('الطور', 49), ('النجم', 62), ('القمر', 55),
+    ('الرحمن', 78), ('الواقعة', 96), ('الحديد', 29), ('المجادلة', 22), ('الحشر', 24), ('الممتحنة', 13),
+    ('الصف', 14), ('الجمعة', 11), ('المنافقون', 11), ('التغابن', 18), ('الطلاق', 12), ('التحريم', 12),
+    ('الملك', 30), ('القلم', 52), ('الحاقة', 52), ('المعارج', 44), ('نوح', 28), ('الجن', 28),
+    ('المزمل', 20), ('المدثر', 56), ('القيامة', 40), ('الإنسان', 31), ('المرسلات', 50), ('النبأ', 40),
+    ('النازعات', 46), ('عبس', 42), ('التكوير', 29), ('الانفطار', 19), ('المطففين', 36), ('الانشقاق', 25),
+    ('البروج', 22), ('الطارق', 17), ('الأعلى', 19), ('الغاشية', 26), ('الفجر', 30), ('البلد', 20),
+    ('الشمس', 15), ('الليل', 21), ('الضحى', 11), ('الشرح', 8), ('التين', 8), ('العلق', 19),
+    ('القدر', 5), ('البينة', 8), ('الزلزلة', 8), ('العاديات', 11), ('القارعة', 11), ('التكاثر', 8),
+    ('العصر', 3), ('الهمزة', 9), ('الفيل', 5), ('قريش', 4), ('الماعون', 7), ('الكوثر', 3),
+    ('الكافرون', 6), ('النصر', 3), ('المسد', 5), ('الإخلاص', 4), ('الفلق', 5), ('الناس', 6),
+)
+# الأسماء الأخرى الشائعة للسور
+SURAH_ALIASES = {
+    'براءة': 9, 'بني إسرائيل': 17, 'المؤمن': 40, 'حم السجدة': 41, 'القتال': 47, 'تبارك': 67,
+    'الدهر': 76, 'عم': 78, 'الانشراح': 94, 'ألم نشرح': 94, 'لم يكن': 98, 'الزلزال': 99,
+    'اللهب': 111, 'تبت': 111, 'التوحيد': 112,
+}
+# بدايات الأجزاء الثلاثين (السورة، الآية)
+JUZ_STARTS = (
+    (1, 1), (2, 142), (2, 253), (3, 93), (4, 24), (4, 148), (5, 82), (6, 111), (7, 88), (8, 41),
+    (9, 93), (11, 6), (12, 53), (15, 1), (17, 1), (18, 75), (21, 1), (23, 1), (25, 21), (27, 56),
+    (29, 46), (33, 31), (36, 28), (39, 32), (41, 47), (46, 1), (51, 31), (58, 1), (67, 1), (78, 1),
+)
+
+SURAH_OFFSETS = [0]
+for _name, _count in SURAHS:
+    SURAH_OFFSETS.append(SURAH_OFFSETS[-1] + _count)
+TOTAL_VERSES = SURAH_OFFSETS[-1]
+BITMAP_BYTES = (TOTAL_VERSES + 7) // 8
+_juz_bounds = [SURAH_OFFSETS[surah - 1] + verse - 1 for surah, verse in JUZ_STARTS] + [TOTAL_VERSES]
+JUZ_MASKS = tuple(((1 << (end - start)) - 1) << start for start, end in zip(_juz_bounds, _juz_bounds[1:]))
+
+ARABIC_MARKS = re.compile(r'[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed\u0640]')
+
+def normalize_arabic(value):
+    # إزالة التشكيل والتطويل وتوحيد أشكال الألف والياء والتاء المربوطة
+    value = ARABIC_MARKS.sub('', value or '')
+    value = re.sub('[أإآٱ]', 'ا', value).replace('ى', 'ي').replace('ة', 'ه').replace('ؤ', 'و').replace('ئ', 'ي')
+    return re.sub(r'\s+', ' ', value).strip().lower()
+
+def surah_key(name):
+    key = normalize_arabic(name).replace(' ', '')
+    return key[2:] if key.startswith('ال') and len(key) > 3 else key
+
+SURAH_IDS = {surah_key(name): i for i, (name, _count) in enumerate(SURAHS, 1)}
+SURAH_IDS.update({surah_key(name): surah_id for name, surah_id in SURAH_ALIASES.items()})
+
+@lru_cache(maxsize=1024)
+def resolve_surah(name):
+    """تحويل اسم السورة كما كتبه المعلم (مثل 'ال عمران ' أو 'مراجعة البقرة' أو '2') إلى رقمها"""
+    name = normalize_arabic(name)
+    if name.isdigit():
+        return int(name) if 1 <= int(name) <= len(SURAHS) else None
+    words = name.replace('سوره', ' ').split()
+    for i in range(len(words)):
+        surah_id = SURAH_IDS.get(surah_key(''.join(words[i:])))
+        if surah_id:
+            return surah_id
+    return None
+
+def verse_mask(surah, from_verse, to_verse):
+    surah_id = resolve_surah(surah)
+    if not surah_id:
+        return 0
+    first = max(1, min(from_verse, to_verse))
+    last = min(SURAHS[surah_id - 1][1], max(from_verse, to_verse))
+    if first > last:
+        return 0
+    return ((1 << (last - first + 1)) - 1) << (SURAH_OFFSETS[surah_id - 1] + first - 1)
+
+def apply_coverage(progress, bits):
+    progress.verses_bitmap = bits.to_bytes(BITMAP_BYTES, 'little')
+    progress.memorized_verses = bin(bits).count('1')
+    progress.completed_juz_mask = sum(1 << i for i, mask in enumerate(JUZ_MASKS) if bits & mask == mask)
+    progress.completed_juz = bin(progress.completed_juz_mask).count('1')
+
+def add_memorized_range(student_id, surah, from_verse, to_verse):
+    """تحديث تدريجي لتغطية الطالب عند إضافة تقرير (دون commit، ضمن معاملة المستدعي)"""
+    mask = verse_mask(surah, from_verse, to_verse)
+    if not mask:
+        return None
+    progress = MemorizationProgress.query.filter_by(student_id=student_id).first()
+    if not progress:
+        progress = MemorizationProgress(student_id=student_id)
+        db.session.add(progress)
+    bits = int.from_bytes(progress.verses_bitmap or b'', 'little')
+    if bits | mask != bits or progress.memorized_verses is None:
+        apply_coverage(progress, bits | mask)
+    return progress
+
+def rebuild_memorization(student_ids=None):
+    """إعادة بناء التغطية من كل التقارير (بما فيها السنوات المؤرشفة)، تُستخدم بعد التعديل وللتهيئة الأولى"""
+    coverage = {}
+    queries = [Report.query] + [year_query(Report, year) for year in archived_years()]
+    for query in queries:
+        if student_ids is not None:
+            query = query.filter(Report.student_id.in_(student_ids))
+        rows = query.with_entities(Report.student_id, Report.surah, Report.from_verse, Report.to_verse)
+        for student_id, surah, from_verse, to_verse in rows:
+            coverage[student_id] = coverage.get(student_id, 0) | verse_mask(surah, from_verse, to_verse)
+    existing = MemorizationProgress.query
+    if student_ids is not None:
+        existing = existing.filter(MemorizationProgress.student_id.in_(student_ids))
+    progress_rows = {p.student_id: p for p in existing}
+    for student_id in set(coverage) | set(progress_rows):
+        progress = progress_rows.get(student_id)
+        if not progress:
+            progress = MemorizationProgress(student_id=student_id)
+            db.session.add(progress)
+        apply_coverage(progress, coverage.get(student_id, 0))
+    return len(coverage)
+
+@app.cli.command('rebuild-memorization')
+def rebuild_memorization_command():
+    """إعادة حساب تغطية الحفظ لجميع الطلاب"""
+    count = rebuild_memorization()
+    db.session.commit()
+    click.echo(f'rebuilt memorization coverage for {count} students')
+
+# ---------- 26.  LEADERBOARD ----------
+# ترتيب الطلاب لكل حلقة وللمركز من جدول StudentScore الذي يُحدَّث تدريجياً مع كل تقرير أو حضور.
+# أفضل K تُقرأ مباشرة من الفهارس المرتبة، وترتيب طالب معين يُحسب ببحث ثنائي في قائمة القيم المرتبة المخزنة مؤقتاً.
+GRADE_POINTS = {'ممتاز': 4, 'جيد جدا': 3, 'جيد': 2, 'مقبول': 1}
+RANKING_METRICS = {'memorized_verses': 'الآيات المحفوظة', 'attendance_rate': 'نسبة الحضور', 'grade_average': 'متوسط التقدير'}
+
+def get_student_score(student_id, year, circle_id=None):
+    score = StudentScore.query.filter_by(student_id=student_id, academic_year=year).first()
+    if not score:
+        if circle_id is None:
+            circle_id = db.session.query(Student.circle_id).filter_by(id=student_id).scalar()
+        progress = MemorizationProgress.query.filter_by(student_id=student_id).first()
+        score = StudentScore(student_id=student_id, circle_id=circle_id, academic_year=year,
+                             memorized_verses=progress.memorized_verses if progress else 0,
+                             grade_points=0, graded_reports=0, grade_average=0,
+                             present_days=0, attendance_days=0, attendance_rate=0)
+        db.session.add(score)
+    return score
+
+def refresh_score_averages(score):
+    score.grade_average = round(score.grade_points / score.graded_reports, 2) if score.graded_reports else 0
+    score.attendance_rate = round(score.present_days * 100 / score.attendance_days, 2) if score.attendance_days else 0
+
+def record_report_score(student_id, circle_id, report_date, grade, previous=None):
+    """تحديث ملخص الطالب بعد إضافة تقرير أو تعديله؛ previous = (التاريخ، التقدير) قبل التعديل"""
+    if previous:
+        old_score = get_student_score(student_id, academic_year_for(previous[0]), circle_id)
+        if previous[1] in GRADE_POINTS:
+            old_score.grade_points -= GRADE_POINTS[previous[1]]
+            old_score.graded_reports -= 1
+        refresh_score_averages(old_score)
+    score = get_student_score(student_id, academic_year_for(report_date), circle_id)
+    if grade in GRADE_POINTS:
+        score.grade_points += GRADE_POINTS[grade]
+        score.graded_reports += 1
+    refresh_score_averages(score)
+    leaderboard.invalidate(score.academic_year, score.circle_id)
+
+@event.listens_for(OrmSession, 'after_flush')
+def collect_memorized_changes(db_session, flush_context):
+    changes = db_session.info.setdefault('memorized_changes', {})
+    for obj in list(db_session.new) + list(db_session.dirty):
+        if isinstance(obj, MemorizationProgress) and inspect(obj).attrs.memorized_verses.history.has_changes():
+            changes[obj.student_id] = obj.memorized_verses or 0
+
+@event.listens_for(OrmSession, 'before_commit')
+def write_memorized_scores(db_session):
+    # الحفظ تراكمي فيُنسخ إلى سجلات الطالب في كل السنوات، مرة لكل معاملة وعند تغيّر التغطية فقط
+    if db_session.new or db_session.dirty or db_session.deleted:
+        db_session.flush()
+    changes = db_session.info.pop('memorized_changes', None)
+    if not changes:
+        return
+    table = StudentScore.__table__
+    db_session.connection().execute(
+        table.update().where(table.c.student_id == bindparam('score_student_id')).values(memorized_verses=bindparam('verses')),
+        [{'score_student_id': student_id, 'verses': verses} for student_id, verses in changes.items()])
+    leaderboard.invalidate()
+
+@event.listens_for(OrmSession, 'after_rollback')
+def discard_memorized_changes(db_session):
+    db_session.info.pop('memorized_changes', None)
+
+def record_attendance_score(student_id, day, status, old_status=None):
+    # الأيام غير الدراسية (الجمعة والعطل) لا تدخل في نسبة الحضور
+    if not attendance_calendar.is_working_day(day):
+        return
+    score = get_student_score(student_id, academic_year_for(day))
+    if old_status is not None:
+        score.attendance_days -= 1
+        score.present_days -= old_status == 'حاضر'
+    score.attendance_days += 1
+    score.present_days += status == 'حاضر'
+    refresh_score_averages(score)
+    leaderboard.invalidate(score.academic_year, score.circle_id)
+
+def rebuild_scores():
+    """إعادة بناء جدول الترتيب بالكامل من التقارير والحضور (بما فيها السنوات المؤرشفة)"""
+    circles_by_student = dict(db.session.query(Student.id, Student.circle_id))
+    memorized = dict(db.session.query(MemorizationProgress.student_id, MemorizationProgress.memorized_verses))
+    totals = {}
+
+    def entry(student_id, year):
+        key = (student_id, year)
+        if key not in totals:
+            totals[key] = {'student_id': student_id, 'academic_year': year, 'circle_id': circles_by_student.get(student_id),
+                           'memorized_verses': memorized.get(student_id, 0), 'grade_points': 0, 'graded_reports': 0,
+                           'present_days': 0, 'attendance_days': 0}
+        return totals[key]
+
+    years = [None] + archived_years()
+    for year in years:
+        reports = year_query(Report, year) if year else Report.query
+        for student_id, year_value, grade in reports.with_entities(Report.student_id, Report.academic_year, Report.grade):
+            if grade in GRADE_POINTS:
+                row = entry(student_id, year_value)
+                row['grade_points'] += GRADE_POINTS[grade]
+                row['graded_reports'] += 1
+        attendances = year_query(Attendance, year) if year else Attendance.query
+        for student_id, year_value, day, status in attendances.with_entities(Attendance.student_id, Attendance.academic_year, Attendance.date, Attendance.status):
+            if attendance_calendar.is_working_day(day):
+                row = entry(student_id, year_value)
+                row['attendance_days'] += 1
+                row['present_days'] += status == 'حاضر'
+    rows = []
+    for row in totals.values():
+        row['grade_average'] = round(row['grade_points'] / row['graded_reports'], 2) if row['graded_reports'] else 0
+        row['attendance_rate'] = round(row['present_days'] * 100 / row['attendance_days'], 2) if row['attendance_days'] else 0
+        row['updated_at'] = datetime.now()
+        rows.append(row)
+    StudentScore.query.delete()
+    if rows:
+        db.session.execute(StudentScore.__table__.insert(), rows)
+    leaderboard.invalidate()
+    return len(rows)
+
+class Leaderboard:
+    CACHE_SECONDS = 60  # حتى ترى العمليات الأخرى التغييرات
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sorted_values = {}
+
+    def scope_query(self, metric, year, circle_id=None):
+        column = getattr(StudentScore, metric)
+        query = db.session.query(StudentScore).join(Student, Student.id == StudentScore.student_id).filter(
+            StudentScore.academic_year == year, Student.is_active.is_(True))
+        if circle_id:
+            query = query.filter(StudentScore.circle_id == circle_id)
+        return query, column
+
+    def top(self, metric, year, circle_id=None, limit=10):
+        query, column = self.scope_query(metric, year, circle_id)
+        return query.options(db.contains_eager(StudentScore.student)).order_by(column.desc(), StudentScore.student_id).limit(limit).all()
+
+    def values(self, metric, year, circle_id=None):
+        key = (current_tenant(), metric, year, circle_id)
+        cached = self.sorted_values.get(key)
+        if cached and time.monotonic() - cached[1] < self.CACHE_SECONDS:
+            record_cache_lookup('leaderboard', True)
+            return cached[0]
+        record_cache_lookup('leaderboard', False)
+        query, column = self.scope_query(metric, year, circle_id)
+        # القيم سالبة ومرتبة تصاعدياً ليعطي bisect عدد من يتفوقون على الطالب
+        values = [-value for (value,) in query.with_entities(column).order_by(column.desc())]
+        with self.lock:
+            self.sorted_values[key] = (values, time.monotonic())
+        return values
+
+    def rank(self, student_id, metric, year, circle_id=None):
+        score = StudentScore.query.filter_by(student_id=student_id, academic_year=year).first()
+        if not score:
+            return None, 0
+        values = self.values(metric, year, circle_id)
+        return bisect_left(values, -getattr(score, metric)) + 1, len(values)
+
+    def invalidate(self, year=None, circle_id=None):
+        with self.lock:
+            tenant = current_tenant()
+            for key in list(self.sorted_values):
+                if year is None or (key[0] == tenant and key[2] == year and key[3] in (None, circle_id)):
+                    self.sorted_values.pop(key, None)
+
+leaderboard = Leaderboard()
+
+def leaderboard_args():
+    metric = request.args.get('metric', 'memorized_verses')
+    if metric not in RANKING_METRICS:
+        metric = 'memorized_verses'
+    return metric, request.args.get('circle_id', type=int), min(request.args.get('limit', 10, type=int), 100)
+
+@app.route('/leaderboard')
+@require_login
+def leaderboard_view():
+    if current_user().is_parent:
+        flash('ليس لديك صلاحية للوصول إلى هذه الصفحة', 'error')
+        return redirect(url_for('parent_dashboard'))
+    metric, circle_id, limit = leaderboard_args()
+    year = selected_academic_year()
+    top_scores = leaderboard.top(metric, year, circle_id, limit)
+    circles = Circle.query.filter_by(is_active=True).all()
+    return render_template('leaderboard.html',
+                         top_scores=top_scores,
+                         circles=circles,
+                         metric=metric,
+                         metrics=RANKING_METRICS,
+                         selected_circle=circle_id,
+                         limit=limit)
+
+@app.route('/leaderboard/json')
+@require_login
+def leaderboard_json():
+    if current_user().is_parent:
+        return jsonify({'error': 'forbidden'}), 403
+    metric, circle_id, limit = leaderboard_args()
+    year = selected_academic_year()
+    top_scores = leaderboard.top(metric, year, circle_id, limit)
+    data = {
+        'metric': metric,
+        'academic_year': year,
+        'circle_id': circle_id,
+        'top': [{'rank': i, 'student_id': s.student_id, 'name': s.student.name, 'circle_id': s.circle_id,
+                 'value': getattr(s, metric)} for i, s in enumerate(top_scores, 1)],
+    }
+    student_id = request.args.get('student_id', type=int)
+    if student_id:
+        rank, total = leaderboard.rank(student_id, metric, year, circle_id)
+        data['student'] = {'student_id': student_id, 'rank': rank, 'total': total}
+    return jsonify(data)
+
+@app.cli.command('rebuild-scores')
+def rebuild_scores_command():
+    """إعادة بناء جدول ترتيب الطلاب"""
+    count = rebuild_scores()
+    db.session.commit()
+    click.echo(f'rebuilt {count} student scores')
+
+# ---------- 27.  MOBILE API ----------
+# واجهة JSON للقراءة فقط لتطبيقات الجوال (أولياء الأمور والمعلمين):
+# اختيار الحقول (?fields=)، وتصفح بالمؤشر (?cursor=&limit=)؛ أما الضغط وETag فمن طبقة الاستجابة (القسم 29).
+API_DEFAULT_LIMIT = 20
+API_MAX_LIMIT = 100
+
+def require_api_login(f):
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        if current_user() is None:
+            return jsonify({'error': 'unauthorized'}), 401
+        return f(*args, **kwargs)
+    return decorated
+
+def api_response(payload, status=200):
+    body = json.dumps(payload, ensure_ascii=False, separators=(',', ':'), default=str)
+    return Response(body, status=status, mimetype='application/json')
+
+def select_fields(item):
+    fields = request.args.get('fields')
+    if not fields:
+        return item
+    wanted = {field.strip() for field in fields.split(',')}
+    return {key: value for key, value in item.items() if key in wanted}
+
+def encode_cursor(*values):
+    return base64.urlsafe_b64encode(json.dumps(values, default=str).encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor, *shape):
+    """قيم المؤشر بعد التحقق من عددها وأنواعها (int أو date_type)، أو None إن لم يُرسل مؤشر؛
+    المؤشر التالف يُرفض برمز 400 بدل أن يصل إلى الاستعلام"""
+    if not cursor:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if not isinstance(values, list) or len(values) != len(shape):
+            raise ValueError(cursor)
+        decoded = []
+        for value, kind in zip(values, shape):
+            if kind is date_type:
+                decoded.append(datetime.strptime(value, '%Y-%m-%d').date())
+            elif isinstance(value, int) and not isinstance(value, bool) and -2 ** 63 <= value < 2 ** 63:
+                decoded.append(value)
+            else:
+                raise ValueError(value)
+        return decoded
+    except (ValueError, TypeError):
+        abort(api_response({'error': 'invalid_cursor'}, 400))
+
+def api_year():
+    # السنة تصل إلى مسار ملف الأرشيف واسم قاعدة مرفقة، فلا تُقبل إلا بأربعة أرقام
+    year = request.args.get('year')
+    if year and not re.fullmatch(r'\d{4}', year):
+        abort(api_response({'error': 'invalid_year'}, 400))
+    return year
+
+def api_limit():
+    return max(1, min(request.args.get('limit', API_DEFAULT_LIMIT, type=int), API_MAX_LIMIT))
+
+def paginate_by_date(query, model, serialize):
+    """تصفح بالمؤشر مرتباً بالتاريخ ثم المعرّف تنازلياً، دون OFFSET"""
+    cursor = decode_cursor(request.args.get('cursor', ''), date_type, int)
+    if cursor:
+        cursor_date, cursor_id = cursor
+        query = query.filter((model.date < cursor_date) | ((model.date == cursor_date) & (model.id < cursor_id)))
+    limit = api_limit()
+    rows = query.order_by(model.date.desc(), model.id.desc()).limit(limit + 1).all()
+    next_cursor = encode_cursor(rows[limit - 1].date.isoformat(), rows[limit - 1].id) if len(rows) > limit else None
+    return {'data': [select_fields(serialize(row)) for row in rows[:limit]], 'next_cursor': next_cursor}
+
+def api_visible_students():
+    """الطلاب الذين يحق للمستخدم الحالي رؤيتهم حسب دوره"""
+    query = Student.query.filter_by(is_active=True)
+    user = current_user()
+    if user.is_parent:
+        return query.filter(Student.parent_id == user.parent_id)
+    if user.is_teacher:
+        return query.filter(Student.circle_id.in_(user.circle_ids))
+    return query
+
+def serialize_student(student):
+    progress = student.memorization
+    return {
+        'id': student.id,
+        'name': student.name,
+        'age': student.age,
+        'circle_id': student.circle_id,
+        'circle_name': student.circle.name if student.circle else None,
+        'parent_id': student.parent_id,
+        'photo': url_for('uploaded_file', filename=student.photo) if student.photo else None,
+        'memorized_verses': progress.memorized_verses if progress else 0,
+        'memorized_percent': progress.memorized_percent if progress else 0,
+        'completed_juz': progress.completed_juz if progress else 0,
+    }
+
+def serialize_report(report):
+    return {
+        'id': report.id, 'student_id': report.student_id, 'date': report.date.isoformat(), 'surah': report.surah,
+        'from_verse': report.from_verse, 'to_verse': report.to_verse, 'type': report.type, 'grade': report.grade,
+        'notes': report.notes,
+    }
+
+def serialize_attendance(attendance):
+    return {
+        'id': attendance.id, 'student_id': attendance.student_id, 'date': attendance.date.isoformat(),
+        'status': attendance.status, 'notes': attendance.notes,
+    }
+
+def serialize_notification(notification):
+    return {
+        'id': notification.id, 'title': notification.title, 'message': notification.message,
+        'is_read': notification.is_read, 'created_at': notification.created_at.isoformat(timespec='seconds'),
+    }
+
+@app.route('/api/v1/session', methods=['POST'])
+def api_login():
+    data = request.get_json(silent=True) or request.form
+    user = User.query.filter_by(username=data.get('username', ''), is_active=True).first()
+    if not user or not check_password_hash(user.password, data.get('password', '')):
+        return jsonify({'error': 'invalid_credentials'}), 401
+    login_user(user)
+    return api_response({'id': user.id, 'name': user.name, 'role': user.role})
+
+@app.route('/api/v1/me')
+@require_api_login
+def api_me():
+    user = current_user()
+    return api_response(select_fields({'id': user.id, 'name': user.name, 'role': user.role, 'parent_id': user.parent_id,
+                                       'circle_ids': list(user.circle_ids),
+                                       'academic_year': selected_academic_year()}))
+
+@app.route('/api/v1/students')
+@require_api_login
+def api_students():
+    query = api_visible_students().options(db.joinedload(Student.circle), db.joinedload(Student.memorization))
+    cursor = decode_cursor(request.args.get('cursor', ''), int)
+    if cursor:
+        query = query.filter(Student.id > cursor[0])
+    limit = api_limit()
+    students = query.order_by(Student.id).limit(limit + 1).all()
+    next_cursor = encode_cursor(students[limit - 1].id) if len(students) > limit else None
+    return api_response({'data': [select_fields(serialize_student(s)) for s in students[:limit]], 'next_cursor': next_cursor})
+
+@app.route('/api/v1/students/<int:student_id>/reports')
+@require_api_login
+def api_student_reports(student_id):
+    if not api_visible_students().filter(Student.id == student_id).first():
+        return jsonify({'error': 'not_found'}), 404
+    query = year_query(Report, api_year()).filter(Report.student_id == student_id)
+    return api_response(paginate_by_date(query, Report, serialize_report))
+
+@app.route('/api/v1/students/<int:student_id>/attendance')
+@require_api_login
+def api_student_attendance(student_id):
+    if not api_visible_students().filter(Student.id == student_id).first():
+        return jsonify({'error': 'not_found'}), 404
+    query = year_query(Attendance, api_year()).filter(Attendance.student_id == student_id)
+    return api_response(paginate_by_date(query, Attendance, serialize_attendance))
+
+@app.route('/api/v1/notifications')
+@require_api_login
+def api_notifications():
+    query = Notification.query.filter_by(user_id=session['user_id'])
+    if request.args.get('unread') == '1':
+        query = query.filter_by(is_read=False)
+    cursor = decode_cursor(request.args.get('cursor', ''), int)
+    if cursor:
+        query = query.filter(Notification.id < cursor[0])
+    limit = api_limit()
+    notifications = query.order_by(Notification.id.desc()).limit(limit + 1).all()
+    next_cursor = encode_cursor(notifications[limit - 1].id) if len(notifications) > limit else None
+    return api_response({'data': [select_fields(serialize_notification(n)) for n in notifications[:limit]], 'next_cursor': next_cursor})
+
+# ---------- 28.  OFFLINE SYNC ----------
+# مزامنة دفعات الحضور والتقارير المدخلة دون اتصال: كل عملية تحمل معرّفاً من العميل (op_id)
+# ووقت إدخالها، فتُطبّق مرة واحدة فقط، ويفوز الأحدث عند التعارض، ثم تُعاد تغييرات الخادم منذ المؤشر.
+SYNC_MAX_OPERATIONS = 500
+SYNC_MAX_CHANGES = 500
+SYNC_ENTITIES = {Report: 'report', Attendance: 'attendance'}
+
+@event.listens_for(OrmSession, 'after_flush')
+def record_sync_changes(db_session, flush_context):
+    rows = []
+    now = datetime.now()
+    for obj, action in [(o, 'upsert') for o in db_session.new] + \
+                       [(o, 'upsert') for o in db_session.dirty if db_session.is_modified(o)] + \
+                       [(o, 'delete') for o in db_session.deleted]:
+        entity = SYNC_ENTITIES.get(type(obj))
+        if entity:
+            rows.append({'entity': entity, 'entity_id': obj.id, 'student_id': obj.student_id,
+                         'action': action, 'changed_at': now})
+    if rows:
+        db_session.connection().execute(SyncChange.__table__.insert(), rows)
+
+def parse_client_time(value):
+    if not value:
+        return datetime.now()
+    moment = datetime.fromisoformat(value)
+    return moment.astimezone().replace(tzinfo=None) if moment.tzinfo else moment
+
+def validate_sync_operation(op, students):
+    """التحقق من العملية قبل أي كتابة، ويعيد رسالة الخطأ أو None"""
+    if not isinstance(op, dict) or not op.get('op_id') or len(str(op['op_id'])) > 64:
+        return 'op_id مطلوب'
+    if op.get('entity') not in ('attendance', 'report'):
+        return 'نوع غير معروف'
+    is_update = op['entity'] == 'report' and (op.get('id') or op.get('ref'))
+    if not is_update and op.get('student_id') not in students:
+        return 'الطالب غير موجود أو خارج صلاحياتك'
+    try:
+        if op.get('date') or not is_update:
+            datetime.strptime(op.get('date', ''), '%Y-%m-%d')
+        parse_client_time(op.get('client_time'))
+        if op['entity'] == 'report':
+            for field in ('from_verse', 'to_verse'):
+                if field in op or not is_update:
+                    int(op[field])
+            if not is_update and not (op.get('surah') and op.get('grade') and op.get('type')):
+                return 'بيانات التقرير ناقصة'
+    except (KeyError, TypeError, ValueError):
+        return 'بيانات غير صالحة'
+    return None
+
+def last_change_times(entity, ids):
+    if not ids:
+        return {}
+    return dict(db.session.query(SyncChange.entity_id, func.max(SyncChange.changed_at))
+                .filter(SyncChange.entity == entity, SyncChange.entity_id.in_(ids))
+                .group_by(SyncChange.entity_id).all())
+
+def apply_attendance_operation(op, existing, changed_times):
+    day = datetime.strptime(op['date'], '%Y-%m-%d').date()
+    attendance = existing.get((op['student_id'], day))
+    if attendance and attendance.id in changed_times and changed_times[attendance.id] > parse_client_time(op.get('client_time')):
+        return 'conflict', attendance
+    status = op.get('status') or 'حاضر'
+    if attendance:
+        record_attendance_score(attendance.student_id, day, status, attendance.status)
+        attendance.status = status
+        attendance.notes = op.get('notes', attendance.notes)
+    else:
+        attendance = Attendance(student_id=op['student_id'], date=day, status=status, notes=op.get('notes', ''))
+        db.session.add(attendance)
+        record_attendance_score(attendance.student_id, day, status)
+        existing[(op['student_id'], day)] = attendance
+    return 'applied', attendance
+
+def apply_report_operation(op, students, refs):
+    report_id = op.get('id') or refs.get(op.get('ref'))
+    day = datetime.strptime(op['date'], '%Y-%m-%d').date() if op.get('date') else None
+    if not report_id:
+        student = students[op['student_id']]
+        report = Report(student_id=student.id, teacher_id=session['user_id'], circle_id=student.circle_id, date=day,
+                        surah=op['surah'], from_verse=int(op['from_verse']), to_verse=int(op['to_verse']),
+                        type=op['type'], grade=op['grade'], notes=op.get('notes'))
+        db.session.add(report)
+        add_memorized_range(student.id, report.surah, report.from_verse, report.to_verse)
+        record_report_score(student.id, student.circle_id, day, report.grade)
+        db.session.flush()
+        notify_report(student, day)
+        return 'applied', report
+    report = Report.query.get(report_id)
+    if not report or report.student_id not in students:
+        return 'rejected', None
+    changed_at = last_change_times('report', [report.id]).get(report.id)
+    if changed_at and changed_at > parse_client_time(op.get('client_time')):
+        return 'conflict', report
+    previous = (report.date, report.grade)
+    report.date = day or report.date
+    for field in ('surah', 'type', 'grade', 'notes'):
+        if field in op:
+            setattr(report, field, op[field])
+    for field in ('from_verse', 'to_verse'):
+        if field in op:
+            setattr(report, field, int(op[field]))
+    report.academic_year = academic_year_for(report.date)
+    db.session.flush()
+    rebuild_memorization([report.student_id])
+    record_report_score(report.student_id, report.circle_id, report.date, report.grade, previous)
+    return 'applied', report
+
+def sync_changes_since(cursor, student_ids):
+    """آخر حالة لكل سجل تغيّر بعد المؤشر ضمن طلاب المستخدم"""
+    changes = (SyncChange.query.filter(SyncChange.id > cursor, SyncChange.student_id.in_(student_ids))
+               .order_by(SyncChange.id).limit(SYNC_MAX_CHANGES + 1).all())
+    has_more = len(changes) > SYNC_MAX_CHANGES
+    changes = changes[:SYNC_MAX_CHANGES]
+    latest = {}
+    for change in changes:
+        latest[(change.entity, change.entity_id)] = change
+    rows = {
+        'report': {r.id: r for r in Report.query.filter(Report.id.in_([i for e, i in latest if e == 'report']))},
+        'attendance': {a.id: a for a in Attendance.query.filter(Attendance.id.in_([i for e, i in latest if e == 'attendance']))},
+    }
+    serializers = {'report': serialize_report, 'attendance': serialize_attendance}
+    items = []
+    for (entity, entity_id), change in sorted(latest.items(), key=lambda item: item[1].id):
+        row = rows[entity].get(entity_id)
+        items.append({'seq': change.id, 'entity': entity, 'id': entity_id,
+                      'action': 'upsert' if row else 'delete',
+                      'data': serializers[entity](row) if row else None})
+    next_cursor = changes[-1].id if changes else cursor
+    return items, next_cursor, has_more
+
+@app.route('/api/v1/sync', methods=['POST'])
+@require_api_login
+def api_sync():
+    if not (current_user().is_admin or current_user().is_teacher):
+        return jsonify({'error': 'forbidden'}), 403
+    payload = request.get_json(silent=True) or {}
+    operations = payload.get('changes') or []
+    if not isinstance(operations, list) or len(operations) > SYNC_MAX_OPERATIONS:
+        return jsonify({'error': 'too_many_changes', 'max': SYNC_MAX_OPERATIONS}), 400
+    try:
+        cursor = int(payload.get('cursor') or 0)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'invalid_cursor'}), 400
+
+    students = {s.id: s for s in api_visible_students()}
+    op_ids = [str(op['op_id']) for op in operations if isinstance(op, dict) and op.get('op_id')]
+    seen = {o.op_id: o for o in SyncOperation.query.filter(SyncOperation.op_id.in_(op_ids))} if op_ids else {}
+    refs = {op_id: o.entity_id for op_id, o in seen.items() if o.entity == 'report'}
+
+    # جلب سجلات الحضور المعنية دفعة واحدة بدلاً من استعلام لكل طالب
+    attendance_keys = {(op.get('student_id'), op.get('date')) for op in operations
+                       if isinstance(op, dict) and op.get('entity') == 'attendance'}
+    attendance_days = {datetime.strptime(d, '%Y-%m-%d').date() for s, d in attendance_keys
+                       if isinstance(d, str) and re.fullmatch(r'\d{4}-\d{2}-\d{2}', d)}
+    existing = {}
+    if attendance_days:
+        for attendance in Attendance.query.filter(Attendance.student_id.in_({s for s, d in attendance_keys if s in students}),
+                                                  Attendance.date.in_(attendance_days)):
+            existing[(attendance.student_id, attendance.date)] = attendance
+    attendance_times = last_change_times('attendance', [a.id for a in existing.values()])
+
+    results = []
+    serializers = {'report': serialize_report, 'attendance': serialize_attendance}
+    try:
+        for op in operations:
+            error = validate_sync_operation(op, students)
+            if error:
+                results.append({'op_id': op.get('op_id') if isinstance(op, dict) else None, 'status': 'rejected', 'error': error})
+                continue
+            op_id = str(op['op_id'])
+            if op_id in seen:
+                results.append({'op_id': op_id, 'status': 'duplicate', 'entity': seen[op_id].entity, 'id': seen[op_id].entity_id})
+                continue
+            if op['entity'] == 'attendance':
+                status, row = apply_attendance_operation(op, existing, attendance_times)
+            else:
+                status, row = apply_report_operation(op, students, refs)
+            if status == 'rejected':
+                results.append({'op_id': op_id, 'status': status, 'error': 'التقرير غير موجود أو خارج صلاحياتك'})
+                continue
+            db.session.flush()
+            seen[op_id] = SyncOperation(op_id=op_id, user_id=session['user_id'], entity=op['entity'], entity_id=row.id, status=status)
+            db.session.add(seen[op_id])
+            if op['entity'] == 'report':
+                refs[op_id] = row.id
+            elif status == 'applied':
+                attendance_times[row.id] = datetime.now()
+            result = {'op_id': op_id, 'status': status, 'entity': op['entity'], 'id': row.id}
+            if status == 'conflict':
+                result['server'] = serializers[op['entity']](row)
+            results.append(result)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'sync_failed', 'message': str(e)}), 500
+
+    changes, next_cursor, has_more = sync_changes_since(cursor, list(students))
+    return jsonify({'results': results, 'changes': changes, 'cursor': next_cursor, 'has_more': has_more})
+
+# ---------- 29.  RESPONSE COMPRESSION ----------
+# ضغط الاستجابات النصية (HTML وJSON) بـ gzip أو brotli فوق حد أدنى للحجم، مع ETag ضعيف
+# لطلبات GET الناجحة، فيعيد الخادم 304 دون جسم عندما لا يتغير المحتوى.
+COMPRESSION_MIN_SIZE = 512  # بايت
+COMPRESSIBLE_MIMETYPES = {'text/html', 'application/json', 'text/plain', 'text/css', 'application/javascript'}
+
+def compress_body(body, accept_encoding):
+    """ضغط المحتوى حسب ما يقبله العميل، ويعيد (المحتوى، الترميز) أو (المحتوى، None)"""
+    if len(body) < COMPRESSION_MIN_SIZE:
+        return body, None
+    accepted = {part.split(';')[0].strip() for part in accept_encoding.lower().split(',')}
+    if brotli is not None and 'br' in accepted:
+        return brotli.compress(body, quality=5), 'br'
+    if 'gzip' in accepted:
+        return gzip.compress(body, compresslevel=6), 'gzip'
+    return body, None
+
+@app.after_request
+def compress_response(response):
+    if (response.direct_passthrough or response.is_streamed or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_MIMETYPES):
+        return response
+    response.vary.add('Accept-Encoding')
+    if request.method in ('GET', 'HEAD') and response.status_code == 200:
+        if not response.headers.get('Cache-Control'):
+            response.headers['Cache-Control'] = 'private, no-cache'
+        response.add_etag(weak=True)
+        response.make_conditional(request)
+        if response.status_code == 304:
+            return response
+    body, encoding = compress_body(response.get_data(), request.headers.get('Accept-Encoding', ''))
+    if encoding:
+        response.set_data(body)
+        response.headers['Content-Encoding'] = encoding
+    return response
+
+# ---------- 30.  TEMPLATE PRECOMPILATION ----------
+@app.cli.command('precompile-templates')
+def precompile_templates_command():
+    """ترجمة جميع القوالب مسبقاً وحفظها في ذاكرة القوالب عند النشر"""
+    started = time.perf_counter()
+    names = app.jinja_env.list_templates(extensions=['html'])
+    for name in names:
+        app.jinja_env.get_template(name)
+    click.echo(f'precompiled {len(names)} templates into {app.config["TEMPLATE_CACHE_DIR"]} '
+               f'in {(time.perf_counter() - started) * 1000:.0f}ms')
+
+# ---------- 31.  SERVER-SIDE SESSIONS ----------
+# تُحفظ بيانات الجلسة في الخادم (SQLite مشتركة بين العمليات، أو الذاكرة مع انتهاء صلاحية)،
+# ولا ينتقل في الكوكي إلا معرّف عشوائي. SESSION_BACKEND=cookie يعيد الجلسة الموقّعة الافتراضية.
+SESSION_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{43}$')
+SESSION_TOUCH_SECONDS = 3600  # تجديد الصلاحية عند القراءة مرة كل ساعة على الأكثر
+
+class ServerSession(CallbackDict, SessionMixin):
+    def __init__(self, data=None, sid=None, expires=None):
+        def on_update(self):
+            self.modified = True
+        super().__init__(data, on_update)
+        self.sid = sid
+        self.expires = expires
+        self.initial_user_id = self.get('user_id')
+        self.new = sid is None
+        self.modified = False
+
+class MemorySessionStore:
+    """مخزن جلسات داخل العملية، مناسب للتطوير أو لعامل واحد"""
+    SWEEP_SECONDS = 300
+
+    def __init__(self):
+        self.sessions = {}
+        self.lock = threading.Lock()
+        self.swept_at = time.monotonic()
+
+    def get(self, sid):
+        with self.lock:
+            entry = self.sessions.get(sid)
+        if entry and entry[0] > time.time():
+            return entry
+        return None
+
+    def set(self, sid, data, expires):
+        with self.lock:
+            self.sessions[sid] = (expires, data)
+            if time.monotonic() - self.swept_at > self.SWEEP_SECONDS:
+                now = time.time()
+                self.sessions = {k: v for k, v in self.sessions.items() if v[0] > now}
+                self.swept_at = time.monotonic()
+
+    def delete(self, sid):
+        with self.lock:
+            self.sessions.pop(sid, None)
+
+class SqliteSessionStore:
+    """مخزن جلسات في ملف SQLite مستقل يشترك فيه جميع العمّال"""
+    SWEEP_SECONDS = 3600
+
+    def __init__(self, path):
+        self.path = path
+        self.local = threading.local()
+        self.swept_at = 0
+        self.connection().execute('CREATE TABLE IF NOT EXISTS sessions (sid TEXT PRIMARY KEY, data TEXT NOT NULL, expires REAL NOT NULL)')
+
+    def connection(self):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self.local.conn = conn
+        return conn
+
+    def get(self, sid):
+        row = self.connection().execute('SELECT expires, data FROM sessions WHERE sid = ? AND expires > ?',
+                                         (sid, time.time())).fetchone()
+        return row
+
+    def set(self, sid, data, expires):
+        conn = self.connection()
+        conn.execute('INSERT OR REPLACE INTO sessions (sid, data, expires) VALUES (?, ?, ?)', (sid, data, expires))
+        if time.time() - self.swept_at > self.SWEEP_SECONDS:
+            conn.execute('DELETE FROM sessions WHERE expires <= ?', (time.time(),))
+            self.swept_at = time.time()
+
+    def delete(self, sid):
+        self.connection().execute('DELETE FROM sessions WHERE sid = ?', (sid,))
+
+class ServerSessionInterface(SessionInterface):
+    serializer = TaggedJSONSerializer()
+
+    def __init__(self, store):
+        self.store = store
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid and SESSION_ID_PATTERN.match(sid):
+            entry = self.store.get(sid)
+            if entry:
+                return ServerSession(self.serializer.loads(entry[1]), sid, entry[0])
+        return ServerSession()
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if not session:
+            if session.sid and session.modified:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+        # معرّف جديد عند تغيّر المستخدم (تسجيل الدخول) لمنع تثبيت الجلسة
+        if session.sid and session.get('user_id') != session.initial_user_id:
+            self.store.delete(session.sid)
+            session.sid = None
+        lifetime = app.permanent_session_lifetime.total_seconds()
+        now = time.time()
+        touch = session.expires is not None and session.expires - now < lifetime - SESSION_TOUCH_SECONDS
+        if session.sid is None:
+            session.sid = secrets.token_urlsafe(32)
+        elif not session.modified and not touch:
+            return
+        session.expires = now + lifetime
+        self.store.set(session.sid, self.serializer.dumps(dict(session)), session.expires)
+        # مدة المخزن منفصلة عن الكعكة: الكعكة دائمة فقط مع session.permanent، وإلا تنتهي بإغلاق المتصفح
+        response.set_cookie(name, session.sid, expires=self.get_expiration_time(app, session), domain=domain, path=path,
+                            secure=self.get_cookie_secure(app), httponly=self.get_cookie_httponly(app),
+                            samesite=self.get_cookie_samesite(app))
+
+if app.config['SESSION_BACKEND'] == 'sqlite':
+    app.session_interface = ServerSessionInterface(SqliteSessionStore(app.config['SESSION_DB']))
+elif app.config['SESSION_BACKEND'] == 'memory':
+    app.session_interface = ServerSessionInterface(MemorySessionStore())
+
+# ---------- 32.  TEACHER DASHBOARD ----------
+# ملخصات يومية لكل حلقة (الحضور المسجّل، الحاضرون، التقارير، الآيات) تُجمع فروقها من تغييرات
+# التقارير والحضور أثناء الـ flush، وتُكتب مرة واحدة قبل الـ commit بعبارة upsert واحدة.
+CIRCLE_STATS_FIELDS = ('attendance_marked', 'present_count', 'reports_count', 'reported_students', 'verses_count')
+CIRCLE_STATS_REBUILD_DAYS = 14
+
+def attribute_before(obj, name):
+    history = inspect(obj).attrs[name].history
+    if history.deleted:
+        return history.deleted[0]
+    return history.unchanged[0] if history.unchanged else getattr(obj, name)
+
+def report_verses(from_verse, to_verse):
+    return max(0, int(to_verse or 0) - int(from_verse or 0) + 1)
+
+@event.listens_for(OrmSession, 'after_flush')
+def collect_circle_stats(db_session, flush_context):
+    # كل عنصر: (الطالب، الحلقة أو None للحضور، اليوم، الحقل، الفرق)
+    deltas = db_session.info.setdefault('circle_stats_deltas', [])
+    for obj in db_session.new:
+        if isinstance(obj, Attendance):
+            deltas.append((obj.student_id, None, obj.date, 'attendance_marked', 1))
+            deltas.append((obj.student_id, None, obj.date, 'present_count', int(obj.status == 'حاضر')))
+        elif isinstance(obj, Report):
+            deltas.append((obj.student_id, obj.circle_id, obj.date, 'reports_count', 1))
+            deltas.append((obj.student_id, obj.circle_id, obj.date, 'verses_count', report_verses(obj.from_verse, obj.to_verse)))
+            db_session.info.setdefault('circle_stats_new_reports', []).append((obj.student_id, obj.circle_id, obj.date))
+    for obj in db_session.dirty:
+        if isinstance(obj, Attendance) and db_session.is_modified(obj):
+            old_date, old_status = attribute_before(obj, 'date'), attribute_before(obj, 'status')
+            if old_date != obj.date:
+                deltas.append((obj.student_id, None, old_date, 'attendance_marked', -1))
+                deltas.append((obj.student_id, None, obj.date, 'attendance_marked', 1))
+            deltas.append((obj.student_id, None, old_date, 'present_count', -int(old_status == 'حاضر')))
+            deltas.append((obj.student_id, None, obj.date, 'present_count', int(obj.status == 'حاضر')))
+        elif isinstance(obj, Report) and db_session.is_modified(obj):
+            old_date, old_circle = attribute_before(obj, 'date'), attribute_before(obj, 'circle_id')
+            old_verses = report_verses(attribute_before(obj, 'from_verse'), attribute_before(obj, 'to_verse'))
+            if (old_date, old_circle) != (obj.date, obj.circle_id):
+                deltas.append((obj.student_id, old_circle, old_date, 'reports_count', -1))
+                deltas.append((obj.student_id, obj.circle_id, obj.date, 'reports_count', 1))
+            deltas.append((obj.student_id, old_circle, old_date, 'verses_count', -old_verses))
+            deltas.append((obj.student_id, obj.circle_id, obj.date, 'verses_count', report_verses(obj.from_verse, obj.to_verse)))
+    for obj in db_session.deleted:
+        if isinstance(obj, Attendance):
+            deltas.append((obj.student_id, None, obj.date, 'attendance_marked', -1))
+            deltas.append((obj.student_id, None, obj.date, 'present_count', -int(obj.status == 'حاضر')))
+        elif isinstance(obj, Report):
+            deltas.append((obj.student_id, obj.circle_id, obj.date, 'reports_count', -1))
+            deltas.append((obj.student_id, obj.circle_id, obj.date, 'verses_count', -report_verses(obj.from_verse, obj.to_verse)))
+
+@event.listens_for(OrmSession, 'before_commit')
+def apply_circle_stats(db_session):
+    if db_session.new or db_session.dirty or db_session.deleted:
+        db_session.flush()
+    deltas = db_session.info.pop('circle_stats_deltas', None)
+    new_reports = db_session.info.pop('circle_stats_new_reports', [])
+    if not deltas:
+        return
+    student_ids = {student_id for student_id, circle_id, day, field, value in deltas if circle_id is None}
+    circles = dict(db_session.query(Student.id, Student.circle_id).filter(Student.id.in_(student_ids))) if student_ids else {}
+    totals = {}
+    for student_id, circle_id, day, field, value in deltas:
+        circle_id = circles.get(student_id) if circle_id is None else int(circle_id)
+        if circle_id and value:
+            row = totals.setdefault((circle_id, day), dict.fromkeys(CIRCLE_STATS_FIELDS, 0))
+            row[field] += value
+    if new_reports:
+        # الطالب يُحتسب ضمن من سمّعوا عند أول تقرير له في ذلك اليوم فقط
+        added = Counter((student_id, day) for student_id, circle_id, day in new_reports)
+        report_circles = {(student_id, day): int(circle_id) for student_id, circle_id, day in new_reports if circle_id}
+        counts = db_session.query(Report.student_id, Report.date, func.count(Report.id)).filter(
+            Report.student_id.in_({student_id for student_id, day in added}), Report.date.in_({day for student_id, day in added})
+        ).group_by(Report.student_id, Report.date)
+        for student_id, day, count in counts:
+            if (student_id, day) in report_circles and count == added[(student_id, day)]:
+                totals.setdefault((report_circles[(student_id, day)], day), dict.fromkeys(CIRCLE_STATS_FIELDS, 0))['reported_students'] += 1
+    rows = [dict(circle_id=circle_id, date=day, updated_at=datetime.now(), **fields)
+            for (circle_id, day), fields in totals.items() if any(fields.values())]
+    if not rows:
+        return
+    statement = sqlite_insert(CircleDailyStats.__table__).values(rows)
+    statement = statement.on_conflict_do_update(
+        index_elements=['circle_id', 'date'],
+        set_={field: getattr(CircleDailyStats.__table__.c, field) + getattr(statement.excluded, field) for field in CIRCLE_STATS_FIELDS}
+             | {'updated_at': statement.excluded.updated_at})
+    db_session.connection().execute(statement)
+
+@event.listens_for(OrmSession, 'after_rollback')
+def discard_circle_stats(db_session):
+    db_session.info.pop('circle_stats_deltas', None)
+    db_session.info.pop('circle_stats_new_reports', None)
+
+def rebuild_circle_stats(days=CIRCLE_STATS_REBUILD_DAYS):
+    """إعادة حساب الملخصات اليومية للحلقات لآخر عدد من الأيام من التقارير والحضور"""
+    since = datetime.now().date() - timedelta(days=days - 1)
+    CircleDailyStats.query.filter(CircleDailyStats.date >= since).delete(synchronize_session=False)
+    totals = {}
+    attendance_rows = db.session.query(
+        Student.circle_id, Attendance.date, func.count(Attendance.id), func.sum(case((Attendance.status == 'حاضر', 1), else_=0))
+    ).join(Student, Student.id == Attendance.student_id).filter(
+        Attendance.date >= since, Student.circle_id.isnot(None)
+    ).group_by(Student.circle_id, Attendance.date)
+    for circle_id, day, marked, present in attendance_rows:
+        row = totals.setdefault((circle_id, day), dict.fromkeys(CIRCLE_STATS_FIELDS, 0))
+        row['attendance_marked'], row['present_count'] = marked, present or 0
+    report_rows = db.session.query(
+        Report.circle_id, Report.date, func.count(Report.id), func.count(func.distinct(Report.student_id)),
+        func.sum(func.max(Report.to_verse - Report.from_verse + 1, 0))
+    ).filter(Report.date >= since, Report.circle_id.isnot(None)).group_by(Report.circle_id, Report.date)
+    for circle_id, day, reports, students, verses in report_rows:
+        row = totals.setdefault((circle_id, day), dict.fromkeys(CIRCLE_STATS_FIELDS, 0))
+        row['reports_count'], row['reported_students'], row['verses_count'] = reports, students, verses or 0
+    db.session.bulk_insert_mappings(CircleDailyStats, [dict(circle_id=circle_id, date=day, **fields)
+                                                       for (circle_id, day), fields in totals.items()])
+    return len(totals)
+
+def get_teacher_dashboard(circle_ids):
+    """لوحة المعلم من الملخصات اليومية: حضور اليوم، والتقارير المتبقية، وآيات الأسبوع، والطلاب المعرّضون للخطر لكل حلقة"""
+    today = datetime.now().date()
+    week_start = today - timedelta(days=today.weekday())
+    circles = Circle.query.filter(Circle.id.in_(circle_ids)).order_by(Circle.id).all()
+    students = dict(db.session.query(Student.circle_id, func.count(Student.id)).filter(
+        Student.circle_id.in_(circle_ids), Student.is_active.is_(True)).group_by(Student.circle_id))
+    stats = CircleDailyStats.query.filter(CircleDailyStats.circle_id.in_(circle_ids),
+                                          CircleDailyStats.date >= min(week_start, today)).all()
+    at_risk = at_risk_students(circle_ids)
+    summary = []
+    for circle in circles:
+        today_stats = next((s for s in stats if s.circle_id == circle.id and s.date == today), None)
+        total = students.get(circle.id, 0)
+        marked = today_stats.attendance_marked if today_stats else 0
+        present = today_stats.present_count if today_stats else 0
+        reported = today_stats.reported_students if today_stats else 0
+        summary.append({
+            'circle': circle,
+            'students': total,
+            'attendance_marked': marked,
+            'attendance_completion': round(min(marked, total) * 100 / total) if total else 0,
+            'present': present,
+            'reports_today': today_stats.reports_count if today_stats else 0,
+            'pending_reports': max(0, present - reported),
+            'weekly_verses': sum(s.verses_count for s in stats if s.circle_id == circle.id),
+            'at_risk': [(risk, name) for risk, name in at_risk if risk.circle_id == circle.id],
+        })
+    return summary
+
+@app.cli.command('rebuild-circle-stats')
+@click.option('--days', default=CIRCLE_STATS_REBUILD_DAYS, show_default=True)
+def rebuild_circle_stats_command(days):
+    """إعادة بناء الملخصات اليومية للحلقات"""
+    count = rebuild_circle_stats(days)
+    db.session.commit()
+    click.echo(f'rebuilt {count} circle/day rows')
+
+# ---------- 33.  MULTI-TENANCY ----------
+# يُحدَّد المركز من النطاق الفرعي (TENANT_DOMAIN) أو من بادئة المسار /c/<slug>/.
+# بادئة المسار تُنقل إلى SCRIPT_NAME فتولّد url_for روابط المركز تلقائياً دون تعديل القوالب.
+class TenantMiddleware:
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        match = re.match(r'^/c/([^/]+)(/.*)?$', path)
+        if match:
+            environ['quran.tenant'] = match.group(1)
+            environ['SCRIPT_NAME'] = environ.get('SCRIPT_NAME', '') + '/c/' + match.group(1)
+            environ['PATH_INFO'] = match.group(2) or '/'
+        elif app.config['TENANT_DOMAIN']:
+            host = environ.get('HTTP_HOST', '').split(':')[0].lower()
+            suffix = '.' + app.config['TENANT_DOMAIN'].lower()
+            if host.endswith(suffix):
+                environ['quran.tenant'] = host[:-len(suffix)]
+        return self.wsgi_app(environ, start_response)
+
+app.wsgi_app = TenantMiddleware(app.wsgi_app)
+
+@app.before_request
+def resolve_tenant():
+    slug = request.environ.get('quran.tenant')
+    g.tenant = None
+    if slug:
+        if not TENANT_SLUG_PATTERN.match(slug) or not os.path.exists(tenant_database_path(slug)):
+            abort(404)
+        g.tenant = slug
+
+def tenants():
+    directory = app.config['TENANTS_DIR']
+    if not os.path.isdir(directory):
+        return []
+    return sorted(name for name in os.listdir(directory)
+                  if TENANT_SLUG_PATTERN.match(name) and os.path.exists(tenant_database_path(name)))
+
+def init_tenant_schema():
+    """إنشاء الجداول والفهارس والإعدادات والمسؤول الافتراضي لقاعدة المركز الحالي إن لم تكن موجودة"""
+    engine = db.session.get_bind()
+    inspector = inspect(engine)
+    if inspector.has_table('notification'):
+        notification_columns = [col['name'] for col in inspector.get_columns('notification')]
+        for column, ddl in (('digest_key', 'VARCHAR(100)'), ('digest_count', 'INTEGER DEFAULT 1')):
+            if column not in notification_columns:
+                db.session.execute(text(f'ALTER TABLE notification ADD COLUMN {column} {ddl}'))
+    db.metadata.create_all(engine)
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
+    if not Settings.query.first():
+        db.session.add(Settings())
+    if not User.query.filter_by(role='admin').first():
+        db.session.add(User(username='admin', password=generate_password_hash('admin123'), name='المسؤول', role='admin'))
+    ensure_search_index()
+    db.session.commit()
+
+@app.cli.command('init-tenant')
+@click.argument('slug')
+@click.option('--site-name', help='اسم المركز في الإعدادات')
+def init_tenant_command(slug, site_name):
+    """إنشاء مركز جديد بقاعدة بيانات مستقلة (أو ترقية جداول مركز موجود)"""
+    if not TENANT_SLUG_PATTERN.match(slug):
+        raise click.BadParameter('أحرف إنجليزية صغيرة وأرقام وشرطة فقط', param_hint='slug')
+    os.makedirs(os.path.dirname(tenant_database_path(slug)), exist_ok=True)
+    g.tenant = slug
+    init_tenant_schema()
+    if site_name:
+        Settings.query.first().site_name = site_name
+        db.session.commit()
+    click.echo(f'tenant {slug}: {tenant_database_path(slug)}')
+
+@app.cli.command('list-tenants')
+def list_tenants_command():
+    """عرض المراكز المسجلة"""
+    for slug in tenants():
+        click.echo(slug)
+
+# ---------- 34.  SEARCH ----------
+# بحث نصي عبر جداول FTS5: الأشخاص (الطلاب وأولياء الأمور) مرتبين بالصلة، والتقارير (السورة والملاحظات)
+# من الأحدث، فيتوقف البحث عند الحد المطلوب دون ترتيب عشرات آلاف التقارير المطابقة.
+# النصوص تُوحَّد بـ normalize_arabic عند الفهرسة والبحث، ويُضاف لكل كلمة تبدأ بـ"ال" شكلها دون أداة التعريف.
+# رقم الصف = المعرّف × 4 + نوع السجل، فيُحدَّث أو يُحذف سجل الفهرس مباشرة دون مسح الجدول.
+SEARCH_KINDS = {'student': 1, 'parent': 2, 'report': 3}
+SEARCH_KIND_NAMES = {code: kind for kind, code in SEARCH_KINDS.items()}
+SEARCH_MODELS = {Student: 'student', Parent: 'parent', Report: 'report'}
+SEARCH_TABLES = {'student': 'search_people', 'parent': 'search_people', 'report': 'search_reports'}
+SEARCH_TABLE_ORDER = {'search_people': 'rank', 'search_reports': 'rowid DESC'}
+SEARCH_INDEX_DDL = ("CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING fts5("
+                    "body, title UNINDEXED, subtitle UNINDEXED, tokenize='unicode61', prefix='2 3')")
+SEARCH_BATCH_SIZE = 2000
+search_ready_engines = set()
+
+def search_terms(*values):
+    words = re.findall(r'\w+', normalize_arabic(' '.join(str(v) for v in values if v)))
+    words += [word[2:] for word in words if word.startswith('ال') and len(word) > 4]
+    return ' '.join(words)
+
+def search_rowid(kind, ref_id):
+    return ref_id * 4 + SEARCH_KINDS[kind]
+
+def search_documents(kind, ids=None):
+    """سجلات الفهرس (rowid, body, title, subtitle) لنوع معيّن، لكل السجلات أو لمعرّفات محددة"""
+    if kind == 'student':
+        query = db.session.query(Student.id, Student.name, Circle.name).outerjoin(Circle, Circle.id == Student.circle_id)
+        if ids is not None:
+            query = query.filter(Student.id.in_(ids))
+        for student_id, name, circle_name in query:
+            yield search_rowid(kind, student_id), search_terms(name), name, circle_name or ''
+    elif kind == 'parent':
+        query = db.session.query(Parent.id, Parent.name, Parent.phone)
+        if ids is not None:
+            query = query.filter(Parent.id.in_(ids))
+        for parent_id, name, phone in query:
+            yield search_rowid(kind, parent_id), search_terms(name, phone), name, phone or ''
+    else:
+        query = db.session.query(Report.id, Report.surah, Report.from_verse, Report.to_verse, Report.date, Report.notes)
+        if ids is not None:
+            query = query.filter(Report.id.in_(ids))
+        for report_id, surah, from_verse, to_verse, day, notes in query:
+            yield (search_rowid(kind, report_id), search_terms(surah, notes),
+                   f'{surah} {from_verse}-{to_verse}', f'{day.isoformat() if day else ""} {notes or ""}'.strip())
+
+def write_search_documents(connection, kind, documents):
+    statement = text(f'INSERT INTO {SEARCH_TABLES[kind]} (rowid, body, title, subtitle) VALUES (:rowid, :body, :title, :subtitle)')
+    batch = []
+    for rowid, body, title, subtitle in documents:
+        batch.append({'rowid': rowid, 'body': body, 'title': title, 'subtitle': subtitle})
+        if len(batch) >= SEARCH_BATCH_SIZE:
+            connection.execute(statement, batch)
+            batch = []
+    if batch:
+        connection.execute(statement, batch)
+
+def rebuild_search_index():
+    """إعادة بناء فهرس البحث بالكامل"""
+    connection = db.session.connection()
+    for table in SEARCH_TABLE_ORDER:
+        connection.exec_driver_sql(SEARCH_INDEX_DDL.format(table=table))
+        connection.exec_driver_sql(f'DELETE FROM {table}')
+    total = 0
+    for kind in SEARCH_KINDS:
+        documents = list(search_documents(kind))
+        write_search_documents(connection, kind, documents)
+        total += len(documents)
+    for table in SEARCH_TABLE_ORDER:
+        connection.exec_driver_sql(f"INSERT INTO {table} ({table}) VALUES ('optimize')")
+    search_ready_engines.add(connection.engine)
+    return total
+
+def ensure_search_index():
+    # يُنشأ الفهرس ويُملأ عند أول استخدام لقاعدة لم تُفهرس بعد (مرة واحدة لكل قاعدة في كل عملية)
+    connection = db.session.connection()
+    if connection.engine in search_ready_engines:
+        return
+    existing = {name for (name,) in connection.exec_driver_sql("SELECT name FROM sqlite_master WHERE name LIKE 'search_%'")}
+    if not existing.issuperset(SEARCH_TABLE_ORDER):
+        rebuild_search_index()
+    search_ready_engines.add(connection.engine)
+
+@event.listens_for(OrmSession, 'after_flush')
+def collect_search_changes(db_session, flush_context):
+    changes = db_session.info.setdefault('search_changes', {})
+    for obj in list(db_session.new) + list(db_session.dirty) + list(db_session.deleted):
+        kind = SEARCH_MODELS.get(type(obj))
+        if kind and obj.id is not None:
+            changes.setdefault(kind, set()).add(obj.id)
+
+@event.listens_for(OrmSession, 'before_commit')
+def apply_search_changes(db_session):
+    if db_session.new or db_session.dirty or db_session.deleted:
+        db_session.flush()
+    changes = db_session.info.pop('search_changes', None)
+    if not changes:
+        return
+    ensure_search_index()
+    connection = db_session.connection()
+    for kind, ids in changes.items():
+        rowids = [search_rowid(kind, ref_id) for ref_id in ids]
+        connection.execute(text(f'DELETE FROM {SEARCH_TABLES[kind]} WHERE rowid IN (SELECT value FROM json_each(:rowids))'),
+                           {'rowids': json.dumps(rowids)})
+        write_search_documents(connection, kind, search_documents(kind, ids))
+
+@event.listens_for(OrmSession, 'after_rollback')
+def discard_search_changes(db_session):
+    db_session.info.pop('search_changes', None)
+
+def search_index(query_text, kinds=None, limit=10):
+    words = re.findall(r'\w+', normalize_arabic(query_text))
+    if not words:
+        return []
+    ensure_search_index()
+    match = ' '.join(f'"{word}"*' for word in words)
+    kinds = kinds or list(SEARCH_KINDS)
+    rows = []
+    for table, order in SEARCH_TABLE_ORDER.items():
+        codes = [str(SEARCH_KINDS[kind]) for kind in kinds if SEARCH_TABLES[kind] == table]
+        if not codes or len(rows) >= limit:
+            continue
+        rows += db.session.execute(text(
+            f'SELECT rowid, title, subtitle FROM {table} WHERE {table} MATCH :match AND rowid % 4 IN ({", ".join(codes)}) '
+            f'ORDER BY {order} LIMIT :limit'), {'match': match, 'limit': limit - len(rows)}).all()
+    results = []
+    for rowid, title, subtitle in rows:
+        kind, ref_id = SEARCH_KIND_NAMES[rowid % 4], rowid // 4
+        url = {'student': url_for('student_reports', student_id=ref_id),
+               'parent': url_for('parents'),
+               'report': url_for('edit_report', report_id=ref_id)}[kind]
+        results.append({'kind': kind, 'id': ref_id, 'title': title, 'subtitle': subtitle, 'url': url})
+    return results
+
+def search_kinds_arg():
+    kinds = [kind for kind in request.args.get('kind', '').split(',') if kind in SEARCH_KINDS]
+    return kinds or None
+
+@app.route('/search')
+@require_login
+def search():
+    if current_user().is_parent:
+        flash('ليس لديك صلاحية للوصول إلى هذه الصفحة', 'error')
+        return redirect(url_for('parent_dashboard'))
+    query_text = request.args.get('q', '').strip()
+    results = search_index(query_text, search_kinds_arg(), limit=50) if query_text else []
+    return render_template('search.html', query_text=query_text, results=results)
+
+@app.route('/search/suggest')
+@require_login
+def search_suggest():
+    if current_user().is_parent:
+        return jsonify({'error': 'forbidden'}), 403
+    limit = max(1, min(request.args.get('limit', 8, type=int), 20))
+    return jsonify({'results': search_index(request.args.get('q', ''), search_kinds_arg(), limit)})
+
+@app.cli.command('rebuild-search')
+def rebuild_search_command():
+    """إعادة بناء فهرس البحث"""
+    count = rebuild_search_index()
+    db.session.commit()
+    click.echo(f'indexed {count} documents')
+
+# ---------- 35.  NOTIFICATION SERVICE ----------
+# الإشعارات تُجمع أثناء المعاملة وتُكتب دفعة واحدة قبل الـ commit دون commit إضافي.
+# إشعارات الملخص (digest_key) تُدمج في إشعار واحد غير مقروء لكل مفتاح، مثل تقارير الطالب في يوم واحد.
+NOTIFICATION_READ_RETENTION_DAYS = 30
+NOTIFICATION_UNREAD_RETENTION_DAYS = 180
+
+def notify(title, message, user_id=None, parent_id=None, digest_key=None, fields=None):
+    """إضافة إشعار لمستخدم أو لحساب ولي أمر؛ مع digest_key يكون النص قالباً يُنسَّق عند التسليم بـ {count}
+    (عدد العناصر المدمجة) وبقيم fields، فلا تُفسَّر الأقواس في الأسماء المدرجة"""
+    if user_id or parent_id:
+        db.session.info.setdefault('pending_notifications', []).append(
+            {'user_id': user_id, 'parent_id': parent_id, 'title': title, 'message': message, 'digest_key': digest_key,
+             'fields': fields or {}})
+
+def notify_report(student, day):
+    notify('تقارير جديدة', 'تم إضافة {count} تقرير للطالب "{name}" بتاريخ {day}.', parent_id=student.parent_id,
+           digest_key=f'reports:{student.id}:{day}', fields={'name': student.name, 'day': day})
+
+@event.listens_for(OrmSession, 'before_commit')
+def deliver_notifications(db_session):
+    if db_session.new or db_session.dirty or db_session.deleted:
+        db_session.flush()
+    pending = db_session.info.pop('pending_notifications', None)
+    if not pending:
+        return
+    parent_ids = {item['parent_id'] for item in pending if item['parent_id']}
+    parent_users = dict(db_session.query(Parent.id, Parent.user_id).filter(Parent.id.in_(parent_ids))) if parent_ids else {}
+    inserts, digests = [], {}
+    for item in pending:
+        user_id = item['user_id'] or parent_users.get(item['parent_id'])
+        if not user_id:
+            continue
+        if item['digest_key']:
+            digest = digests.setdefault((user_id, item['digest_key']), dict(item, user_id=user_id, count=0))
+            digest['count'] += 1
+        else:
+            inserts.append({'user_id': user_id, 'title': item['title'], 'message': item['message']})
+    connection = db_session.connection()
+    if digests:
+        existing = db_session.query(Notification.id, Notification.user_id, Notification.digest_key, Notification.digest_count).filter(
+            Notification.digest_key.in_({key for user_id, key in digests}), Notification.is_read.is_(False)).all()
+        updates = []
+        for notification_id, user_id, key, count in existing:
+            digest = digests.pop((user_id, key), None)
+            if digest:
+                total = (count or 1) + digest['count']
+                updates.append({'notification_id': notification_id, 'digest_count': total,
+                                'message': digest['message'].format(count=total, **digest['fields']), 'created_at': datetime.now()})
+        if updates:
+            table = Notification.__table__
+            connection.execute(table.update().where(table.c.id == bindparam('notification_id')).values(
+                digest_count=bindparam('digest_count'), message=bindparam('message'), created_at=bindparam('created_at')), updates)
+        for (user_id, key), digest in digests.items():
+            inserts.append({'user_id': user_id, 'title': digest['title'], 'message': digest['message'].format(count=digest['count'], **digest['fields']),
+                            'digest_key': key, 'digest_count': digest['count']})
+    if inserts:
+        connection.execute(Notification.__table__.insert(), inserts)
+
+@event.listens_for(OrmSession, 'after_rollback')
+def discard_notifications(db_session):
+    db_session.info.pop('pending_notifications', None)
+
+def mark_notifications_read(user_id, ids=None):
+    """تعليم إشعارات المستخدم كمقروءة بعبارة واحدة، كلها أو معرّفات محددة"""
+    query = Notification.query.filter(Notification.user_id == user_id, Notification.is_read.is_(False))
+    if ids is not None:
+        query = query.filter(Notification.id.in_(ids))
+    return query.update({'is_read': True}, synchronize_session=False)
+
+def compact_notifications(read_days=NOTIFICATION_READ_RETENTION_DAYS, unread_days=NOTIFICATION_UNREAD_RETENTION_DAYS):
+    """حذف الإشعارات المقروءة القديمة وغير المقروءة القديمة جداً"""
+    now = datetime.now()
+    read = Notification.query.filter(Notification.is_read.is_(True),
+                                     Notification.created_at < now - timedelta(days=read_days)).delete(synchronize_session=False)
+    unread = Notification.query.filter(Notification.is_read.is_(False),
+                                       Notification.created_at < now - timedelta(days=unread_days)).delete(synchronize_session=False)
+    return read, unread
+
+@app.route('/notifications/mark_read', methods=['POST'])
+@require_login
+def mark_notifications_read_route():
+    ids = request.form.getlist('ids', type=int) or None
+    count = mark_notifications_read(current_user().id, ids)
+    db.session.commit()
+    flash(f'تم تعليم {count} إشعار كمقروء', 'success')
+    return redirect(url_for('notifications'))
+
+@app.route('/api/v1/notifications/read', methods=['POST'])
+@require_api_login
+def api_mark_notifications_read():
+    payload = request.get_json(silent=True) or {}
+    ids = payload.get('ids')
+    if ids is not None and not (isinstance(ids, list) and all(isinstance(i, int) for i in ids)):
+        return jsonify({'error': 'invalid_ids'}), 400
+    count = mark_notifications_read(current_user().id, ids)
+    db.session.commit()
+    return jsonify({'updated': count})
+
+@app.cli.command('compact-notifications')
+@click.option('--read-days', default=NOTIFICATION_READ_RETENTION_DAYS, show_default=True)
+@click.option('--unread-days', default=NOTIFICATION_UNREAD_RETENTION_DAYS, show_default=True)
+def compact_notifications_command(read_days, unread_days):
+    """حذف الإشعارات القديمة حسب مدة الاحتفاظ"""
+    read, unread = compact_notifications(read_days, unread_days)
+    db.session.commit()
+    click.echo(f'deleted {read} read and {unread} unread notifications')
+
+# ---------- 36.  AUDIT LOG ----------
+# سجل تغييرات للإضافة فقط: كل تعديل أو حذف أو إضافة عبر الجلسة يُجمع أثناء الـ flush بقيم الحقول
+# قبل التعديل وبعده، ويُكتب دفعة واحدة قبل الـ commit. السجلات القديمة تُنقل إلى ملفات مضغوطة.
+AUDITED_MODELS = {Report: 'report', Student: 'student', Attendance: 'attendance', Settings: 'settings',
+                  Circle: 'circle', User: 'user', Parent: 'parent', Holiday: 'holiday'}
+AUDIT_HIDDEN_FIELDS = {'password'}
+AUDIT_RETENTION_DAYS = 90
+AUDIT_PAGE_SIZE = 100
+
+def audit_value(name, value):
+    return '***' if name in AUDIT_HIDDEN_FIELDS and value is not None else value
+
+def audit_changes(obj, action):
+    state = inspect(obj)
+    changes = {}
+    for attr in state.mapper.column_attrs:
+        name = attr.key
+        if action == 'update':
+            history = state.attrs[name].history
+            if history.has_changes():
+                old = history.deleted[0] if history.deleted else None
+                new = history.added[0] if history.added else None
+                if old != new:
+                    changes[name] = [audit_value(name, old), audit_value(name, new)]
+        elif action == 'delete':
+            changes[name] = audit_value(name, getattr(obj, name))
+    return changes
+
+@event.listens_for(OrmSession, 'after_flush')
+def collect_audit_entries(db_session, flush_context):
+    user_id = session.get('user_id') if has_request_context() else None
+    now = datetime.now()
+    entries = db_session.info.setdefault('audit_entries', [])
+    for obj, action in [(o, 'create') for o in db_session.new] + \
+                       [(o, 'update') for o in db_session.dirty if db_session.is_modified(o)] + \
+                       [(o, 'delete') for o in db_session.deleted]:
+        entity = AUDITED_MODELS.get(type(obj))
+        if not entity:
+            continue
+        changes = audit_changes(obj, action)
+        if action == 'update' and not changes:
+            continue
+        entries.append({'changed_at': now, 'user_id': user_id, 'entity': entity, 'entity_id': obj.id, 'action': action,
+                        'changes': json.dumps(changes, ensure_ascii=False, default=str, separators=(',', ':')) if changes else None})
+
+@event.listens_for(OrmSession, 'before_commit')
+def write_audit_entries(db_session):
+    if db_session.new or db_session.dirty or db_session.deleted:
+        db_session.flush()
+    entries = db_session.info.pop('audit_entries', None)
+    if entries:
+        db_session.connection().execute(AuditLog.__table__.insert(), entries)
+
+@event.listens_for(OrmSession, 'after_rollback')
+def discard_audit_entries(db_session):
+    db_session.info.pop('audit_entries', None)
+
+def audit_segments_dir():
+    folder = os.path.join(tenant_data_dir(), 'audit')
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+def audit_entry_dict(entry):
+    return {'id': entry.id, 'changed_at': entry.changed_at.isoformat(timespec='seconds'), 'user_id': entry.user_id,
+            'entity': entry.entity, 'entity_id': entry.entity_id, 'action': entry.action,
+            'changes': json.loads(entry.changes) if entry.changes else None}
+
+def rotate_audit_log(keep_days=AUDIT_RETENTION_DAYS):
+    """نقل السجلات الأقدم من مدة الاحتفاظ إلى ملف JSON-lines مضغوط ثم حذفها من الجدول"""
+    cutoff = datetime.now() - timedelta(days=keep_days)
+    last_id = db.session.query(func.max(AuditLog.id)).filter(AuditLog.changed_at < cutoff).scalar()
+    if not last_id:
+        return None
+    entries = AuditLog.query.filter(AuditLog.id <= last_id).order_by(AuditLog.id)
+    first_id = None
+    path = os.path.join(audit_segments_dir(), f'audit-{last_id:010d}.jsonl.gz')
+    with gzip.open(path + '.tmp', 'wt', encoding='utf-8') as segment:
+        for entry in entries.yield_per(1000):
+            first_id = first_id or entry.id
+            segment.write(json.dumps(audit_entry_dict(entry), ensure_ascii=False, separators=(',', ':')) + '\n')
+    final_path = os.path.join(os.path.dirname(path), f'audit-{first_id:010d}-{last_id:010d}.jsonl.gz')
+    os.replace(path + '.tmp', final_path)
+    AuditLog.query.filter(AuditLog.id <= last_id).delete(synchronize_session=False)
+    return final_path
+
+@app.route('/audit_log')
+@require_role('admin')
+def audit_log():
+    """آخر التغييرات مع التصفح للأقدم عبر مؤشر المعرّف (before)"""
+    query = AuditLog.query
+    entity = request.args.get('entity')
+    entity_id = request.args.get('entity_id', type=int)
+    before = request.args.get('before', type=int)
+    if entity:
+        query = query.filter(AuditLog.entity == entity)
+        if entity_id:
+            query = query.filter(AuditLog.entity_id == entity_id)
+    if request.args.get('user_id', type=int):
+        query = query.filter(AuditLog.user_id == request.args.get('user_id', type=int))
+    if before:
+        query = query.filter(AuditLog.id < before)
+    entries = query.order_by(AuditLog.id.desc()).limit(AUDIT_PAGE_SIZE + 1).all()
+    has_more = len(entries) > AUDIT_PAGE_SIZE
+    entries = entries[:AUDIT_PAGE_SIZE]
+    user_ids = {entry.user_id for entry in entries if entry.user_id}
+    users = dict(db.session.query(User.id, User.name).filter(User.id.in_(user_ids))) if user_ids else {}
+    rows = [audit_entry_dict(entry) for entry in entries]
+    if request.args.get('format') == 'json':
+        return jsonify({'entries': rows, 'next_before': entries[-1].id if has_more else None})
+    segments = sorted(os.listdir(audit_segments_dir()), reverse=True)
+    return render_template('audit_log.html', entries=rows, users=users, entities=sorted(set(AUDITED_MODELS.values())),
+                           next_before=entries[-1].id if has_more else None, segments=segments)
+
+@app.cli.command('rotate-audit-log')
+@click.option('--keep-days', default=AUDIT_RETENTION_DAYS, show_default=True)
+def rotate_audit_log_command(keep_days):
+    """نقل سجل التغييرات الأقدم من المدة إلى ملف مضغوط في مجلد audit"""
+    path = rotate_audit_log(keep_days)
+    db.session.commit()
+    click.echo(path or 'nothing to rotate')
+
+# ---------- 37.  BACKUPS ----------
+# نسخ احتياطي أثناء التشغيل عبر واجهة النسخ في SQLite على دفعات من الصفحات، فيُفلت القفل بين
+# الدفعات ولا يتوقف الكتّاب. النسخة تُفحص ثم تُضغط، ويُحتفظ بآخر عدد منها فقط.
+BACKUP_PAGES_PER_STEP = 256
+BACKUP_STEP_SLEEP = 0.005
+BACKUP_MAX_RESTARTS = 3
+BACKUP_KEEP = 7
+BACKUP_NAME_PATTERN = re.compile(r'^backup-\d{8}-\d{6}\.db(\.gz)?$')
+
+def database_file():
+    return db.session.get_bind().url.database
+
+def backups_dir():
+    folder = os.path.join(tenant_data_dir(), 'backups')
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+def list_backups():
+    """النسخ الموجودة من الأحدث إلى الأقدم مع أحجامها"""
+    folder = backups_dir()
+    names = sorted((name for name in os.listdir(folder) if BACKUP_NAME_PATTERN.match(name)), reverse=True)
+    return [{'name': name, 'size': os.path.getsize(os.path.join(folder, name)),
+             'created_at': datetime.strptime(name[7:22], '%Y%m%d-%H%M%S')} for name in names]
+
+def check_database_file(path):
+    """فحص سلامة ملف قاعدة بيانات ووجود جداول التطبيق فيه، ويعيد رسالة الخطأ أو None"""
+    connection = sqlite3.connect(path)
+    try:
+        result = connection.execute('PRAGMA integrity_check').fetchone()[0]
+        if result != 'ok':
+            return result
+        tables = {row[0] for row in connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        missing = {'user', 'student', 'report', 'attendance'} - tables
+        return 'جداول مفقودة: ' + '، '.join(sorted(missing)) if missing else None
+    finally:
+        connection.close()
+
+class BackupRestarted(Exception):
+    pass
+
+def copy_database(source_path, target_path, pages=BACKUP_PAGES_PER_STEP):
+    """نسخ قاعدة بيانات على دفعات، ويعيد عدد الصفحات المنسوخة.
+    كل كتابة من اتصال آخر تعيد النسخ من البداية، فإن تكرر ذلك تُنسخ القاعدة في خطوة واحدة قصيرة"""
+    progress = {'pages': 0, 'remaining': None, 'restarts': 0}
+    def report(status, remaining, total):
+        if progress['remaining'] is not None and remaining > progress['remaining']:
+            progress['restarts'] += 1
+            if progress['restarts'] > BACKUP_MAX_RESTARTS:
+                raise BackupRestarted()
+        progress.update(pages=total, remaining=remaining)
+    source, target = sqlite3.connect(source_path, timeout=30), sqlite3.connect(target_path)
+    try:
+        try:
+            source.backup(target, pages=pages, progress=report, sleep=BACKUP_STEP_SLEEP)
+        except BackupRestarted:
+            source.backup(target, pages=-1, progress=report)
+    finally:
+        target.close()
+        source.close()
+    return progress['pages']
+
+def create_backup(compress=True, keep=BACKUP_KEEP, pages=BACKUP_PAGES_PER_STEP):
+    """إنشاء نسخة احتياطية مفحوصة (ومضغوطة) وحذف ما زاد عن العدد المحفوظ (keep=None دون حذف)؛ يعيد تفاصيل النسخة"""
+    started = time.perf_counter()
+    name = datetime.now().strftime('backup-%Y%m%d-%H%M%S.db')
+    path = os.path.join(backups_dir(), name)
+    copied = copy_database(database_file(), path + '.tmp', pages)
+    copy_seconds = time.perf_counter() - started
+    error = check_database_file(path + '.tmp')
+    if error:
+        os.remove(path + '.tmp')
+        raise RuntimeError(f'فشل فحص النسخة: {error}')
+    size = os.path.getsize(path + '.tmp')
+    if compress:
+        with open(path + '.tmp', 'rb') as source, gzip.open(path + '.gz.tmp', 'wb', compresslevel=6) as target:
+            shutil.copyfileobj(source, target, 1024 * 1024)
+        os.remove(path + '.tmp')
+        path += '.gz'
+    os.replace(path + '.tmp', path)
+    if keep is not None:
+        for old in list_backups()[keep:]:
+            os.remove(os.path.join(backups_dir(), old['name']))
+    return {'name': os.path.basename(path), 'pages': copied, 'size': size, 'stored_size': os.path.getsize(path),
+            'copy_seconds': round(copy_seconds, 3), 'total_seconds': round(time.perf_counter() - started, 3)}
+
+def restore_backup(name):
+    """استعادة نسخة بعد فحصها إلى قاعدة المركز الحالي، مع نسخة احتياطية من الحالة الحالية أولاً"""
+    if not BACKUP_NAME_PATTERN.match(name) or not os.path.exists(os.path.join(backups_dir(), name)):
+        raise RuntimeError(f'النسخة غير موجودة: {name}')
+    source = os.path.join(backups_dir(), name)
+    restored = os.path.join(backups_dir(), 'restore.tmp')
+    if name.endswith('.gz'):
+        with gzip.open(source, 'rb') as compressed, open(restored, 'wb') as target:
+            shutil.copyfileobj(compressed, target, 1024 * 1024)
+    else:
+        shutil.copyfile(source, restored)
+    try:
+        error = check_database_file(restored)
+        if error:
+            raise RuntimeError(f'فشل فحص النسخة: {error}')
+        # دون تدوير: قد تكون النسخة المستعادة أقدم النسخ فتُحذف قبل انتهاء الاستعادة
+        safety = create_backup(keep=None)
+        db.session.remove()
+        db.session.get_bind().dispose()
+        copy_database(restored, database_file(), pages=-1)
+        # رقم إصدار القوائم في النسخة المستعادة قد يطابق المخزّن
+        rosters.invalidate()
+    finally:
+        os.remove(restored)
+    return safety
+
+@app.route('/backups')
+@require_role('admin')
+def backups():
+    return render_template('backups.html', backups=list_backups())
+
+@app.route('/backups/create')
+@require_role('admin')
+def create_backup_route():
+    try:
+        result = create_backup()
+        flash(f"تم إنشاء النسخة {result['name']} ({result['stored_size'] // 1024} ك.ب) في {result['total_seconds']} ث", 'success')
+    except Exception as e:
+        flash(f'حدث خطأ أثناء النسخ الاحتياطي: {str(e)}', 'error')
+    return redirect(url_for('backups'))
+
+@app.route('/backups/download/<name>')
+@require_role('admin')
+def download_backup(name):
+    if not BACKUP_NAME_PATTERN.match(name):
+        abort(404)
+    return send_from_directory(backups_dir(), name, as_attachment=True)
+
+@app.cli.command('backup')
+@click.option('--keep', default=BACKUP_KEEP, show_default=True, help='عدد النسخ المحفوظة')
+@click.option('--no-compress', is_flag=True)
+@click.option('--pages', default=BACKUP_PAGES_PER_STEP, show_default=True, help='صفحات كل دفعة')
+def backup_command(keep, no_compress, pages):
+    """نسخة احتياطية أثناء التشغيل لقاعدة المركز الحالي"""
+    result = create_backup(compress=not no_compress, keep=keep, pages=pages)
+    click.echo(f"{result['name']}: {result['pages']} pages, {result['size']} bytes -> {result['stored_size']} bytes, "
+               f"copy {result['copy_seconds']}s, total {result['total_seconds']}s")
+
+@app.cli.command('list-backups')
+def list_backups_command():
+    for backup in list_backups():
+        click.echo(f"{backup['name']}\t{backup['size']}")
+
+@app.cli.command('restore-backup')
+@click.argument('name')
+@click.confirmation_option(prompt='سيتم استبدال قاعدة البيانات الحالية، هل تريد المتابعة؟')
+def restore_backup_command(name):
+    """استعادة نسخة احتياطية بعد فحصها؛ أعد تشغيل الخادم بعدها لتفريغ الذاكرة المؤقتة"""
+    safety = restore_backup(name)
+    click.echo(f"restored {name} (previous database saved as {safety['name']})")
+
+# ---------- 38.  MAINTENANCE ----------
+# صيانة دورية لكل مركز: حذف الإشعارات القديمة وأرشفة سجل التغييرات، وحذف الملفات المرفوعة التي لم
+# يعد يشير إليها طالب أو الإعدادات، وإرجاع الصفحات الفارغة (incremental vacuum) وتحديث إحصاءات المخطط.
+# تعمل من سطر الأوامر أو في خيط داخل الخادم كل MAINTENANCE_INTERVAL_HOURS ساعة، ويُحدَّث فيه فحص الطلاب المعرّضين للخطر كل عشر دقائق.
+ORPHAN_UPLOAD_MIN_AGE = 3600  # لا تُحذف الملفات الأحدث من ساعة حتى لا نسبق حفظ سجلها
+MAINTENANCE_VACUUM_PAGES = 0  # 0 = كل الصفحات الفارغة
+MAINTENANCE_LOCK_STALE = 3600
+
+@event.listens_for(Engine, 'connect')
+def set_incremental_auto_vacuum(dbapi_connection, connection_record):
+    # يسري على القواعد الجديدة فقط، أو على القديمة بعد VACUUM كامل (maintenance --full-vacuum)
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        dbapi_connection.execute('PRAGMA auto_vacuum = INCREMENTAL')
+
+def referenced_uploads():
+    names = {photo for (photo,) in db.session.query(Student.photo).filter(Student.photo.isnot(None))}
+    names |= {logo for (logo,) in db.session.query(Settings.logo).filter(Settings.logo.isnot(None))}
+    return names
+
+def purge_orphan_uploads(dry_run=False):
+    """حذف الملفات المرفوعة غير المستخدمة؛ يعيد عدد الملفات وحجمها"""
+    folder = upload_folder()
+    referenced = referenced_uploads()
+    cutoff = time.time() - ORPHAN_UPLOAD_MIN_AGE
+    removed, size = 0, 0
+    with os.scandir(folder) as entries:
+        for entry in entries:
+            if not entry.is_file() or entry.name.startswith('.') or entry.name in referenced:
+                continue
+            stat = entry.stat()
+            if stat.st_mtime > cutoff:
+                continue
+            if not dry_run:
+                os.remove(entry.path)
+            removed += 1
+            size += stat.st_size
+    return removed, size
+
+def vacuum_and_analyze(full_vacuum=False):
+    """إرجاع الصفحات الفارغة وتحديث إحصاءات المخطط؛ يعيد طريقة التفريغ والمساحة المستعادة بالبايت"""
+    path = database_file()
+    connection = sqlite3.connect(path, isolation_level=None, timeout=30)
+    try:
+        size_before = os.path.getsize(path)
+        auto_vacuum = connection.execute('PRAGMA auto_vacuum').fetchone()[0]
+        if full_vacuum:
+            # VACUUM كامل يعيد بناء الملف ويحوّله إلى الوضع التدريجي
+            connection.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            connection.execute('VACUUM')
+            mode = 'full'
+        elif auto_vacuum == 2:
+            # executescript يخطو العبارة حتى نهايتها؛ execute يحرر صفحة واحدة فقط
+            connection.executescript(f'PRAGMA incremental_vacuum({MAINTENANCE_VACUUM_PAGES})')
+            mode = 'incremental'
+        else:
+            mode = 'skipped'
+        reclaimed = size_before - os.path.getsize(path)
+        has_stats = connection.execute("SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone()
+        connection.execute('PRAGMA optimize' if has_stats else 'ANALYZE')
+        free_pages = connection.execute('PRAGMA freelist_count').fetchone()[0]
+    finally:
+        connection.close()
+    return {'vacuum': mode, 'reclaimed_bytes': reclaimed, 'free_pages': free_pages,
+            'analyze': 'optimize' if has_stats else 'analyze'}
+
+def run_maintenance(full_vacuum=False):
+    """تشغيل الصيانة لقاعدة المركز الحالي؛ يعيد تقريراً بما تم والمساحة المستعادة"""
+    started = time.perf_counter()
+    read, unread = compact_notifications()
+    segment = rotate_audit_log()
+    db.session.commit()
+    orphans, orphan_bytes = purge_orphan_uploads()
+    report = {'tenant': current_tenant(), 'notifications_deleted': read + unread,
+              'audit_segment': os.path.basename(segment) if segment else None,
+              'orphan_uploads': orphans, 'orphan_bytes': orphan_bytes}
+    report.update(vacuum_and_analyze(full_vacuum))
+    report['seconds'] = round(time.perf_counter() - started, 3)
+    report['finished_at'] = datetime.now().isoformat(timespec='seconds')
+    with open(os.path.join(tenant_data_dir(), 'maintenance.json'), 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False)
+    return report
+
+def acquire_file_lock(lock, stale_seconds=MAINTENANCE_LOCK_STALE):
+    """قفل بين العمليات بإنشاء ملف حصري؛ يعيد مساره أو None إن كانت عملية أخرى تحمله، والقفل المتروك يُزال بعد مدة"""
+    if os.path.exists(lock) and time.time() - os.path.getmtime(lock) > stale_seconds:
+        try:
+            os.remove(lock)
+        except FileNotFoundError:
+            pass
+    try:
+        os.close(os.open(lock, os.O_CREAT | os.O_EXCL))
+    except FileExistsError:
+        return None
+    return lock
+
+def maintenance_due(interval_hours):
+    """حجز تشغيل الصيانة للمركز الحالي إن حان موعدها ولم تبدأها عملية أخرى"""
+    marker = os.path.join(tenant_data_dir(), 'maintenance.json')
+    if os.path.exists(marker) and time.time() - os.path.getmtime(marker) < interval_hours * 3600:
+        return None
+    return acquire_file_lock(marker + '.lock')
+
+def maintenance_loop(interval_hours):
+    while True:
+        for tenant in [None] + tenants():
+            with app.app_context():
+                g.tenant = tenant
+                try:
+                    run_risk_job()
+                except Exception:
+                    db.session.rollback()
+                    app.logger.exception('risk scan failed for tenant %s', tenant)
+                lock = maintenance_due(interval_hours)
+                if not lock:
+                    continue
+                try:
+                    app.logger.info('maintenance: %s', run_maintenance())
+                except Exception:
+                    db.session.rollback()
+                    app.logger.exception('maintenance failed for tenant %s', tenant)
+                finally:
+                    os.remove(lock)
+        time.sleep(600)
+
+maintenance_thread = None
+
+@app.before_request
+def start_maintenance_scheduler():
+    global maintenance_thread
+    interval = app.config['MAINTENANCE_INTERVAL_HOURS']
+    if interval and maintenance_thread is None:
+        maintenance_thread = threading.Thread(target=maintenance_loop, args=(interval,), daemon=True, name='maintenance')
+        maintenance_thread.start()
+
+@app.cli.command('maintenance')
+@click.option('--full-vacuum', is_flag=True, help='VACUUM كامل (يقفل القاعدة أثناءه) ويحوّلها إلى التفريغ التدريجي')
+@click.option('--all-tenants', is_flag=True, help='تشغيلها للمركز الافتراضي ولكل المراكز')
+def maintenance_command(full_vacuum, all_tenants):
+    """صيانة قاعدة البيانات والملفات المرفوعة وطباعة المساحة المستعادة"""
+    for tenant in ([None] + tenants()) if all_tenants else [current_tenant()]:
+        g.tenant = tenant
+        report = run_maintenance(full_vacuum)
+        click.echo(f"{tenant or 'default'}: vacuum {report['vacuum']} reclaimed {report['reclaimed_bytes']} bytes, "
+                   f"{report['orphan_uploads']} orphan uploads ({report['orphan_bytes']} bytes), "
+                   f"{report['notifications_deleted']} notifications deleted, {report['analyze']}, {report['seconds']}s")
+
+# ---------- 39.  ATTENDANCE ANALYTICS ----------
+# اتجاهات الحضور وخريطة (طالب × يوم) لحلقة: استعلام واحد يعيد (الطالب، التاريخ، الحالة) دون كائنات ORM،
+# تُملأ منه مصفوفات مضغوطة (bytearray / array) ثم تُحسب المعدلات الأسبوعية والشهرية والمتحركة
+# من مجاميع تراكمية. النتيجة مخزنة لكل حلقة وفترة ومفتاحها يتضمن آخر تحديث لملخصات الحلقة.
+ATTENDANCE_CODES = {'حاضر': 1, 'غائب بعذر': 2, 'غائب بلا عذر': 3, 'هروب': 4, 'لم يسمع': 5}
+ANALYTICS_DEFAULT_DAYS = 90
+ANALYTICS_MAX_DAYS = 366
+ANALYTICS_ROLLING_DAYS = 7
+
+def bucket_rates(days, present_prefix, marked_prefix, bucket_of):
+    """تجميع الأيام المتتالية في فترات (أسبوع أو شهر) من المجاميع التراكمية"""
+    buckets, start = [], 0
+    for i in range(1, len(days) + 1):
+        if i == len(days) or bucket_of(days[i]) != bucket_of(days[start]):
+            present, marked = present_prefix[i] - present_prefix[start], marked_prefix[i] - marked_prefix[start]
+            buckets.append({'start': days[start].isoformat(), 'end': days[i - 1].isoformat(), 'present': present,
+                            'marked': marked, 'rate': round(present * 100 / marked, 1) if marked else None})
+            start = i
+    return buckets
+
+def compute_attendance_analytics(circle_id, start_date, end_date):
+    days = []
+    day = start_date
+    while day <= end_date:
+        if attendance_calendar.is_working_day(day):
+            days.append(day)
+        day += timedelta(days=1)
+    day_index = {day.toordinal(): i for i, day in enumerate(days)}
+    students = db.session.query(Student.id, Student.name).filter(
+        Student.circle_id == circle_id, Student.is_active.is_(True)).order_by(Student.name).all()
+    student_index = {student_id: i for i, (student_id, name) in enumerate(students)}
+    width = len(days)
+    heatmap = bytearray(len(students) * width)
+    present = array('I', [0]) * width
+    marked = array('I', [0]) * width
+    rows = db.session.execute(
+        db.select(Attendance.student_id, Attendance.date, Attendance.status).where(
+            Attendance.student_id.in_(list(student_index)), Attendance.date >= start_date, Attendance.date <= end_date))
+    for student_id, day, status in rows:
+        column = day_index.get(day.toordinal())
+        if column is None:
+            continue
+        code = ATTENDANCE_CODES.get(status, 0)
+        heatmap[student_index[student_id] * width + column] = code
+        marked[column] += 1
+        present[column] += code == 1
+    present_prefix, marked_prefix = array('I', [0]) * (width + 1), array('I', [0]) * (width + 1)
+    for i in range(width):
+        present_prefix[i + 1] = present_prefix[i] + present[i]
+        marked_prefix[i + 1] = marked_prefix[i] + marked[i]
+    rolling = []
+    for i in range(width):
+        first = max(0, i + 1 - ANALYTICS_ROLLING_DAYS)
+        window_marked = marked_prefix[i + 1] - marked_prefix[first]
+        rolling.append(round((present_prefix[i + 1] - present_prefix[first]) * 100 / window_marked, 1) if window_marked else None)
+    return {
+        'circle_id': circle_id,
+        'start': start_date.isoformat(),
+        'end': end_date.isoformat(),
+        'codes': {str(code): status for status, code in ATTENDANCE_CODES.items()} | {'0': None},
+        'days': [day.isoformat() for day in days],
+        'students': [{'id': student_id, 'name': name} for student_id, name in students],
+        # صف لكل طالب: رمز واحد لكل يوم دوام
+        'heatmap': [heatmap[i * width:(i + 1) * width].translate(bytes.maketrans(bytes(range(6)), b'012345')).decode('ascii')
+                    for i in range(len(students))],
+        'daily': {'present': present.tolist(), 'marked': marked.tolist(), 'rolling_rate': rolling},
+        'weekly': bucket_rates(days, present_prefix, marked_prefix, lambda day: day - timedelta(days=day.weekday())),
+        'monthly': bucket_rates(days, present_prefix, marked_prefix, lambda day: (day.year, day.month)),
+    }
+
+class AttendanceAnalyticsCache:
+    CACHE_SECONDS = 300  # تغيير حالة غياب إلى غياب آخر لا يغيّر الملخصات، فيظهر بعد هذه المدة
+    MAX_ENTRIES = 256
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def get(self, circle_id, start_date, end_date):
+        """الإصدار آخر تحديث لملخصات الحلقة، ويُقرأ حتى عند الإصابة: استعلام فهرسي واحد هو ثمن
+        ألا تُعاد نتيجة قديمة بعد كتابة من عملية أخرى"""
+        version = db.session.query(func.max(CircleDailyStats.updated_at)).filter(CircleDailyStats.circle_id == circle_id).scalar()
+        key = (current_tenant(), circle_id, start_date, end_date, version)
+        with self.lock:
+            cached = self.entries.get(key)
+            if cached and time.monotonic() - cached[1] < self.CACHE_SECONDS:
+                self.entries.move_to_end(key)
+            else:
+                cached = None
+        if cached:
+            record_cache_lookup('attendance_analytics', True)
+            return cached[0]
+        record_cache_lookup('attendance_analytics', False)
+        result = compute_attendance_analytics(circle_id, start_date, end_date)
+        with self.lock:
+            self.entries[key] = (result, time.monotonic())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.MAX_ENTRIES:
+                self.entries.popitem(last=False)
+        return result
+
+    def invalidate(self):
+        with self.lock:
+            self.entries.clear()
+
+attendance_analytics = AttendanceAnalyticsCache()
+
+@app.route('/api/v1/analytics/attendance/<int:circle_id>')
+@require_api_login
+def api_attendance_analytics(circle_id):
+    """خريطة الحضور واتجاهاته لحلقة: ?days=90 أو ?start=&end= (للمدير ومعلم الحلقة)"""
+    user = current_user()
+    if not (user.is_admin or (user.is_teacher and circle_id in user.circle_ids)):
+        return jsonify({'error': 'forbidden'}), 403
+    if not db.session.get(Circle, circle_id):
+        return jsonify({'error': 'not_found'}), 404
+    try:
+        end_date = datetime.strptime(request.args['end'], '%Y-%m-%d').date() if request.args.get('end') else datetime.now().date()
+        if request.args.get('start'):
+            start_date = datetime.strptime(request.args['start'], '%Y-%m-%d').date()
+        else:
+            start_date = end_date - timedelta(days=request.args.get('days', ANALYTICS_DEFAULT_DAYS, type=int) - 1)
+    except ValueError:
+        return jsonify({'error': 'invalid_date'}), 400
+    if start_date > end_date or (end_date - start_date).days >= ANALYTICS_MAX_DAYS:
+        return jsonify({'error': 'invalid_range', 'max_days': ANALYTICS_MAX_DAYS}), 400
+    return api_response(attendance_analytics.get(circle_id, start_date, end_date))
+
+# ---------- 40.  AT-RISK STUDENTS ----------
+# درجة خطر لكل طالب من ثلاثة مؤشرات: الغياب بلا عذر والهروب (وتزايده)، والحضور دون تسميع لعدة أيام،
+# وتراجع متوسط التقديرات. التشغيل التزايدي يعيد حساب الطلاب الذين تغيّر حضورهم أو تقاريرهم منذ آخر
+# مؤشر في sync_change فقط، والتشغيل الكامل مرة يومياً لأن النوافذ الزمنية تتحرك مع التاريخ.
+RISK_WINDOW_DAYS = 30
+RISK_NO_REPORT_DAYS = 10
+RISK_THRESHOLD = 40
+RISK_ABSENCE_STATUSES = ('غائب بلا عذر', 'هروب')
+RISK_JOB = 'student_risk'
+
+def compute_student_risks(student_ids=None):
+    """حساب درجات الخطر بثلاثة استعلامات مجمّعة لكل الطلاب النشطين أو لمجموعة منهم"""
+    today = datetime.now().date()
+    recent_start = today - timedelta(days=RISK_WINDOW_DAYS - 1)
+    prior_start = recent_start - timedelta(days=RISK_WINDOW_DAYS)
+    no_report_start = today - timedelta(days=RISK_NO_REPORT_DAYS - 1)
+    def scoped(query, column):
+        return query.filter(column.in_(student_ids)) if student_ids is not None else query
+    students = scoped(db.session.query(Student.id, Student.circle_id).filter(Student.is_active.is_(True)), Student.id).all()
+    attendance = {row[0]: row[1:] for row in scoped(db.session.query(
+        Attendance.student_id,
+        func.sum(case((Attendance.status.in_(RISK_ABSENCE_STATUSES) & (Attendance.date >= recent_start), 1), else_=0)),
+        func.sum(case((Attendance.status.in_(RISK_ABSENCE_STATUSES) & (Attendance.date < recent_start), 1), else_=0)),
+        func.sum(case(((Attendance.status == 'حاضر') & (Attendance.date >= no_report_start), 1), else_=0)),
+    ).filter(Attendance.date >= prior_start, Attendance.date <= today), Attendance.student_id).group_by(Attendance.student_id)}
+    points = case(*[(Report.grade == grade, value) for grade, value in GRADE_POINTS.items()], else_=None)
+    reports = {row[0]: row[1:] for row in scoped(db.session.query(
+        Report.student_id, func.max(Report.date),
+        func.avg(case((Report.date >= recent_start, points), else_=None)),
+        func.avg(case((Report.date < recent_start, points), else_=None)),
+    ).filter(Report.date >= prior_start, Report.date <= today), Report.student_id).group_by(Report.student_id)}
+    risks = {}
+    for student_id, circle_id in students:
+        recent_absences, prior_absences, present_days = (int(value or 0) for value in attendance.get(student_id, (0, 0, 0)))
+        last_report, recent_grade, prior_grade = reports.get(student_id, (None, None, None))
+        score, reasons = 0, []
+        if recent_absences:
+            score += 10 * recent_absences
+            reasons.append(f'{recent_absences} غياب بلا عذر أو هروب خلال {RISK_WINDOW_DAYS} يوماً')
+            if recent_absences > prior_absences and recent_absences >= 2:
+                score += 10
+                reasons.append('الغياب في تزايد')
+        if present_days and (last_report is None or last_report < no_report_start):
+            score += 30
+            reasons.append(f'حاضر دون تسميع منذ {RISK_NO_REPORT_DAYS} أيام أو أكثر')
+        if recent_grade is not None and prior_grade is not None and prior_grade - recent_grade >= 0.5:
+            score += 20
+            reasons.append('تراجع التقديرات')
+        risks[student_id] = {'student_id': student_id, 'circle_id': circle_id, 'score': min(score, 100),
+                             'recent_absences': recent_absences, 'last_report_date': last_report,
+                             'reasons': '، '.join(reasons), 'flagged': score >= RISK_THRESHOLD}
+    return risks
+
+def update_student_risks(student_ids=None):
+    """تحديث جدول الخطر وإشعار المعلم بالطلاب المصنّفين حديثاً؛ يعيد عدد من أعيد حسابهم والمصنّفين الجدد"""
+    risks = compute_student_risks(student_ids)
+    existing = StudentRisk.query
+    if student_ids is not None:
+        existing = existing.filter(StudentRisk.student_id.in_(student_ids))
+    previous = {student_id: flagged_at for student_id, flagged_at in existing.with_entities(StudentRisk.student_id, StudentRisk.flagged_at)}
+    stale = set(previous) - set(risks)
+    if stale:
+        StudentRisk.query.filter(StudentRisk.student_id.in_(stale)).delete(synchronize_session=False)
+    now = datetime.now()
+    newly_flagged = Counter()
+    for risk in risks.values():
+        risk['updated_at'] = now
+        risk['flagged_at'] = (previous.get(risk['student_id']) or now) if risk['flagged'] else None
+        if risk['flagged_at'] == now and risk['circle_id']:
+            newly_flagged[risk['circle_id']] += 1
+    if risks:
+        statement = sqlite_insert(StudentRisk.__table__)
+        statement = statement.on_conflict_do_update(index_elements=['student_id'], set_={
+            column: getattr(statement.excluded, column)
+            for column in ('circle_id', 'score', 'recent_absences', 'last_report_date', 'reasons', 'flagged', 'flagged_at', 'updated_at')})
+        db.session.execute(statement, list(risks.values()))
+    if newly_flagged:
+        today = now.date()
+        for circle_id, teacher_id, name in db.session.query(Circle.id, Circle.teacher_id, Circle.name).filter(
+                Circle.id.in_(newly_flagged)):
+            for _ in range(newly_flagged[circle_id]):
+                notify('طلاب بحاجة إلى متابعة', 'تم رصد {count} طالب بحاجة إلى متابعة في حلقة "{circle}".',
+                       user_id=teacher_id, digest_key=f'risk:{circle_id}:{today}', fields={'circle': name})
+    return len(risks), sum(newly_flagged.values())
+
+def run_risk_job(full=False):
+    """تشغيل تزايدي من آخر مؤشر في sync_change، أو كامل إن طُلب أو كان أول تشغيل في اليوم.
+    يعيد None إن كانت عملية أخرى تشغّله للمركز نفسه، حتى لا يُحسب المدى نفسه ويتكرر إشعار المعلمين."""
+    lock = acquire_file_lock(os.path.join(tenant_data_dir(), 'risk_job.lock'))
+    if not lock:
+        return None
+    try:
+        return score_risk_changes(full)
+    finally:
+        os.remove(lock)
+
+def score_risk_changes(full):
+    db.session.execute(sqlite_insert(JobState.__table__).values(name=RISK_JOB, cursor=0).on_conflict_do_nothing())
+    state = db.session.get(JobState, RISK_JOB)
+    latest = db.session.query(func.max(SyncChange.id)).scalar() or 0
+    today = datetime.now().date()
+    if full or state.run_date != today:
+        result = update_student_risks()
+        state.run_date = today
+    else:
+        changed = [student_id for (student_id,) in db.session.query(SyncChange.student_id).filter(
+            SyncChange.id > state.cursor, SyncChange.id <= latest).distinct()]
+        result = update_student_risks(changed) if changed else (0, 0)
+    state.cursor = latest
+    state.updated_at = datetime.now()
+    db.session.commit()
+    return result
+
+def at_risk_students(circle_ids):
+    return db.session.query(StudentRisk, Student.name).join(Student, Student.id == StudentRisk.student_id).filter(
+        StudentRisk.circle_id.in_(circle_ids), StudentRisk.flagged.is_(True)).order_by(StudentRisk.score.desc()).all()
+
+@app.cli.command('risk-scan')
+@click.option('--full', is_flag=True, help='إعادة حساب كل الطلاب بدل المتغيرين فقط')
+def risk_scan_command(full):
+    """تحديث درجات الخطر للطلاب وإشعار المعلمين"""
+    started = time.perf_counter()
+    result = run_risk_job(full)
+    if result is None:
+        click.echo('risk scan already running for this center')
+        return
+    scored, flagged = result
+    click.echo(f'scored {scored} students, {flagged} newly flagged in {time.perf_counter() - started:.2f}s')
+
+# ---------- 41.  REPORT CARDS ----------
+# بطاقات التقرير الشهرية بصيغة PDF (الرسم والخط في pdf_writer.py). بيانات كل البطاقات تُجلب بثلاثة
+# استعلامات، والبطاقات غير المخزنة تُرسم على مجموعة عمليات، وكل بطاقة تُحفظ باسم بصمة بياناتها فلا
+# يُعاد رسم ما لم يتغير.
+REPORT_CARD_VERSION = 1  # يُزاد عند تغيير التصميم ليُعاد رسم البطاقات المخزنة
+REPORT_CARD_POOL_MIN = 8  # أقل عدد بطاقات غير مخزنة يستحق تشغيل مجموعة العمليات
+REPORT_CARD_FONT_CANDIDATES = (
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf',
+    '/usr/share/fonts/dejavu/DejaVuSans.ttf',
+    'C:\\Windows\\Fonts\\arial.ttf',
+    '/System/Library/Fonts/Supplemental/Arial.ttf',
+)
+REPORT_CARD_STATUSES = ('حاضر', 'غائب بعذر', 'غائب بلا عذر', 'هروب', 'لم يسمع')
+
+@lru_cache(maxsize=1)
+def report_card_font():
+    for path in [app.config['REPORT_CARD_FONT']] + list(REPORT_CARD_FONT_CANDIDATES):
+        if path and os.path.exists(path):
+            return TrueTypeFont(path)
+    raise RuntimeError('لم يُعثر على خط TrueType يدعم العربية؛ اضبط REPORT_CARD_FONT')
+
+def render_report_card(card):
+    """رسم بطاقة طالب واحدة من بياناتها المجهزة مسبقاً؛ تعمل داخل عمليات المجموعة دون قاعدة البيانات"""
+    pdf = PdfDocument(report_card_font())
+    pdf.add_page()
+    right, left, green = 555, 40, (0.157, 0.475, 0.329)
+    pdf.rect(left, 782, right - left, 40, fill=green)
+    pdf.text(pdf.WIDTH / 2, 796, card['site_name'], size=18, align='center', color=(1, 1, 1))
+    pdf.text(pdf.WIDTH / 2, 755, f"بطاقة التقرير الشهري - {card['month']}", size=14, align='center', color=green)
+    y = 722
+    for label, value in (('الطالب', card['student_name']), ('الحلقة', card['circle_name'] or '-'),
+                         ('المعلم', card['teacher_name'] or '-'), ('الفترة', f"من {card['start']} إلى {card['end']}")):
+        pdf.text(right, y, f'{label}: {value}', size=12)
+        y -= 20
+    y -= 10
+    attendance = card['attendance']
+    boxes = [(status, attendance[status]) for status in REPORT_CARD_STATUSES] + [('نسبة الحضور', f"{attendance['rate']}%")]
+    box_width = (right - left) / len(boxes)
+    for i, (label, value) in enumerate(boxes):
+        x = right - (i + 1) * box_width
+        pdf.rect(x + 2, y - 42, box_width - 4, 48, fill=(0.94, 0.96, 0.95), stroke=(0.8, 0.85, 0.82))
+        pdf.text(x + box_width / 2, y - 14, value, size=14, align='center', color=green)
+        pdf.text(x + box_width / 2, y - 33, label, size=9, align='center')
+    y -= 70
+    summary = card['summary']
+    pdf.text(right, y, f"التقارير: {summary['reports']}    آيات الحفظ: {summary['memorized']}    "
+                       f"آيات المراجعة: {summary['reviewed']}    متوسط التقدير: {summary['grade_average']}", size=11)
+    y -= 25
+    columns = (('التاريخ', 95), ('السورة', 150), ('الآيات', 90), ('النوع', 80), ('التقدير', 100))
+    def table_header(y):
+        pdf.rect(left, y - 6, right - left, 22, fill=green)
+        x = right
+        for title, width in columns:
+            pdf.text(x - 6, y, title, size=11, color=(1, 1, 1))
+            x -= width
+        return y - 22
+    y = table_header(y)
+    if not card['reports']:
+        pdf.text(pdf.WIDTH / 2, y, 'لا توجد تقارير في هذه الفترة', size=11, align='center')
+    for i, (day, surah, from_verse, to_verse, kind, grade) in enumerate(card['reports']):
+        if y < 50:
+            pdf.add_page()
+            y = table_header(800)
+        if i % 2:
+            pdf.rect(left, y - 6, right - left, 20, fill=(0.96, 0.96, 0.96))
+        x = right
+        for value, (title, width) in zip((day, surah, f'{from_verse}-{to_verse}', kind, grade or '-'), columns):
+            pdf.text(x - 6, y, value, size=10)
+            x -= width
+        y -= 20
+    return pdf.output()
+
+def report_card_period(month=None):
+    """الشهر بصيغة YYYY-MM (الحالي افتراضياً) وأول يوم فيه وآخره"""
+    first = datetime.strptime(month, '%Y-%m').date() if month else datetime.now().date().replace(day=1)
+    last = (first.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+    return first.strftime('%Y-%m'), first, last
+
+def report_card_data(student_ids, month):
+    """بيانات بطاقات مجموعة طلاب لشهر بثلاثة استعلامات، كقواميس بسيطة قابلة للإرسال إلى عمليات أخرى"""
+    month, start, end = report_card_period(month)
+    settings_obj = Settings.query.first() or Settings()
+    teacher = db.aliased(User)
+    students = db.session.query(Student.id, Student.name, Circle.name, teacher.name).outerjoin(
+        Circle, Circle.id == Student.circle_id).outerjoin(teacher, teacher.id == Circle.teacher_id).filter(
+        Student.id.in_(student_ids)).order_by(Student.name).all()
+    cards = {student_id: {'version': REPORT_CARD_VERSION, 'site_name': settings_obj.site_name, 'month': month,
+                          'start': start.isoformat(), 'end': end.isoformat(), 'student_id': student_id,
+                          'student_name': name, 'circle_name': circle_name, 'teacher_name': teacher_name,
+                          'attendance': dict.fromkeys(REPORT_CARD_STATUSES, 0), 'reports': []}
+             for student_id, name, circle_name, teacher_name in students}
+    for student_id, day, surah, from_verse, to_verse, kind, grade in db.session.query(
+            Report.student_id, Report.date, Report.surah, Report.from_verse, Report.to_verse, Report.type, Report.grade).filter(
+            Report.student_id.in_(student_ids), Report.date >= start, Report.date <= end).order_by(Report.date, Report.id):
+        cards[student_id]['reports'].append((day.isoformat(), surah, from_verse, to_verse, kind, grade))
+    totals = Counter()
+    for student_id, day, status in db.session.query(Attendance.student_id, Attendance.date, Attendance.status).filter(
+            Attendance.student_id.in_(student_ids), Attendance.date >= start, Attendance.date <= end):
+        if attendance_calendar.is_working_day(day):
+            totals[student_id] += 1
+            if status in REPORT_CARD_STATUSES:
+                cards[student_id]['attendance'][status] += 1
+    for student_id, card in cards.items():
+        attendance, reports = card['attendance'], card['reports']
+        attendance['rate'] = round(attendance['حاضر'] * 100 / totals[student_id], 1) if totals[student_id] else 0
+        grades = [GRADE_POINTS[report[5]] for report in reports if report[5] in GRADE_POINTS]
+        card['summary'] = {
+            'reports': len(reports),
+            'memorized': sum(report_verses(r[2], r[3]) for r in reports if r[4] == 'حفظ'),
+            'reviewed': sum(report_verses(r[2], r[3]) for r in reports if r[4] != 'حفظ'),
+            'grade_average': round(sum(grades) / len(grades), 2) if grades else '-',
+        }
+    return list(cards.values())
+
+def generate_report_cards(student_ids, month=None, workers=None):
+    """توليد بطاقات الطلاب للشهر وإرجاع مساراتها؛ البطاقة المخزنة بنفس بصمة البيانات لا يُعاد رسمها"""
+    started = time.perf_counter()
+    cards = report_card_data(student_ids, month)
+    folder = os.path.join(tenant_data_dir(), 'report_cards', report_card_period(month)[0])
+    os.makedirs(folder, exist_ok=True)
+    paths, pending = {}, []
+    for card in cards:
+        digest = hashlib.sha256(json.dumps(card, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+        path = os.path.join(folder, f"{card['student_id']}-{digest}.pdf")
+        paths[card['student_id']] = path
+        if not os.path.exists(path):
+            pending.append((card, path))
+    report_card_font()  # تحميل الخط قبل إنشاء العمليات لترثه جاهزاً
+    if len(pending) >= REPORT_CARD_POOL_MIN and workers != 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            documents = list(pool.map(render_report_card, [card for card, path in pending], chunksize=4))
+    else:
+        documents = [render_report_card(card) for card, path in pending]
+    for (card, path), document in zip(pending, documents):
+        for old in pathlib.Path(folder).glob(f"{card['student_id']}-*.pdf"):
+            old.unlink()
+        with open(path + '.tmp', 'wb') as f:
+            f.write(document)
+        os.replace(path + '.tmp', path)
+    return paths, {'cards': len(cards), 'rendered': len(pending), 'cached': len(cards) - len(pending),
+                   'seconds': round(time.perf_counter() - started, 3)}
+
+@app.route('/report_card/<int:student_id>')
+@require_login
+def report_card(student_id):
+    user = current_user()
+    student = Student.query.get_or_404(student_id)
+    if not (user.is_admin or (user.is_teacher and student.circle_id in user.circle_ids)
+            or (user.is_parent and user.parent_id and student.parent_id == user.parent_id)):
+        flash('ليس لديك صلاحية لعرض بطاقة هذا الطالب', 'error')
+        return redirect(url_for('dashboard'))
+    try:
+        month = report_card_period(request.args.get('month'))[0]
+        paths, stats = generate_report_cards([student_id], month)
+    except (ValueError, RuntimeError) as e:
+        flash(f'تعذر إنشاء بطاقة التقرير: {str(e)}', 'error')
+        return redirect(request.referrer or url_for('dashboard'))
+    return send_file(paths[student_id], mimetype='application/pdf', download_name=f'report-card-{student_id}-{month}.pdf')
+
+@app.route('/report_cards/circle/<int:circle_id>')
+@require_login
+def circle_report_cards(circle_id):
+    user = current_user()
+    circle = Circle.query.get_or_404(circle_id)
+    if not (user.is_admin or (user.is_teacher and circle_id in user.circle_ids)):
+        flash('ليس لديك صلاحية لعرض بطاقات هذه الحلقة', 'error')
+        return redirect(url_for('dashboard'))
+    student_ids = [student_id for (student_id,) in db.session.query(Student.id).filter_by(circle_id=circle_id, is_active=True)]
+    try:
+        month = report_card_period(request.args.get('month'))[0]
+        paths, stats = generate_report_cards(student_ids, month)
+    except (ValueError, RuntimeError) as e:
+        flash(f'تعذر إنشاء بطاقات التقرير: {str(e)}', 'error')
+        return redirect(request.referrer or url_for('circles'))
+    archive = io.BytesIO()
+    # ملفات PDF مضغوطة أصلاً فتُخزن في الأرشيف دون ضغط
+    with zipfile.ZipFile(archive, 'w', zipfile.ZIP_STORED) as bundle:
+        for student_id, path in paths.items():
+            bundle.write(path, os.path.basename(path).split('-')[0] + '.pdf')
+    archive.seek(0)
+    return send_file(archive, mimetype='application/zip', as_attachment=True,
+                     download_name=f'report-cards-{circle.id}-{month}.zip')
+
+@app.cli.command('report-cards')
+@click.option('--month', help='YYYY-MM، الشهر الحالي افتراضياً')
+@click.option('--circle', 'circle_id', type=int, help='حلقة واحدة بدلاً من كل المركز')
+@click.option('--workers', type=int, help='عدد العمليات (1 للرسم في العملية نفسها)')
+@click.option('--out', type=click.Path(file_okay=False), help='نسخ البطاقات إلى هذا المجلد')
+def report_cards_command(month, circle_id, workers, out):
+    """توليد بطاقات التقرير الشهرية للمركز أو لحلقة"""
+    query = db.session.query(Student.id).filter(Student.is_active.is_(True))
+    if circle_id:
+        query = query.filter(Student.circle_id == circle_id)
+    paths, stats = generate_report_cards([student_id for (student_id,) in query], month, workers)
+    if out:
+        os.makedirs(out, exist_ok=True)
+        for student_id, path in paths.items():
+            shutil.copyfile(path, os.path.join(out, f'{student_id}.pdf'))
+    click.echo(f"{stats['cards']} cards: {stats['rendered']} rendered, {stats['cached']} cached in {stats['seconds']}s")
+
+# ---------- 42.  ROSTER CACHE ----------
+# قوائم الطلاب النشطين لكل حلقة بصيغة مضغوطة لنماذج الحضور والتقارير وتحليل التقرير الجماعي.
+# رقم الإصدار في job_state يزداد مع كل كتابة على الطلاب أو الحلقات، فتلاحظها العمليات الأخرى أيضاً.
+ROSTER_VERSION = 'roster_version'
+
+def roster_match_name(name):
+    # الصيغة التي يطابق بها التقرير الجماعي أسماء الطلاب
+    return re.sub(r'[^\w\s]', '', name or '').strip().lower()
+
+class RosterEntry:
+    __slots__ = ('id', 'name', 'match_name', 'parent_phone', 'parent_id', 'circle_id', 'circle_name')
+
+    def __init__(self, id, name, parent_phone, parent_id, circle_id, circle_name):
+        self.id = id
+        self.name = name
+        self.match_name = roster_match_name(name)
+        self.parent_phone = parent_phone
+        self.parent_id = parent_id
+        self.circle_id = circle_id
+        self.circle_name = circle_name
+
+class RosterCache:
+    """قوائم الحلقات لكل مركز مع رقم إصدارها؛ يُقرأ الرقم مرة في الطلب ويُعاد التحميل عند تغيّره"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.rosters = {}
+
+    def snapshot(self):
+        if 'roster' in g:
+            return g.roster
+        tenant = current_tenant()
+        # الإصدار يُقرأ قبل القوائم: أي كتابة بينهما تعني إعادة تحميل لاحقة لا بيانات قديمة
+        version = db.session.query(JobState.cursor).filter_by(name=ROSTER_VERSION).scalar() or 0
+        cached = self.rosters.get(tenant)
+        record_cache_lookup('roster', bool(cached and cached[0] == version))
+        if not cached or cached[0] != version:
+            cached = (version, self.load())
+            with self.lock:
+                self.rosters[tenant] = cached
+        g.roster = cached[1]
+        return g.roster
+
+    def load(self):
+        circles = {}
+        rows = db.session.query(Student.id, Student.name, Student.parent_phone, Student.parent_id, Student.circle_id,
+                                Circle.name).outerjoin(Circle, Student.circle_id == Circle.id) \
+            .filter(Student.is_active == True).order_by(Student.id)
+        for row in rows:
+            circles.setdefault(row[4], []).append(RosterEntry(*row))
+        return {circle_id: tuple(entries) for circle_id, entries in circles.items()}
+
+    def circle(self, circle_id):
+        try:
+            circle_id = int(circle_id)
+        except (TypeError, ValueError):
+            return ()
+        return self.snapshot().get(circle_id, ())
+
+    def students(self):
+        return sorted((entry for entries in self.snapshot().values() for entry in entries), key=lambda entry: entry.id)
+
+    def invalidate(self):
+        with self.lock:
+            self.rosters.clear()
+        if has_app_context():
+            g.pop('roster', None)
+
+rosters = RosterCache()
+
+@event.listens_for(OrmSession, 'after_flush')
+def collect_roster_changes(db_session, flush_context):
+    changed = list(db_session.new) + [obj for obj in db_session.dirty if db_session.is_modified(obj)] + list(db_session.deleted)
+    if any(isinstance(obj, (Student, Circle)) for obj in changed):
+        db_session.info['roster_changed'] = True
+
+@event.listens_for(OrmSession, 'before_commit')
+def bump_roster_version(db_session):
+    if db_session.new or db_session.dirty or db_session.deleted:
+        db_session.flush()
+    if not db_session.info.pop('roster_changed', None):
+        return
+    now = datetime.now()
+    statement = sqlite_insert(JobState.__table__).values(name=ROSTER_VERSION, cursor=1, updated_at=now)
+    db_session.connection().execute(statement.on_conflict_do_update(
+        index_elements=['name'], set_={'cursor': JobState.__table__.c.cursor + 1, 'updated_at': now}))
+    if has_app_context():
+        g.pop('roster', None)
+
+@event.listens_for(OrmSession, 'after_rollback')
+def discard_roster_changes(db_session):
+    db_session.info.pop('roster_changed', None)
+
+# ---------- 43.  RUN ----------
 if __name__ == '__main__':
     with app.app_context():
         # التحقق من وجود الأعمدة المفقودة وإضافتها إذا لزم الأمر
@@ -1378,9 +4548,77 @@ if __name__ == '__main__':
                 print(f"خطأ أثناء إضافة العمود user_id: {e}")
                 db.session.rollback()
         
+        # أعمدة ملخص الإشعارات
+        notification_columns = [col['name'] for col in inspector.get_columns('notification')] if inspector.has_table('notification') else []
+        for column, ddl in (('digest_key', 'VARCHAR(100)'), ('digest_count', 'INTEGER DEFAULT 1')):
+            if notification_columns and column not in notification_columns:
+                try:
+                    db.session.execute(text(f'ALTER TABLE notification ADD COLUMN {column} {ddl}'))
+                    db.session.commit()
+                    print(f"تم إضافة العمود {column} إلى جدول notification")
+                except Exception as e:
+                    print(f"خطأ أثناء إضافة العمود {column}: {e}")
+                    db.session.rollback()
+        
         # إنشاء جميع الجداول
         db.create_all()
         
+        # إنشاء الفهارس الجديدة على الجداول الموجودة مسبقاً
+        for table in db.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(db.engine, checkfirst=True)
+        
+        # تصحيح السنة الدراسية للسجلات القديمة التي حُفظت بالقيمة الثابتة '2025' بدلاً من تاريخها
+        for table_name in ('report', 'attendance', 'holiday'):
+            try:
+                year_expr = (f"CAST(CAST(strftime('%Y', date) AS INTEGER) - "
+                             f"(CAST(strftime('%m', date) AS INTEGER) < {ACADEMIC_YEAR_START_MONTH}) AS TEXT)")
+                result = db.session.execute(text(f'UPDATE {table_name} SET academic_year = {year_expr} WHERE academic_year IS NOT {year_expr}'))
+                db.session.commit()
+                if result.rowcount:
+                    print(f"تم تصحيح السنة الدراسية لـ {result.rowcount} سجل في جدول {table_name}")
+            except Exception as e:
+                print(f"خطأ أثناء تصحيح السنة الدراسية في جدول {table_name}: {e}")
+                db.session.rollback()
+        
+        # حساب تغطية الحفظ لأول مرة من التقارير الموجودة
+        if not MemorizationProgress.query.first() and Report.query.first():
+            try:
+                count = rebuild_memorization()
+                db.session.commit()
+                print(f"تم حساب تغطية الحفظ لـ {count} طالب")
+            except Exception as e:
+                print(f"خطأ أثناء حساب تغطية الحفظ: {e}")
+                db.session.rollback()
+        
+        # بناء الملخصات اليومية للحلقات لأول مرة
+        if not CircleDailyStats.query.first() and Report.query.first():
+            try:
+                count = rebuild_circle_stats()
+                db.session.commit()
+                print(f"تم بناء الملخصات اليومية للحلقات ({count} سجل)")
+            except Exception as e:
+                print(f"خطأ أثناء بناء الملخصات اليومية للحلقات: {e}")
+                db.session.rollback()
+        
+        # بناء فهرس البحث لأول مرة
+        try:
+            ensure_search_index()
+            db.session.commit()
+        except Exception as e:
+            print(f"خطأ أثناء بناء فهرس البحث: {e}")
+            db.session.rollback()
+        
+        # بناء جدول ترتيب الطلاب لأول مرة
+        if not StudentScore.query.first() and Student.query.first():
+            try:
+                count = rebuild_scores()
+                db.session.commit()
+                print(f"تم بناء جدول الترتيب ({count} سجل)")
+            except Exception as e:
+                print(f"خطأ أثناء بناء جدول الترتيب: {e}")
+                db.session.rollback()
+        
         # إنشاء إعدادات افتراضية إذا لم تكن موجودة
         if not Settings.query.first():
             try:
@@ -0,0 +1,73 @@
+"""قياس النسخ الاحتياطي أثناء الكتابة.
+
+ينشئ مركزاً تجريبياً كبيراً، ثم يأخذ نسخة احتياطية بينما يكتب خيط آخر باستمرار في قاعدة البيانات،
+ويطبع زمن النسخ والحجم قبل الضغط وبعده، وعدد الكتابات التي تمت وأطول انتظار لها أثناء النسخ:
+
+    python benchmarks/bench_backup.py
+    python benchmarks/bench_backup.py --circles 30 --years 3 --pages 1024
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='قياس النسخ الاحتياطي أثناء الكتابة')
+    parser.add_argument('--circles', type=int, default=16)
+    parser.add_argument('--students-per-circle', type=int, default=25)
+    parser.add_argument('--years', type=int, default=3)
+    parser.add_argument('--pages', type=int, default=256)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='quran-bench-')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(workdir, 'bench.db')
+    os.environ['METRICS_DIR'] = os.path.join(workdir, 'metrics')
+    os.environ['SESSION_DB'] = os.path.join(workdir, 'sessions.db')
+    os.chdir(ROOT)
+    sys.path.insert(0, ROOT)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from app import app, db, create_backup, database_file
+    from synthetic_data import generate_center
+
+    try:
+        app.instance_path = workdir
+        with app.app_context():
+            db.create_all()
+            generate_center(args.circles, args.students_per_circle, years=args.years)
+            path = database_file()
+            stop = threading.Event()
+            waits = []
+
+            def writer():
+                connection = sqlite3.connect(path, timeout=30)
+                while not stop.is_set():
+                    started = time.perf_counter()
+                    connection.execute("UPDATE settings SET site_name = ?", (str(started),))
+                    connection.commit()
+                    waits.append((time.perf_counter() - started) * 1000)
+                connection.close()
+
+            thread = threading.Thread(target=writer)
+            thread.start()
+            result = create_backup(pages=args.pages)
+            stop.set()
+            thread.join()
+
+        print(f"الصفحات: {result['pages']}")
+        print(f"الحجم: {result['size'] / 1048576:.1f} MB -> {result['stored_size'] / 1048576:.1f} MB مضغوطاً")
+        print(f"زمن النسخ: {result['copy_seconds']:.3f}s، الإجمالي مع الفحص والضغط: {result['total_seconds']:.3f}s")
+        print(f"كتابات أثناء النسخ: {len(waits)}، أطول انتظار: {max(waits, default=0):.1f} ms")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,88 @@
+"""قياس زمن بدء العملية وأول طلب مع ذاكرة القوالب المترجمة وبدونها.
+
+يشغّل كل قياس في عملية Python جديدة (كما يحدث بعد النشر أو إضافة عامل جديد)، ويقيس زمن استيراد
+التطبيق ثم زمن أول طلب لعدة صفحات، مرة بذاكرة قوالب فارغة ومرة بعد `flask precompile-templates`:
+
+    python benchmarks/bench_cold_start.py --runs 5
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = r'''
+import json, sys, time
+started = time.perf_counter()
+from app import app
+import_ms = (time.perf_counter() - started) * 1000
+client = app.test_client()
+client.post('/login', data={'username': sys.argv[1], 'password': sys.argv[2]})
+results = {'import': import_ms}
+for name, url in json.loads(sys.argv[3]):
+    started = time.perf_counter()
+    response = client.get(url)
+    if response.status_code != 200:
+        raise SystemExit(f'GET {url} returned {response.status_code}')
+    results[name] = (time.perf_counter() - started) * 1000
+print(json.dumps(results))
+'''
+
+
+def run_child(env, center):
+    routes = [('login', '/login'), ('dashboard', '/dashboard'), ('settings', '/settings'), ('students', '/students')]
+    output = subprocess.run([sys.executable, '-c', CHILD, center['admin_username'], center['password'], json.dumps(routes)],
+                            cwd=ROOT, env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='قياس زمن البدء البارد مع ذاكرة القوالب وبدونها')
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='quran-bench-')
+    env = dict(os.environ, DATABASE_URL='sqlite:///' + os.path.join(workdir, 'bench.db'),
+               METRICS_DIR=os.path.join(workdir, 'metrics'), SESSION_DB=os.path.join(workdir, 'sessions.db'))
+    os.environ.update(env)
+    os.chdir(ROOT)
+    sys.path.insert(0, ROOT)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from app import app, db
+    from synthetic_data import generate_center
+
+    try:
+        with app.app_context():
+            db.create_all()
+            center = generate_center(2, 10)
+
+        samples = {'cold': [], 'warm': []}
+        warm_dir = os.path.join(workdir, 'jinja_warm')
+        subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', 'precompile-templates'], cwd=ROOT,
+                       env=dict(env, TEMPLATE_CACHE_DIR=warm_dir), check=True, capture_output=True)
+        for i in range(args.runs):
+            cold_dir = os.path.join(workdir, f'jinja_cold_{i}')
+            samples['cold'].append(run_child(dict(env, TEMPLATE_CACHE_DIR=cold_dir), center))
+            samples['warm'].append(run_child(dict(env, TEMPLATE_CACHE_DIR=warm_dir), center))
+
+        names = list(samples['cold'][0])
+        print(f'{"القياس (ms, الوسيط)":<22}{"cold":>10}{"warm":>10}')
+        for name in names:
+            cold = statistics.median(s[name] for s in samples['cold'])
+            warm = statistics.median(s[name] for s in samples['warm'])
+            print(f'{name:<22}{cold:>10.1f}{warm:>10.1f}')
+        cold_total = statistics.median(sum(s.values()) for s in samples['cold'])
+        warm_total = statistics.median(sum(s.values()) for s in samples['warm'])
+        print(f'{"الإجمالي":<22}{cold_total:>10.1f}{warm_total:>10.1f}')
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
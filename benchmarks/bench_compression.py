@@ -0,0 +1,90 @@
+"""قياس حجم البيانات المنقولة لكل مسار قبل الضغط وبعده.
+
+ينشئ مركزاً تجريبياً في قاعدة مؤقتة، ثم يطلب كل صفحة مرة دون ضغط ومرة بـ gzip (وbrotli إن
+كانت الحزمة مثبتة)، ومرة ثالثة مع If-None-Match للتحقق من أن المحتوى غير المتغير يعود 304 دون جسم:
+
+    python benchmarks/bench_compression.py
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ROUTES = [
+    # (الاسم، الدور، الرابط)
+    ('dashboard', 'admin', '/dashboard'),
+    ('guest_dashboard', 'guest', '/guest_dashboard'),
+    ('settings', 'admin', '/settings'),
+    ('reports', 'admin', '/reports'),
+    ('students', 'admin', '/students'),
+    ('leaderboard', 'admin', '/leaderboard'),
+    ('parent_dashboard', 'parent', '/parent_dashboard'),
+    ('parent_student_details', 'parent', '/parent_student_details/{parent_student_id}'),
+    ('api_reports', 'parent', '/api/v1/students/{parent_student_id}/reports?limit=100'),
+]
+
+
+def login(client, username, password):
+    response = client.post('/login', data={'username': username, 'password': password})
+    if response.status_code != 302:
+        raise RuntimeError(f'فشل تسجيل الدخول للمستخدم {username}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='قياس أثر ضغط الاستجابات على حجم البيانات المنقولة')
+    parser.add_argument('--circles', type=int, default=8)
+    parser.add_argument('--students-per-circle', type=int, default=15)
+    parser.add_argument('--seed', type=int, default=1234)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='quran-bench-')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(workdir, 'bench.db')
+    os.environ['METRICS_DIR'] = os.path.join(workdir, 'metrics')
+    os.environ['SESSION_DB'] = os.path.join(workdir, 'sessions.db')
+    os.chdir(ROOT)
+    sys.path.insert(0, ROOT)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from app import app, db, brotli
+    from synthetic_data import generate_center
+
+    encodings = ['gzip', 'br'] if brotli is not None else ['gzip']
+    try:
+        with app.app_context():
+            db.create_all()
+            center = generate_center(args.circles, args.students_per_circle, seed=args.seed)
+
+        clients = {role: app.test_client() for role in ('admin', 'parent', 'guest')}
+        login(clients['admin'], center['admin_username'], center['password'])
+        login(clients['parent'], center['parent_username'], center['password'])
+
+        header = f'{"المسار":<26}{"identity":>10}' + ''.join(f'{e:>10}{"%":>7}' for e in encodings) + f'{"304":>6}'
+        print(header)
+        total_plain, total_encoded = 0, {e: 0 for e in encodings}
+        for name, role, url in ROUTES:
+            url = url.format(**center)
+            client = clients[role]
+            plain = client.get(url, headers={'Accept-Encoding': 'identity'})
+            if plain.status_code != 200:
+                raise RuntimeError(f'GET {url} أعاد {plain.status_code}')
+            size = len(plain.data)
+            total_plain += size
+            row = f'{name:<26}{size:>10}'
+            for encoding in encodings:
+                encoded = client.get(url, headers={'Accept-Encoding': encoding})
+                total_encoded[encoding] += len(encoded.data)
+                row += f'{len(encoded.data):>10}{100 - len(encoded.data) * 100 / size:>6.0f}%'
+            revalidated = client.get(url, headers={'If-None-Match': plain.headers.get('ETag', '')})
+            row += f'{revalidated.status_code if revalidated.status_code == 304 else "-":>6}'
+            print(row)
+        print(f'{"الإجمالي":<26}{total_plain:>10}' + ''.join(
+            f'{total_encoded[e]:>10}{100 - total_encoded[e] * 100 / total_plain:>6.0f}%' for e in encodings))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,120 @@
+"""قياس تحميل الأعمدة في صفحات القوائم.
+
+ينشئ مركزاً تجريبياً كبيراً ثم يقارن تحميل الكائنات بكل أعمدتها (كما كانت الصفحات تفعل) مع
+أعمدة العرض فقط، ويطبع لكل صفحة الزمن وذروة الذاكرة وعدد الاستعلامات:
+
+    python benchmarks/bench_list_columns.py
+    python benchmarks/bench_list_columns.py --circles 30 --years 1 --repeat 5
+"""
+import argparse
+import gc
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def measure(db, load, repeat):
+    # جلسة جديدة في كل مرة حتى لا تُحسب الكائنات المحمّلة سابقاً في خريطة الهوية؛
+    # الزمن يُقاس دون tracemalloc لأنه يبطئ إنشاء الكائنات كثيراً
+    from sqlalchemy import event
+    timings = []
+    count = [0]
+    engine = db.session.get_bind()
+
+    def before(*args):
+        count[0] += 1
+
+    for _ in range(repeat):
+        db.session.remove()
+        gc.collect()
+        started = time.perf_counter()
+        load()
+        timings.append(time.perf_counter() - started)
+    db.session.remove()
+    gc.collect()
+    event.listen(engine, 'before_cursor_execute', before)
+    tracemalloc.start()
+    load()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    event.remove(engine, 'before_cursor_execute', before)
+    return min(timings) * 1000, peak / 1024, count[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='قياس تحميل الأعمدة في صفحات القوائم')
+    parser.add_argument('--circles', type=int, default=16)
+    parser.add_argument('--students-per-circle', type=int, default=25)
+    parser.add_argument('--years', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--notes-length', type=int, default=300,
+                        help='طول الملاحظات المضافة لكل تقرير (ملاحظات البيانات التجريبية قصيرة)')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='quran-bench-')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(workdir, 'bench.db')
+    os.environ['METRICS_DIR'] = os.path.join(workdir, 'metrics')
+    os.environ['SESSION_DB'] = os.path.join(workdir, 'sessions.db')
+    os.chdir(ROOT)
+    sys.path.insert(0, ROOT)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from app import app, db, func, text, Report, Student, Settings, year_query, report_list_query
+    from synthetic_data import generate_center
+
+    def full_reports():
+        reports = year_query(Report).order_by(Report.date.desc()).all()
+        return [(r.student.name, r.teacher.name, r.circle.name, r.surah) for r in reports]
+
+    def list_reports():
+        reports = report_list_query().order_by(Report.date.desc()).all()
+        return [(r.student.name, r.teacher.name, r.circle.name, r.surah) for r in reports]
+
+    def full_students():
+        # عمود "آخر تقرير" كان يحمّل كل تقارير كل طالب
+        return [s.reports[0].date if s.reports else None for s in Student.query.filter_by(is_active=True)]
+
+    def list_students():
+        students = Student.query.filter_by(is_active=True).all()
+        dates = dict(db.session.query(Report.student_id, func.max(Report.date)).filter(
+            Report.student_id.in_([s.id for s in students])).group_by(Report.student_id).all())
+        return [dates.get(s.id) for s in students]
+
+    def full_settings():
+        # قبل التأجيل كانت النصوص الطويلة تُقرأ مع كل طلب
+        return Settings.query.options(db.undefer_group('settings_text')).first().site_name
+
+    def list_settings():
+        return Settings.query.first().site_name
+
+    cases = [
+        ('/reports', full_reports, list_reports),
+        ('/students', full_students, list_students),
+        ('settings', full_settings, list_settings),
+    ]
+
+    try:
+        app.instance_path = workdir
+        with app.test_request_context():
+            db.create_all()
+            generate_center(args.circles, args.students_per_circle, years=args.years)
+            db.session.execute(text('UPDATE report SET notes = notes || :padding'),
+                               {'padding': ' ' + 'م' * args.notes_length})
+            db.session.add(Settings())
+            db.session.commit()
+            print(f'{"الصفحة":<12}{"كل الأعمدة (ms / KiB / q)":>30}{"أعمدة العرض (ms / KiB / q)":>30}')
+            for name, full, listed in cases:
+                before = measure(db, full, args.repeat)
+                after = measure(db, listed, args.repeat)
+                print(f'{name:<12}{before[0]:>12.1f} /{before[1]:>9.0f} /{before[2]:>5}'
+                      f'{after[0]:>12.1f} /{after[1]:>9.0f} /{after[2]:>5}')
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
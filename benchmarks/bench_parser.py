@@ -0,0 +1,169 @@
+"""قياس أداء محلّل التقرير الجماعي improved_parse_collective_report.
+
+يشغّل المحلّل على نصوص واتساب حقيقية مجهّلة في parser_corpus/ وعلى مدخلات كبيرة مولّدة،
+ويطبع بأسلوب pytest-benchmark (عدد الجولات، أدنى/متوسط زمن، الانحراف، الأسطر في الثانية)
+مع ذروة الذاكرة وعدد كتل الذاكرة المخصّصة لكل تحليل عبر tracemalloc.
+ثم يقارن المخرجات بـ parser_corpus/golden.json حتى يثبت أن أي تحسين لم يغيّر النتائج:
+
+    python benchmarks/bench_parser.py                  # قياس والتحقق من المخرجات
+    python benchmarks/bench_parser.py --update-golden  # بعد تغيير مقصود في سلوك المحلّل
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'parser_corpus')
+GOLDEN_PATH = os.path.join(CORPUS_DIR, 'golden.json')
+REPORT_DATE = '2025-10-19'
+
+RECITATION_TEMPLATES = [
+    '{surah} {start}-{end} ممتاز', '{surah} {start}-{end} جيد جدا', '{surah} {start} - {end} جيد',
+    '{surah} {start}ـ{end} مقبول', '{surah} {start}-{end}+ ممتاز', 'مراجعة {surah} {start}-{end} جيد',
+    '✖️ غائب بعذر', '❌', 'هروب 🏃', 'لم يسمع', 'مستأذن', 'غائب بلا عذر ❌',
+]
+PREFIXES = ['{n}. ', '🔹 ', '• ', '- ', '*{n}* ', '# ', '']
+SURAHS = ['البقرة', 'آل عمران', 'النساء', 'الكهف', 'يس', 'الملك', 'النبأ', 'عبس', 'الجن']
+
+
+def read_corpus(name):
+    with open(os.path.join(CORPUS_DIR, name), encoding='utf-8') as f:
+        return f.read()
+
+
+def generate_input(roster, line_count, seed):
+    rng = random.Random(seed)
+    lines = ['تقرير الحلقة اليومي', '']
+    for n in range(1, line_count + 1):
+        name = rng.choice(roster)
+        if rng.random() < 0.1:
+            # أسماء مختصرة أو غير مسجلة كما تحدث في الرسائل الحقيقية
+            name = ' '.join(name.split()[::2]) if rng.random() < 0.5 else f'طالب جديد {n}'
+        start = rng.randint(1, 200)
+        recitation = rng.choice(RECITATION_TEMPLATES).format(surah=rng.choice(SURAHS), start=start, end=start + rng.randint(1, 15))
+        lines.append(rng.choice(PREFIXES).format(n=n) + f'{name}: {recitation}')
+    return '\n'.join(lines)
+
+
+def normalize(reports, attendances, names_by_id):
+    return {
+        'reports': [dict(r, student_id=names_by_id[r['student_id']]) for r in reports],
+        'attendances': [[names_by_id[a.student_id], a.status] for a in attendances],
+    }
+
+
+def digest(result):
+    return hashlib.sha256(json.dumps(result, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def run_case(parse, text, rounds, warmup):
+    for _ in range(warmup):
+        parse(text)
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        result = parse(text)
+        timings.append(time.perf_counter() - started)
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    before = tracemalloc.take_snapshot()
+    parse(text)
+    after = tracemalloc.take_snapshot()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    blocks = sum(stat.count_diff for stat in after.compare_to(before, 'filename') if stat.count_diff > 0)
+    lines = sum(1 for line in text.split('\n') if line.strip())
+    return result, {
+        'lines': lines,
+        'rounds': rounds,
+        'min_ms': min(timings) * 1000,
+        'mean_ms': statistics.mean(timings) * 1000,
+        'stddev_ms': statistics.stdev(timings) * 1000 if len(timings) > 1 else 0.0,
+        'lines_per_sec': lines / min(timings),
+        'peak_kib': peak / 1024,
+        'blocks': blocks,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='قياس أداء محلّل التقرير الجماعي')
+    parser.add_argument('--rounds', type=int, default=10)
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--sizes', type=int, nargs='*', default=[1000, 10000], help='أحجام المدخلات المولّدة بالأسطر')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--update-golden', action='store_true')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='quran-parser-bench-')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(workdir, 'parser.db')
+    os.environ['METRICS_DIR'] = os.path.join(workdir, 'metrics')
+    os.environ['SESSION_DB'] = os.path.join(workdir, 'sessions.db')
+    os.chdir(ROOT)
+    sys.path.insert(0, ROOT)
+    from app import app, db, Circle, Student, improved_parse_collective_report
+
+    roster = [line.strip() for line in read_corpus('roster.txt').split('\n') if line.strip()]
+    cases = [(name[:-4], read_corpus(name)) for name in sorted(os.listdir(CORPUS_DIR))
+             if name.endswith('.txt') and name != 'roster.txt']
+    cases += [(f'generated_{size}', generate_input(roster, size, args.seed + size)) for size in args.sizes]
+
+    outputs, stats = {}, {}
+    try:
+        with app.app_context():
+            db.create_all()
+            db.session.add(Circle(id=1, name='حلقة القياس', requires_approval=False))
+            for i, name in enumerate(roster, 1):
+                db.session.add(Student(id=i, name=name, circle_id=1, pending_approval=False))
+            db.session.commit()
+            names_by_id = dict(enumerate(roster, 1))
+
+            def parse(text):
+                return improved_parse_collective_report(text, '1', REPORT_DATE)
+
+            print(f'{"Name":<28}{"Rounds":>7}{"Min(ms)":>11}{"Mean(ms)":>11}{"StdDev":>9}{"Lines/s":>11}{"Peak KiB":>10}{"Blocks":>8}')
+            for name, text in cases:
+                result, s = run_case(parse, text, args.rounds, args.warmup)
+                outputs[name] = normalize(*result, names_by_id)
+                stats[name] = s
+                print(f'{name:<28}{s["rounds"]:>7}{s["min_ms"]:>11.2f}{s["mean_ms"]:>11.2f}{s["stddev_ms"]:>9.2f}'
+                      f'{s["lines_per_sec"]:>11.0f}{s["peak_kib"]:>10.1f}{s["blocks"]:>8}')
+            db.session.rollback()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    # المخرجات الكاملة للنصوص الحقيقية، وبصمة فقط للمدخلات المولّدة الكبيرة
+    golden = {}
+    for name, output in outputs.items():
+        if name.startswith('generated_'):
+            golden[name] = {'seed': args.seed + int(name.split('_')[1]), 'sha256': digest(output),
+                            'reports': len(output['reports']), 'attendances': len(output['attendances'])}
+        else:
+            golden[name] = output
+
+    if args.update_golden:
+        with open(GOLDEN_PATH, 'w', encoding='utf-8') as f:
+            json.dump(golden, f, ensure_ascii=False, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f'تم تحديث {GOLDEN_PATH}')
+        return 0
+
+    with open(GOLDEN_PATH, encoding='utf-8') as f:
+        expected = json.load(f)
+    # المدخلات المولّدة لا تُقارن إلا إذا كانت بنفس البذرة المحفوظة
+    mismatches = [name for name in golden if name in expected and golden[name] != expected[name]
+                  and not (name.startswith('generated_') and golden[name]['seed'] != expected[name]['seed'])]
+    for name in mismatches:
+        print(f'اختلاف في مخرجات {name} عن الملف المرجعي')
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
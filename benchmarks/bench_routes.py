@@ -0,0 +1,181 @@
+"""قياس أداء المسارات الأكثر استخداماً على مركز تجريبي.
+
+ينشئ قاعدة بيانات مؤقتة بالمولّد synthetic_data، ثم يقيس كل مسار عبر Flask test client
+ويطبع زمن p50/p95 وعدد الاستعلامات لكل طلب، ويقارنها بالخط الأساسي المحفوظ في baseline.json:
+
+    python benchmarks/bench_routes.py                    # قياس ومقارنة (يفشل عند التراجع)
+    python benchmarks/bench_routes.py --update-baseline  # حفظ النتائج الحالية كخط أساسي
+
+الأزمنة تعتمد على الجهاز، لذلك يُسمح بهامش (--tolerance) وفرق أدنى بالمللي ثانية قبل اعتبار
+المسار متراجعاً، أما عدد الاستعلامات فيجب ألا يزيد إطلاقاً.
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+
+def login(client, username, password):
+    response = client.post('/login', data={'username': username, 'password': password})
+    if response.status_code != 302:
+        raise RuntimeError(f'فشل تسجيل الدخول للمستخدم {username}')
+
+
+def collective_report_text(students):
+    lines = []
+    for i, (student_id, name) in enumerate(students):
+        if i % 10 == 9:
+            lines.append(f'{i + 1}. {name}: ✖️ غائب بعذر')
+        else:
+            lines.append(f'{i + 1}. 🔹 {name}: الملك {i + 1}-{i + 5} ممتاز')
+    return '\n'.join(lines)
+
+
+def build_routes(center):
+    today = time.strftime('%Y-%m-%d')
+    attendance_form = {'date': today, 'circle_id': center['circle_id']}
+    for i, (student_id, _) in enumerate(center['circle_students']):
+        attendance_form[f'status_{student_id}'] = 'غائب بعذر' if i % 7 == 0 else 'حاضر'
+        attendance_form[f'notes_{student_id}'] = ''
+    return [
+        # (الاسم، الدور، الطريقة، الرابط، بيانات النموذج)
+        ('dashboard', 'admin', 'GET', '/dashboard', None),
+        ('teacher_dashboard', 'teacher', 'GET', '/dashboard', None),
+        ('guest_dashboard', 'guest', 'GET', '/guest_dashboard', None),
+        ('parent_dashboard', 'parent', 'GET', '/parent_dashboard', None),
+        ('parent_student_details', 'parent', 'GET', f'/parent_student_details/{center["parent_student_id"]}', None),
+        ('reports', 'admin', 'GET', '/reports', None),
+        ('collective_report', 'teacher', 'POST', '/collective_report',
+         {'circle_id': center['circle_id'], 'date': today, 'report_text': collective_report_text(center['circle_students'])}),
+        ('update_attendance', 'teacher', 'POST', '/update_attendance', attendance_form),
+    ]
+
+
+def measure(client, method, url, data, counter, repeat, warmup):
+    timings, queries = [], []
+    for i in range(warmup + repeat):
+        counter.count = 0
+        started = time.perf_counter()
+        response = client.open(url, method=method, data=data)
+        elapsed = (time.perf_counter() - started) * 1000
+        if response.status_code >= 400:
+            raise RuntimeError(f'{method} {url} أعاد {response.status_code}')
+        if i >= warmup:
+            timings.append(elapsed)
+            queries.append(counter.count)
+    timings.sort()
+    return {
+        'p50_ms': round(statistics.median(timings), 2),
+        'p95_ms': round(timings[min(len(timings) - 1, int(round(0.95 * (len(timings) - 1))))], 2),
+        'queries': max(queries),
+    }
+
+
+def compare(results, baseline, tolerance, min_delta_ms):
+    failures = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        if result['queries'] > base['queries']:
+            failures.append(f'{name}: عدد الاستعلامات {result["queries"]} > {base["queries"]}')
+        limit = base['p95_ms'] * (1 + tolerance)
+        if result['p95_ms'] > limit and result['p95_ms'] - base['p95_ms'] > min_delta_ms:
+            failures.append(f'{name}: p95 {result["p95_ms"]}ms > {limit:.2f}ms')
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description='قياس أداء مسارات التطبيق على بيانات تجريبية')
+    parser.add_argument('--circles', type=int, default=8)
+    parser.add_argument('--students-per-circle', type=int, default=15)
+    parser.add_argument('--parents', type=int, default=None)
+    parser.add_argument('--years', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--warmup', type=int, default=2)
+    parser.add_argument('--tolerance', type=float, default=0.5, help='الزيادة المسموحة في p95 كنسبة (0.5 = 50%%)')
+    parser.add_argument('--min-delta-ms', type=float, default=5.0)
+    parser.add_argument('--only', nargs='*', help='أسماء مسارات محددة للقياس')
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--update-baseline', action='store_true')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='quran-bench-')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(workdir, 'bench.db')
+    os.environ['METRICS_DIR'] = os.path.join(workdir, 'metrics')
+    os.environ['SESSION_DB'] = os.path.join(workdir, 'sessions.db')
+    os.chdir(ROOT)
+    sys.path.insert(0, ROOT)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+    from app import app, db
+    from synthetic_data import generate_center
+
+    config = {'circles': args.circles, 'students_per_circle': args.students_per_circle,
+              'parents': args.parents, 'years': args.years, 'seed': args.seed}
+    try:
+        with app.app_context():
+            db.create_all()
+            started = time.perf_counter()
+            center = generate_center(args.circles, args.students_per_circle, args.parents, args.years, args.seed)
+            print(f'تم توليد البيانات في {time.perf_counter() - started:.1f}s: {center["counts"]}')
+
+        counter = QueryCounter()
+        event.listen(Engine, 'before_cursor_execute', counter)
+        clients = {role: app.test_client() for role in ('admin', 'teacher', 'parent', 'guest')}
+        login(clients['admin'], center['admin_username'], center['password'])
+        login(clients['teacher'], center['teacher_username'], center['password'])
+        login(clients['parent'], center['parent_username'], center['password'])
+
+        results = {}
+        print(f'{"المسار":<26}{"p50 ms":>10}{"p95 ms":>10}{"queries":>10}')
+        for name, role, method, url, data in build_routes(center):
+            if args.only and name not in args.only:
+                continue
+            results[name] = measure(clients[role], method, url, data, counter, args.repeat, args.warmup)
+            r = results[name]
+            print(f'{name:<26}{r["p50_ms"]:>10}{r["p95_ms"]:>10}{r["queries"]:>10}')
+        event.remove(Engine, 'before_cursor_execute', counter)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.update_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump({'config': config, 'routes': results}, f, ensure_ascii=False, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f'تم حفظ الخط الأساسي في {args.baseline}')
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print('لا يوجد خط أساسي للمقارنة، استخدم --update-baseline')
+        return 0
+    with open(args.baseline, encoding='utf-8') as f:
+        baseline = json.load(f)
+    if baseline.get('config') != config:
+        print('إعدادات التوليد تختلف عن الخط الأساسي، تم تخطي المقارنة')
+        return 0
+    failures = compare(results, baseline['routes'], args.tolerance, args.min_delta_ms)
+    for failure in failures:
+        print(f'تراجع: {failure}')
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
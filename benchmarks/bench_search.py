@@ -0,0 +1,73 @@
+"""قياس زمن البحث الفوري (typeahead) على فهرس FTS5 كبير.
+
+ينشئ مركزاً تجريبياً كبيراً (أكثر من 100 ألف سجل مفهرس افتراضياً)، ويقيس زمن بناء الفهرس،
+ثم زمن /search/suggest لمجموعة من البادئات كما يكتبها المستخدم حرفاً بعد حرف:
+
+    python benchmarks/bench_search.py
+    python benchmarks/bench_search.py --circles 30 --years 3
+"""
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+QUERIES = ['مح', 'محم', 'محمد', 'الحم', 'حميري', 'محمد الح', 'المل', 'البقره', '77', '7712', 'جيد']
+
+
+def main():
+    parser = argparse.ArgumentParser(description='قياس زمن البحث الفوري على فهرس FTS5')
+    parser.add_argument('--circles', type=int, default=16)
+    parser.add_argument('--students-per-circle', type=int, default=25)
+    parser.add_argument('--years', type=int, default=2)
+    parser.add_argument('--repeat', type=int, default=30)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='quran-bench-')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(workdir, 'bench.db')
+    os.environ['METRICS_DIR'] = os.path.join(workdir, 'metrics')
+    os.environ['SESSION_DB'] = os.path.join(workdir, 'sessions.db')
+    os.chdir(ROOT)
+    sys.path.insert(0, ROOT)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from sqlalchemy import text
+    from app import app, db, rebuild_search_index
+    from synthetic_data import generate_center
+
+    try:
+        with app.app_context():
+            db.create_all()
+            center = generate_center(args.circles, args.students_per_circle, years=args.years)
+            started = time.perf_counter()
+            total = rebuild_search_index()
+            db.session.commit()
+            print(f'فهرسة {total} سجل في {time.perf_counter() - started:.2f}s')
+
+        client = app.test_client()
+        client.post('/login', data={'username': center['admin_username'], 'password': center['password']})
+        print(f'{"البحث":<14}{"results":>9}{"p50 ms":>10}{"p95 ms":>10}')
+        all_timings = []
+        for query in QUERIES:
+            timings = []
+            for _ in range(args.repeat):
+                started = time.perf_counter()
+                response = client.get('/search/suggest', query_string={'q': query})
+                timings.append((time.perf_counter() - started) * 1000)
+            timings.sort()
+            all_timings.extend(timings)
+            p95 = timings[min(len(timings) - 1, int(round(0.95 * (len(timings) - 1))))]
+            print(f'{query:<14}{len(response.get_json()["results"]):>9}{statistics.median(timings):>10.2f}{p95:>10.2f}')
+        all_timings.sort()
+        print(f'{"الإجمالي":<14}{"":>9}{statistics.median(all_timings):>10.2f}'
+              f'{all_timings[int(round(0.95 * (len(all_timings) - 1)))]:>10.2f}')
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,168 @@
+"""مولّد بيانات تجريبية لمركز كامل باستخدام نماذج التطبيق الحقيقية.
+
+يُستخدم من مجموعة قياس الأداء، ويمكن تشغيله مباشرة لإنشاء قاعدة بيانات تجريبية:
+
+    python benchmarks/synthetic_data.py --db /tmp/center.db --circles 20 --students-per-circle 25 --years 3
+
+يجب ضبط DATABASE_URL قبل استيراد app، لذلك تُستورد النماذج داخل الدوال.
+"""
+import argparse
+import os
+import random
+import sys
+from datetime import date, timedelta
+
+FIRST_NAMES = ['محمد', 'أحمد', 'عبدالله', 'عمر', 'علي', 'خالد', 'يوسف', 'إبراهيم', 'حمزة', 'سعيد',
+               'عبدالرحمن', 'مصطفى', 'أنس', 'زيد', 'معاذ', 'بلال', 'صالح', 'ياسر', 'حسن', 'فهد']
+FAMILY_NAMES = ['الحميري', 'العبيدي', 'المرادي', 'الشريف', 'الجرادي', 'القاضي', 'الصبري', 'النهمي',
+                'العنسي', 'الحاشدي', 'البكيلي', 'السقاف', 'المقطري', 'الأهدل', 'الزبيدي']
+SURAHS = [('الفاتحة', 7), ('البقرة', 286), ('آل عمران', 200), ('النساء', 176), ('المائدة', 120),
+          ('الأنعام', 165), ('الأعراف', 206), ('الأنفال', 75), ('التوبة', 129), ('يونس', 109),
+          ('الملك', 30), ('القلم', 52), ('الحاقة', 52), ('المعارج', 44), ('نوح', 28), ('الجن', 28),
+          ('النبأ', 40), ('النازعات', 46), ('عبس', 42), ('التكوير', 29)]
+GRADES = ['ممتاز', 'جيد جدا', 'جيد', 'مقبول']
+STATUSES = ['حاضر', 'غائب بعذر', 'غائب بلا عذر', 'هروب', 'لم يسمع']
+STATUS_WEIGHTS = [85, 6, 5, 2, 2]
+PASSWORD = 'bench123'
+NOTES = ['', '', '', 'أداء متميز اليوم', 'يحتاج إلى مراجعة التجويد', 'تأخر في الحضور', 'تحسن ملحوظ في الحفظ']
+
+
+def academic_year_of(day):
+    # السنة الدراسية تبدأ في سبتمبر
+    return str(day.year if day.month >= 9 else day.year - 1)
+
+
+def working_days(start, end):
+    day = start
+    while day <= end:
+        if day.weekday() != 4:  # الجمعة
+            yield day
+        day += timedelta(days=1)
+
+
+def generate_center(circles=8, students_per_circle=15, parents=None, years=1, seed=1234, end_date=None):
+    """ينشئ مركزاً تجريبياً في قاعدة البيانات الحالية ويعيد ملخصاً بالمعرفات المفيدة للقياس.
+
+    يفترض أن الجداول موجودة وفارغة (db.create_all على قاعدة جديدة).
+    """
+    from werkzeug.security import generate_password_hash
+    from app import db, User, Parent, Circle, Student, Report, Attendance, Settings, rebuild_memorization, rebuild_scores, rebuild_circle_stats, rebuild_search_index
+
+    rng = random.Random(seed)
+    end_date = end_date or date.today()
+    start_date = end_date - timedelta(days=365 * years)
+    total_students = circles * students_per_circle
+    parents = parents or max(1, total_students // 2)
+    # تجزئة كلمة المرور مكلفة، فنحسبها مرة واحدة لكل الحسابات
+    password_hash = generate_password_hash(PASSWORD)
+
+    db.session.add(Settings())
+    users = [{'id': 1, 'username': 'admin', 'password': password_hash, 'role': 'admin', 'name': 'المسؤول', 'is_active': True}]
+    teacher_ids = []
+    for i in range(circles):
+        user_id = len(users) + 1
+        teacher_ids.append(user_id)
+        users.append({'id': user_id, 'username': f'teacher{i + 1}', 'password': password_hash, 'role': 'teacher',
+                      'name': f'الأستاذ {rng.choice(FIRST_NAMES)} {FAMILY_NAMES[i % len(FAMILY_NAMES)]}', 'is_active': True})
+
+    parent_rows = []
+    for i in range(parents):
+        user_id = len(users) + 1
+        name = f'{FIRST_NAMES[i % len(FIRST_NAMES)]} {FAMILY_NAMES[(i // len(FIRST_NAMES)) % len(FAMILY_NAMES)]} {i + 1}'
+        users.append({'id': user_id, 'username': f'parent{i + 1}', 'password': password_hash, 'role': 'parent',
+                      'name': name, 'is_active': True})
+        parent_rows.append({'id': i + 1, 'name': name, 'phone': f'77{i:07d}', 'is_active': True, 'user_id': user_id})
+
+    circle_rows = [{'id': i + 1, 'name': f'حلقة {FAMILY_NAMES[i % len(FAMILY_NAMES)]} {i + 1}', 'teacher_id': teacher_ids[i],
+                    'is_active': True, 'academic_year': academic_year_of(end_date), 'requires_approval': False}
+                   for i in range(circles)]
+
+    student_rows = []
+    for i in range(total_students):
+        parent = parent_rows[i % parents]
+        first = FIRST_NAMES[rng.randrange(len(FIRST_NAMES))]
+        student_rows.append({'id': i + 1, 'name': f'{first} {parent["name"]}', 'age': rng.randint(7, 18),
+                             'parent_phone': parent['phone'], 'parent_id': parent['id'], 'circle_id': i // students_per_circle + 1,
+                             'is_active': True, 'academic_year': academic_year_of(end_date), 'pending_approval': False})
+
+    db.session.execute(User.__table__.insert(), users)
+    db.session.execute(Parent.__table__.insert(), parent_rows)
+    db.session.execute(Circle.__table__.insert(), circle_rows)
+    db.session.execute(Student.__table__.insert(), student_rows)
+
+    report_count = attendance_count = 0
+    progress = {s['id']: [rng.randrange(len(SURAHS)), 1] for s in student_rows}
+    report_batch, attendance_batch = [], []
+    for day in working_days(start_date, end_date):
+        year = academic_year_of(day)
+        for s in student_rows:
+            status = rng.choices(STATUSES, STATUS_WEIGHTS)[0]
+            attendance_batch.append({'student_id': s['id'], 'date': day, 'status': status, 'notes': '', 'academic_year': year})
+            if status == 'حاضر' and rng.random() < 0.7:
+                surah_index, verse = progress[s['id']]
+                surah, verse_count = SURAHS[surah_index]
+                to_verse = min(verse_count, verse + rng.randint(2, 10))
+                report_batch.append({'student_id': s['id'], 'teacher_id': teacher_ids[s['circle_id'] - 1],
+                                     'circle_id': s['circle_id'], 'date': day, 'surah': surah, 'from_verse': verse,
+                                     'to_verse': to_verse, 'grade': rng.choice(GRADES),
+                                     'type': 'مراجعة' if rng.random() < 0.2 else 'حفظ',
+                                     'notes': rng.choice(NOTES), 'academic_year': year})
+                progress[s['id']] = [(surah_index + 1) % len(SURAHS), 1] if to_verse >= verse_count else [surah_index, to_verse + 1]
+        if len(attendance_batch) >= 5000:
+            db.session.execute(Attendance.__table__.insert(), attendance_batch)
+            attendance_count += len(attendance_batch)
+            attendance_batch = []
+        if len(report_batch) >= 5000:
+            db.session.execute(Report.__table__.insert(), report_batch)
+            report_count += len(report_batch)
+            report_batch = []
+    if attendance_batch:
+        db.session.execute(Attendance.__table__.insert(), attendance_batch)
+        attendance_count += len(attendance_batch)
+    if report_batch:
+        db.session.execute(Report.__table__.insert(), report_batch)
+        report_count += len(report_batch)
+    # الجداول الملخصة تُبنى كما يفعل التطبيق عند أول تشغيل
+    rebuild_memorization()
+    rebuild_scores()
+    rebuild_circle_stats()
+    rebuild_search_index()
+    db.session.commit()
+
+    return {
+        'admin_username': 'admin',
+        'teacher_username': 'teacher1',
+        'parent_username': 'parent1',
+        'password': PASSWORD,
+        'parent_student_id': student_rows[0]['id'],
+        'circle_id': 1,
+        'circle_students': [(s['id'], s['name']) for s in student_rows if s['circle_id'] == 1],
+        'counts': {'circles': circles, 'students': total_students, 'parents': parents,
+                   'reports': report_count, 'attendance': attendance_count},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='إنشاء قاعدة بيانات تجريبية لمركز تحفيظ')
+    parser.add_argument('--db', required=True, help='مسار ملف SQLite الجديد')
+    parser.add_argument('--circles', type=int, default=8)
+    parser.add_argument('--students-per-circle', type=int, default=15)
+    parser.add_argument('--parents', type=int, default=None)
+    parser.add_argument('--years', type=int, default=1)
+    parser.add_argument('--seed', type=int, default=1234)
+    args = parser.parse_args()
+
+    if os.path.exists(args.db):
+        parser.error(f'الملف موجود مسبقاً: {args.db}')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.abspath(args.db)
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from app import app, db
+
+    with app.app_context():
+        db.create_all()
+        center = generate_center(args.circles, args.students_per_circle, args.parents, args.years, args.seed)
+    print(center['counts'])
+
+
+if __name__ == '__main__':
+    main()
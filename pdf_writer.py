@@ -0,0 +1,244 @@
+"""كاتب PDF صغير لبطاقات التقرير دون مكتبات خارجية.
+
+خط TrueType مضمّن بعد حذف الرسوم غير المستخدمة، وتشكيل الحروف العربية بأشكال العرض
+(Presentation Forms-B)، وترتيب الأسطر من اليمين لليسار. لا يعتمد على التطبيق أو قاعدة البيانات
+حتى يعمل داخل عمليات مجموعة الرسم.
+"""
+import re
+import struct
+import zlib
+
+# الحرف: (منفصل، نهائي، بداية، وسط)؛ الحروف التي لا تتصل بما بعدها لها شكلان فقط
+ARABIC_FORMS = {'ء': (0xFE80,), 'آ': (0xFE81, 0xFE82), 'أ': (0xFE83, 0xFE84), 'ؤ': (0xFE85, 0xFE86),
+                'إ': (0xFE87, 0xFE88), 'ا': (0xFE8D, 0xFE8E), 'ة': (0xFE93, 0xFE94), 'د': (0xFEA9, 0xFEAA),
+                'ذ': (0xFEAB, 0xFEAC), 'ر': (0xFEAD, 0xFEAE), 'ز': (0xFEAF, 0xFEB0), 'و': (0xFEED, 0xFEEE),
+                'ى': (0xFEEF, 0xFEF0)}
+ARABIC_FORMS.update({letter: tuple(range(first, first + 4)) for letter, first in zip(
+    'ئبتثجحخسشصضطظعغفقكلمنهي',
+    (0xFE89, 0xFE8F, 0xFE95, 0xFE99, 0xFE9D, 0xFEA1, 0xFEA5, 0xFEB1, 0xFEB5, 0xFEB9, 0xFEBD, 0xFEC1, 0xFEC5,
+     0xFEC9, 0xFECD, 0xFED1, 0xFED5, 0xFED9, 0xFEDD, 0xFEE1, 0xFEE5, 0xFEE9, 0xFEF1))})
+LAM_ALEF = {'آ': 0xFEF5, 'أ': 0xFEF7, 'إ': 0xFEF9, 'ا': 0xFEFB}
+PDF_STRIP_MARKS = re.compile('[\u064B-\u0652\u0670]')
+LTR_RUN = re.compile(r'[0-9A-Za-z][0-9A-Za-z.:/%\-]*')
+MIRRORED = str.maketrans('()[]', ')(][')
+
+def shape_arabic(text):
+    """استبدال الحروف العربية بأشكالها المتصلة حسب موضعها في الكلمة، مع دمج لام ألف"""
+    text = PDF_STRIP_MARKS.sub('', text)
+    joins_next = lambda ch: ch == 'ـ' or len(ARABIC_FORMS.get(ch, ())) == 4
+    joins_prev = lambda ch: ch == 'ـ' or len(ARABIC_FORMS.get(ch, ())) >= 2
+    shaped, i = [], 0
+    while i < len(text):
+        ch = text[i]
+        forms = ARABIC_FORMS.get(ch)
+        if not forms:
+            shaped.append(ch)
+            i += 1
+            continue
+        after_joining = i > 0 and joins_next(text[i - 1])
+        if ch == 'ل' and i + 1 < len(text) and text[i + 1] in LAM_ALEF:
+            shaped.append(chr(LAM_ALEF[text[i + 1]] + after_joining))
+            i += 2
+            continue
+        before_joining = len(forms) == 4 and i + 1 < len(text) and joins_prev(text[i + 1])
+        shaped.append(chr(forms[(3 if before_joining else 1) if after_joining else (2 if before_joining else 0)]))
+        i += 1
+    return ''.join(shaped)
+
+def visual_order(text):
+    """ترتيب سطر عربي للعرض من اليسار: عكس الأجزاء العربية مع إبقاء الأرقام والنص اللاتيني كما هي"""
+    runs, position = [], 0
+    for match in LTR_RUN.finditer(text):
+        if match.start() > position:
+            runs.append(text[position:match.start()][::-1].translate(MIRRORED))
+        runs.append(match.group())
+        position = match.end()
+    if position < len(text):
+        runs.append(text[position:][::-1].translate(MIRRORED))
+    return ''.join(reversed(runs))
+
+def sfnt_checksum(data):
+    data += b'\0' * (-len(data) % 4)
+    return sum(struct.unpack(f'>{len(data) // 4}I', data)) & 0xFFFFFFFF
+
+class TrueTypeFont:
+    """ما يلزم من ملف TrueType: خريطة الحروف إلى الرسوم وعروضها، ونسخة مصغّرة للتضمين"""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            data = f.read()
+        self.tables = {}
+        for i in range(struct.unpack('>H', data[4:6])[0]):
+            tag, checksum, offset, length = struct.unpack('>4sIII', data[12 + 16 * i:28 + 16 * i])
+            self.tables[tag.decode('latin-1')] = data[offset:offset + length]
+        head, hhea = self.tables['head'], self.tables['hhea']
+        self.units_per_em = struct.unpack('>H', head[18:20])[0]
+        self.bbox = struct.unpack('>hhhh', head[36:44])
+        self.ascent, self.descent = struct.unpack('>hh', hhea[4:8])
+        glyph_count = struct.unpack('>H', self.tables['maxp'][4:6])[0]
+        metric_count = struct.unpack('>H', hhea[34:36])[0]
+        advances = list(struct.unpack(f'>{metric_count * 2}H', self.tables['hmtx'][:metric_count * 4])[::2])
+        self.advances = advances + advances[-1:] * (glyph_count - metric_count)
+        if struct.unpack('>h', head[50:52])[0]:
+            self.loca = struct.unpack(f'>{glyph_count + 1}I', self.tables['loca'][:4 * (glyph_count + 1)])
+        else:
+            self.loca = [offset * 2 for offset in struct.unpack(f'>{glyph_count + 1}H', self.tables['loca'][:2 * (glyph_count + 1)])]
+        self.cmap = self.read_cmap()
+
+    def read_cmap(self):
+        cmap = self.tables['cmap']
+        for i in range(struct.unpack('>H', cmap[2:4])[0]):
+            platform, encoding, offset = struct.unpack('>HHI', cmap[4 + 8 * i:12 + 8 * i])
+            if (platform, encoding) in ((3, 1), (0, 3)) and struct.unpack('>H', cmap[offset:offset + 2])[0] == 4:
+                break
+        else:
+            raise ValueError('الخط لا يحتوي خريطة حروف يونيكود (cmap 4)')
+        segments = struct.unpack('>H', cmap[offset + 6:offset + 8])[0] // 2
+        ends_at = offset + 14
+        starts_at = ends_at + 2 * segments + 2
+        deltas_at = starts_at + 2 * segments
+        ranges_at = deltas_at + 2 * segments
+        ends = struct.unpack(f'>{segments}H', cmap[ends_at:ends_at + 2 * segments])
+        starts = struct.unpack(f'>{segments}H', cmap[starts_at:starts_at + 2 * segments])
+        deltas = struct.unpack(f'>{segments}h', cmap[deltas_at:deltas_at + 2 * segments])
+        range_offsets = struct.unpack(f'>{segments}H', cmap[ranges_at:ranges_at + 2 * segments])
+        mapping = {}
+        for segment in range(segments):
+            for code in range(starts[segment], min(ends[segment], 0xFFFE) + 1):
+                if range_offsets[segment]:
+                    at = ranges_at + 2 * segment + range_offsets[segment] + 2 * (code - starts[segment])
+                    glyph = struct.unpack('>H', cmap[at:at + 2])[0]
+                    glyph = (glyph + deltas[segment]) & 0xFFFF if glyph else 0
+                else:
+                    glyph = (code + deltas[segment]) & 0xFFFF
+                if glyph:
+                    mapping[code] = glyph
+        return mapping
+
+    def glyph_closure(self, glyphs):
+        """الرسوم المطلوبة مع مكوّنات الرسوم المركبة"""
+        glyf, pending, result = self.tables['glyf'], list(glyphs), set()
+        while pending:
+            glyph = pending.pop()
+            if glyph in result:
+                continue
+            result.add(glyph)
+            start, end = self.loca[glyph], self.loca[glyph + 1]
+            if end - start < 10 or struct.unpack('>h', glyf[start:start + 2])[0] >= 0:
+                continue
+            at = start + 10
+            while True:
+                flags, component = struct.unpack('>HH', glyf[at:at + 4])
+                pending.append(component)
+                at += 8 if flags & 0x0001 else 6
+                at += 2 if flags & 0x0008 else 4 if flags & 0x0040 else 8 if flags & 0x0080 else 0
+                if not flags & 0x0020:
+                    break
+        return result
+
+    def subset(self, glyphs):
+        """نسخة من الخط تبقى فيها بيانات الرسوم المستخدمة فقط بأرقامها الأصلية"""
+        keep = self.glyph_closure(set(glyphs) | {0})
+        glyf, new_glyf, offsets = self.tables['glyf'], bytearray(), []
+        for glyph in range(len(self.loca) - 1):
+            offsets.append(len(new_glyf))
+            if glyph in keep:
+                new_glyf += glyf[self.loca[glyph]:self.loca[glyph + 1]]
+                new_glyf += b'\0' * (-len(new_glyf) % 4)
+        offsets.append(len(new_glyf))
+        head = bytearray(self.tables['head'])
+        head[8:12] = bytes(4)
+        head[50:52] = struct.pack('>h', 1)
+        tables = {'head': bytes(head), 'loca': struct.pack(f'>{len(offsets)}I', *offsets), 'glyf': bytes(new_glyf)}
+        tables.update({tag: self.tables[tag] for tag in ('hhea', 'maxp', 'hmtx', 'cvt ', 'fpgm', 'prep') if tag in self.tables})
+        tags = sorted(tables)
+        power = 1 << (len(tags).bit_length() - 1)
+        header = struct.pack('>IHHHH', 0x00010000, len(tags), power * 16, power.bit_length() - 1, (len(tags) - power) * 16)
+        offset, records, body = 12 + 16 * len(tags), b'', b''
+        for tag in tags:
+            data = tables[tag]
+            records += struct.pack('>4sIII', tag.encode('latin-1'), sfnt_checksum(data), offset + len(body), len(data))
+            body += data + b'\0' * (-len(data) % 4)
+        return header + records + body
+
+class PdfDocument:
+    """مستند PDF بصفحات A4 وخط واحد مضمّن (Type0 / Identity-H)"""
+    WIDTH, HEIGHT = 595, 842
+
+    def __init__(self, font):
+        self.font = font
+        self.pages = []
+        self.used = {}
+
+    def add_page(self):
+        self.content = []
+        self.pages.append(self.content)
+
+    def glyphs(self, text):
+        glyphs = []
+        for ch in visual_order(shape_arabic(str(text))):
+            glyph = self.font.cmap.get(ord(ch), 0)
+            self.used.setdefault(glyph, ch)
+            glyphs.append(glyph)
+        return glyphs
+
+    def text_width(self, glyphs, size):
+        return sum(self.font.advances[glyph] for glyph in glyphs) * size / self.font.units_per_em
+
+    def text(self, x, y, text, size=11, align='right', color=(0, 0, 0)):
+        glyphs = self.glyphs(text)
+        width = self.text_width(glyphs, size)
+        x -= width if align == 'right' else width / 2 if align == 'center' else 0
+        self.content.append('%.3f %.3f %.3f rg BT /F1 %s Tf %.2f %.2f Td <%s> Tj ET' % (
+            *color, size, x, y, ''.join('%04X' % glyph for glyph in glyphs)))
+
+    def rect(self, x, y, width, height, fill=None, stroke=None):
+        operator = 'B' if fill and stroke else 'f' if fill else 'S'
+        self.content.append('%s%s%.2f %.2f %.2f %.2f re %s' % (
+            '%.3f %.3f %.3f rg ' % fill if fill else '', '%.3f %.3f %.3f RG ' % stroke if stroke else '',
+            x, y, width, height, operator))
+
+    def output(self):
+        font, scale = self.font, 1000 / self.font.units_per_em
+        glyphs = sorted(self.used)
+        objects = {}
+        page_ids = [8 + 2 * i for i in range(len(self.pages))]
+        objects[1] = b'<< /Type /Catalog /Pages 2 0 R >>'
+        objects[2] = ('<< /Type /Pages /Kids [%s] /Count %d >>' % (' '.join(f'{i} 0 R' for i in page_ids), len(page_ids))).encode()
+        objects[3] = b'<< /Type /Font /Subtype /Type0 /BaseFont /QCARD+ReportFont /Encoding /Identity-H /DescendantFonts [4 0 R] /ToUnicode 7 0 R >>'
+        widths = ' '.join(f'{glyph} [{round(font.advances[glyph] * scale)}]' for glyph in glyphs)
+        objects[4] = ('<< /Type /Font /Subtype /CIDFontType2 /BaseFont /QCARD+ReportFont /CIDSystemInfo << /Registry (Adobe) '
+                      '/Ordering (Identity) /Supplement 0 >> /FontDescriptor 5 0 R /CIDToGIDMap /Identity /W [%s] >>' % widths).encode()
+        objects[5] = ('<< /Type /FontDescriptor /FontName /QCARD+ReportFont /Flags 32 /FontBBox [%s] /ItalicAngle 0 '
+                      '/Ascent %d /Descent %d /CapHeight %d /StemV 80 /FontFile2 6 0 R >>' % (
+                          ' '.join(str(round(value * scale)) for value in font.bbox),
+                          round(font.ascent * scale), round(font.descent * scale), round(font.ascent * scale))).encode()
+        font_file = font.subset(glyphs)
+        objects[6] = pdf_stream(font_file, f'/Length1 {len(font_file)}')
+        mappings = [f'<{glyph:04X}> <{"".join("%04X" % ord(c) for c in self.used[glyph])}>' for glyph in glyphs if glyph]
+        to_unicode = ['/CIDInit /ProcSet findresource begin 12 dict begin begincmap',
+                      '/CIDSystemInfo << /Registry (Adobe) /Ordering (UCS) /Supplement 0 >> def',
+                      '/CMapName /Adobe-Identity-UCS def /CMapType 2 def',
+                      '1 begincodespacerange <0000> <FFFF> endcodespacerange']
+        for i in range(0, len(mappings), 100):
+            chunk = mappings[i:i + 100]
+            to_unicode += [f'{len(chunk)} beginbfchar'] + chunk + ['endbfchar']
+        to_unicode += ['endcmap CMapName currentdict /CMap defineresource pop end end']
+        objects[7] = pdf_stream('\n'.join(to_unicode).encode())
+        for page_id, content in zip(page_ids, self.pages):
+            objects[page_id] = ('<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] /Resources << /Font << /F1 3 0 R >> >> '
+                                '/Contents %d 0 R >>' % (self.WIDTH, self.HEIGHT, page_id + 1)).encode()
+            objects[page_id + 1] = pdf_stream('\n'.join(content).encode())
+        output, offsets = bytearray(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n'), []
+        for number in range(1, max(objects) + 1):
+            offsets.append(len(output))
+            output += b'%d 0 obj\n' % number + objects[number] + b'\nendobj\n'
+        xref = len(output)
+        output += b'xref\n0 %d\n0000000000 65535 f \n' % (len(offsets) + 1)
+        output += b''.join(b'%010d 00000 n \n' % offset for offset in offsets)
+        output += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(offsets) + 1, xref)
+        return bytes(output)
+
+def pdf_stream(data, extra=''):
+    compressed = zlib.compress(data, 9)
+    return b'<< /Length %d /Filter /FlateDecode %s>>\nstream\n' % (len(compressed), extra.encode()) + compressed + b'\nendstream'